@@ -0,0 +1,10 @@
+import statistics
+from typing import List
+
+
+def percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percentile - 1]
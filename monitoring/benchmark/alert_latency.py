@@ -0,0 +1,165 @@
+import asyncio
+import math
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+import yaml
+
+from monitoring.benchmark import percentile
+from monitoring.benchmark.fake_mediawiki import FakeMediaWiki
+from monitoring.benchmark.payloads import _alert
+from monitoring.inventory import load_inventory
+from monitoring.promql import parse_duration
+from monitoring.rules import generate_bot_rules
+from monitoring.service.alert_manager import AlertManager
+from monitoring.service.prometheus import Prometheus
+
+ALERT_NAME = "BotNotEditedRecently"
+# Prometheus' default --query.lookback-delta
+LOOKBACK_DELTA = 300
+STAGES = ("threshold", "evaluation", "pending", "group_wait", "update")
+
+
+def pipeline_settings(bot: str) -> Dict[str, float]:
+    """Intervals affecting the status page update, taken from the generated configs."""
+    inventory = load_inventory()
+    bot_config = inventory.bots[bot]
+
+    prometheus = yaml.safe_load(Prometheus().generate_configuration())["global"]
+    rule = next(
+        rule
+        for group in yaml.safe_load(generate_bot_rules())["groups"]
+        for rule in group["rules"]
+        if rule.get("alert") == ALERT_NAME
+    )
+    route = yaml.safe_load(AlertManager().generate_configuration(inventory))["route"]
+    wiki_route = next(
+        (r for r in route.get("routes", []) if r["receiver"] == "wiki-updater"), route
+    )
+
+    return {
+        "max_edit_age": bot_config.max_edit_age,
+        "scrape_interval": parse_duration(prometheus["scrape_interval"]),
+        "evaluation_interval": parse_duration(prometheus["evaluation_interval"]),
+        "for": parse_duration(rule.get("for", "0s")),
+        "group_wait": parse_duration(wiki_route.get("group_wait", route["group_wait"])),
+    }
+
+
+def simulate(settings: Dict[str, float], generator: random.Random) -> Dict[str, float]:
+    """Stage timestamps for one outage, relative to the bot's last edit.
+
+    The stand-in exporter reports the last edit time on every scrape, with
+    the scrape and rule evaluation schedules at random offsets as they are
+    for a real Prometheus. The rule compares against `time()`, so the alert
+    becomes active on the first evaluation after the threshold, provided a
+    sample within the lookback delta has been scraped.
+    """
+    scrape, evaluation = settings["scrape_interval"], settings["evaluation_interval"]
+    scrape_offset = generator.uniform(0, scrape)
+    evaluation_offset = generator.uniform(0, evaluation)
+
+    def next_tick(t: float, interval: float, offset: float) -> float:
+        return math.ceil((t - offset) / interval) * interval + offset
+
+    def last_scrape(t: float) -> float:
+        return math.floor((t - scrape_offset) / scrape) * scrape + scrape_offset
+
+    breached = settings["max_edit_age"]
+    active = next_tick(breached, evaluation, evaluation_offset)
+    while active - last_scrape(active) > LOOKBACK_DELTA:
+        active += evaluation
+    firing = next_tick(active + settings["for"], evaluation, evaluation_offset)
+    # Prometheus notifies right after the evaluation, the group is new
+    notified = firing + settings["group_wait"]
+    return {
+        "breached": breached,
+        "active": active,
+        "firing": firing,
+        "notified": notified,
+    }
+
+
+async def _measure_updates(
+    wiki: FakeMediaWiki, count: int, timeout: float
+) -> List[float]:
+    # Imported here so the updater picks up the environment set by run_benchmark
+    from monitoring.receivers import wiki_updater, wikipedia
+
+    wikipedia.set_transport(httpx.ASGITransport(app=wiki.app))
+    durations = []
+    async with wiki_updater._lifespan(wiki_updater.app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=wiki_updater.app),
+            base_url="http://wiki-updater",
+        ) as client:
+            for i in range(count):
+                host, page = "en.wikipedia.org", f"User:Bot_{i}/running"
+                started = time.monotonic()
+                r = await client.post(
+                    "/alertmanager",
+                    json={
+                        "status": "firing",
+                        "alerts": [_alert(host, page, ALERT_NAME, True)],
+                    },
+                )
+                r.raise_for_status()
+                while (host, page.replace("_", " ")) not in wiki.pages:
+                    if time.monotonic() - started > timeout:
+                        raise TimeoutError(f"{page} was not updated")
+                    await asyncio.sleep(0.01)
+                durations.append(time.monotonic() - started)
+    wikipedia.set_transport(None)
+    return durations
+
+
+def run_benchmark(
+    bot: str,
+    runs: int,
+    updates: int,
+    latency: float,
+    timeout: float,
+    seed: int = 0,
+) -> Dict:
+    """Simulate outages through the generated configs, the update stage is measured."""
+    if updates < 1:
+        raise ValueError("At least one update must be measured")
+    settings = pipeline_settings(bot)
+    with tempfile.TemporaryDirectory() as data_directory:
+        os.environ["TOOL_DATA_DIR"] = data_directory
+        os.environ.setdefault("WIKI_UPDATER_USERNAME", "benchmark")
+        os.environ.setdefault("WIKI_UPDATER_PASSWORD", "benchmark")
+        update_durations = asyncio.run(
+            _measure_updates(
+                FakeMediaWiki(latency=latency, seed=seed), updates, timeout
+            )
+        )
+
+    generator = random.Random(seed)
+    stages: Dict[str, List[float]] = {
+        stage: [] for stage in STAGES + ("after_threshold", "total")
+    }
+    for i in range(runs):
+        timeline = simulate(settings, generator)
+        durations = {
+            "threshold": timeline["breached"],
+            "evaluation": timeline["active"] - timeline["breached"],
+            "pending": timeline["firing"] - timeline["active"],
+            "group_wait": timeline["notified"] - timeline["firing"],
+            "update": update_durations[i % len(update_durations)],
+        }
+        for stage, duration in durations.items():
+            stages[stage].append(duration)
+        stages["total"].append(sum(durations.values()))
+        # Time from the alert condition being met to the page saying so
+        stages["after_threshold"].append(stages["total"][-1] - durations["threshold"])
+
+    report: Dict = {f"config_{key}_seconds": value for key, value in settings.items()}
+    for stage, durations in stages.items():
+        report[f"{stage}_p50_seconds"] = percentile(durations, 50)
+        report[f"{stage}_p99_seconds"] = percentile(durations, 99)
+    return report
@@ -0,0 +1,160 @@
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+
+class FakeMediaWiki:
+    """In-process stand-in for api.php and index.php.
+
+    Implements just enough of the API for the wiki updater (login, tokens,
+    revision queries, raw fetches and edits) with configurable latency,
+    error rate, replication lag and rate limiting.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        error_rate: float = 0,
+        rate_limit: float = 0,
+        lag: float = 0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.lag = lag
+        self.calls: Counter = Counter()
+        self.pages: Dict[Tuple[str, str], Tuple[str, int]] = {}
+        self._sessions = set()
+        self._random = random.Random(seed)
+        self._window_started = time.monotonic()
+        self._window_requests = 0
+        self._next_revision_id = 1
+        self.app = self._create_app()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def _normalise(self, title: str) -> str:
+        return title.replace("_", " ")
+
+    def _rate_limited(self) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        if now - self._window_started >= 1:
+            self._window_started, self._window_requests = now, 0
+        self._window_requests += 1
+        return self._window_requests > self.rate_limit
+
+    def _logged_in(self, request: Request) -> bool:
+        return request.cookies.get("fakewiki_session") in self._sessions
+
+    async def _preamble(self, request: Request, params: Dict) -> Optional[Response]:
+        self.calls[(request.method, params.get("action", "raw"))] += 1
+        await asyncio.sleep(self.latency)
+
+        if self._rate_limited():
+            return PlainTextResponse(
+                "Too many requests", status_code=429, headers={"Retry-After": "1"}
+            )
+        if self.error_rate and self._random.random() < self.error_rate:
+            return PlainTextResponse("Internal error", status_code=503)
+        if self.lag and "maxlag" in params and float(params["maxlag"]) < self.lag:
+            return JSONResponse(
+                {"error": {"code": "maxlag", "lag": self.lag}},
+                headers={"MediaWiki-API-Error": "maxlag", "Retry-After": "5"},
+            )
+        if params.get("assert") == "user" and not self._logged_in(request):
+            return JSONResponse({"error": {"code": "assertuserfailed"}})
+        return None
+
+    def _query(self, host: str, params: Dict) -> Dict:
+        query = {}
+        if params.get("meta") == "tokens":
+            token_type = params.get("type", "csrf")
+            query["tokens"] = {f"{token_type}token": f"{uuid.uuid4().hex}+\\"}
+
+        if titles := params.get("titles"):
+            query["normalized"] = []
+            query["pages"] = []
+            for title in titles.split("|"):
+                normalised = self._normalise(title)
+                if normalised != title:
+                    query["normalized"].append({"from": title, "to": normalised})
+                if (host, normalised) in self.pages:
+                    content, revision_id = self.pages[(host, normalised)]
+                    query["pages"].append(
+                        {
+                            "title": normalised,
+                            "revisions": [
+                                {
+                                    "revid": revision_id,
+                                    "slots": {"main": {"content": content}},
+                                }
+                            ],
+                        }
+                    )
+                else:
+                    query["pages"].append({"title": normalised, "missing": True})
+        return {"query": query}
+
+    def _edit(self, host: str, params: Dict) -> Dict:
+        title = self._normalise(params["title"])
+        _, current_revision_id = self.pages.get((host, title), (None, None))
+        if (
+            "baserevid" in params
+            and current_revision_id
+            and int(params["baserevid"]) != current_revision_id
+        ):
+            return {"error": {"code": "editconflict"}}
+
+        revision_id = self._next_revision_id
+        self._next_revision_id += 1
+        self.pages[(host, title)] = (params["text"], revision_id)
+        return {"edit": {"result": "Success", "title": title, "newrevid": revision_id}}
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.api_route("/w/api.php", methods=["GET", "POST"])
+        async def _api(request: Request):
+            params = dict(request.query_params)
+            if request.method == "POST":
+                params.update(await request.form())
+
+            if response := await self._preamble(request, params):
+                return response
+
+            host = request.headers["host"]
+            action = params.get("action")
+            if action == "query":
+                return self._query(host, params)
+            if action == "login":
+                session = uuid.uuid4().hex
+                self._sessions.add(session)
+                response = JSONResponse({"login": {"result": "Success"}})
+                response.set_cookie("fakewiki_session", session)
+                return response
+            if action == "edit":
+                return self._edit(host, params)
+            return {"error": {"code": "badvalue"}}
+
+        @app.get("/w/index.php")
+        async def _index(request: Request):
+            params = dict(request.query_params)
+            if response := await self._preamble(request, params):
+                return response
+
+            title = self._normalise(params.get("title", ""))
+            content, _ = self.pages.get((request.headers["host"], title), ("", 0))
+            return PlainTextResponse(content)
+
+        return app
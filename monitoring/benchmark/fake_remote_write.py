@@ -0,0 +1,52 @@
+import asyncio
+import random
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+
+from monitoring import remote_write
+
+
+class FakeRemoteWriteReceiver:
+    """In-process stand-in for Prometheus' /api/v1/write.
+
+    Decodes every request like the real receiver would (so malformed
+    batches are rejected with a 400) and counts what it accepted, with
+    configurable latency and error rate.
+    """
+
+    def __init__(self, latency: float = 0, error_rate: float = 0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.samples = 0
+        self.series = set()
+        self._random = random.Random(seed)
+        self.app = self._create_app()
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/api/v1/write")
+        async def write(request: Request) -> Response:
+            self.requests += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return PlainTextResponse("overloaded", status_code=503)
+
+            if request.headers.get("content-encoding") != remote_write.CONTENT_ENCODING:
+                return PlainTextResponse("unsupported encoding", status_code=400)
+            try:
+                timeseries = remote_write.decode_write_request(
+                    remote_write.snappy_decompress(await request.body())
+                )
+            except (remote_write.DecodeError, UnicodeDecodeError) as e:
+                return PlainTextResponse(str(e), status_code=400)
+
+            for series in timeseries:
+                self.series.add(series.labels)
+                self.samples += len(series.samples)
+            return Response(status_code=204)
+
+        return app
@@ -0,0 +1,71 @@
+import hashlib
+import random
+from typing import Dict, Iterator, List
+
+
+def _alert(host: str, page: str, alertname: str, firing: bool) -> Dict:
+    labels = {
+        "alertname": alertname,
+        "update_wiki_host": host,
+        "update_wiki_page": page,
+    }
+    fingerprint = hashlib.sha1(
+        "".join(f"{k}={v}" for k, v in sorted(labels.items())).encode("utf-8")
+    ).hexdigest()[:16]
+    return {
+        "status": "firing" if firing else "resolved",
+        "labels": labels,
+        "annotations": {"summary": f"{alertname} on {page}"} if firing else {},
+        "fingerprint": fingerprint,
+    }
+
+
+def generate_bursts(
+    hosts: int = 2,
+    pages: int = 20,
+    alerts: int = 200,
+    alerts_per_payload: int = 10,
+    resends: int = 2,
+    flap_rate: float = 0.2,
+    seed: int = 0,
+) -> Iterator[List[Dict]]:
+    """Yield rounds of alertmanager webhook payloads.
+
+    The first round carries `alerts` notifications spread over `pages` pages
+    on `hosts` hosts. Every following round re-sends the same groups (as
+    alertmanager does every group/repeat interval), with `flap_rate` of the
+    alerts changing state between rounds.
+    """
+    generator = random.Random(seed)
+    targets = [
+        (f"wiki{host}.example.org", f"User:Bot_{page}/running")
+        for host in range(hosts)
+        for page in range(pages)
+    ]
+    state = [
+        (*generator.choice(targets), f"Alert{i % 3}", generator.random() < 0.5)
+        for i in range(alerts)
+    ]
+
+    for _ in range(resends + 1):
+        payloads = []
+        for offset in range(0, len(state), alerts_per_payload):
+            group = [
+                _alert(*entry) for entry in state[offset : offset + alerts_per_payload]
+            ]
+            payloads.append(
+                {
+                    "status": (
+                        "firing"
+                        if any(alert["status"] == "firing" for alert in group)
+                        else "resolved"
+                    ),
+                    "alerts": group,
+                }
+            )
+        yield payloads
+
+        state = [
+            (host, page, name, not firing if generator.random() < flap_rate else firing)
+            for host, page, name, firing in state
+        ]
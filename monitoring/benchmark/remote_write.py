@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import random
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from monitoring import remote_write
+from monitoring.benchmark import percentile
+from monitoring.benchmark.fake_remote_write import FakeRemoteWriteReceiver
+
+
+def generate_shards(
+    series: int,
+    metrics: int,
+    label_cardinality: int,
+    churn: float,
+    rounds: int,
+    batch_size: int,
+    concurrency: int,
+    interval: float = 15,
+    seed: int = 0,
+) -> List[List[Tuple[bytes, int]]]:
+    """Pre-encode remote write batches, as (body, sample count), per shard.
+
+    Every round carries one sample for each active series, `churn` of the
+    series are replaced by new ones between rounds (as with pod restarts).
+    Like Prometheus, series are sharded by their labels so samples of one
+    series are always sent in order by the same sender.
+    """
+    generator = random.Random(seed)
+    now = int(time.time() * 1000)
+    active = list(range(series))
+    next_id = series
+
+    shards: List[List[Tuple[bytes, int]]] = [[] for _ in range(concurrency)]
+    for round_number in range(rounds):
+        timestamp = now - int((rounds - round_number) * interval * 1000)
+        pending: List[List[remote_write.TimeSeries]] = [[] for _ in range(concurrency)]
+        for series_id in active:
+            labels = (
+                ("__name__", f"benchmark_metric_{series_id % metrics}"),
+                ("job", "remote-write-benchmark"),
+                ("instance", f"instance-{series_id % label_cardinality}"),
+                ("series_id", str(series_id)),
+            )
+            shard = zlib.crc32(repr(labels).encode("utf-8")) % concurrency
+            pending[shard].append(
+                remote_write.TimeSeries(
+                    labels, [(generator.random() * 1000, timestamp)]
+                )
+            )
+
+        for shard, timeseries in enumerate(pending):
+            for i in range(0, len(timeseries), batch_size):
+                batch = timeseries[i : i + batch_size]
+                body = remote_write.snappy_compress(
+                    remote_write.encode_write_request(batch)
+                )
+                shards[shard].append((body, len(batch)))
+
+        for i in range(len(active)):
+            if generator.random() < churn:
+                active[i] = next_id
+                next_id += 1
+    return shards
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    url: str,
+    batches: List[Tuple[bytes, int]],
+    latencies: List[float],
+    results: Counter,
+) -> None:
+    for body, samples in batches:
+        sent = time.monotonic()
+        try:
+            r = await client.post(url, content=body, headers=remote_write.HEADERS)
+            status = str(r.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latencies.append(time.monotonic() - sent)
+        results[status] += 1
+        if status.startswith("2"):
+            results["accepted_samples"] += samples
+
+
+async def _run(
+    url: str,
+    transport: Optional[httpx.AsyncBaseTransport],
+    shards: List[List[Tuple[bytes, int]]],
+) -> Tuple[float, List[float], Counter]:
+    latencies: List[float] = []
+    results: Counter = Counter()
+    async with httpx.AsyncClient(
+        transport=transport,
+        timeout=30,
+        limits=httpx.Limits(max_connections=len(shards)),
+    ) as client:
+        started = time.monotonic()
+        await asyncio.gather(
+            *(_send(client, url, batches, latencies, results) for batches in shards)
+        )
+    return time.monotonic() - started, latencies, results
+
+
+def run_benchmark(
+    url: Optional[str],
+    series: int,
+    metrics: int,
+    label_cardinality: int,
+    churn: float,
+    rounds: int,
+    batch_size: int,
+    concurrency: int,
+    latency: float,
+    error_rate: float,
+    seed: int = 0,
+) -> Dict:
+    """Push generated remote write batches to `url`, or the in-process stand-in receiver."""
+    # One log line per request would dominate the run
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    started = time.monotonic()
+    shards = generate_shards(
+        series=series,
+        metrics=metrics,
+        label_cardinality=label_cardinality,
+        churn=churn,
+        rounds=rounds,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        seed=seed,
+    )
+    encode_duration = time.monotonic() - started
+
+    receiver, transport = None, None
+    if url is None:
+        receiver = FakeRemoteWriteReceiver(
+            latency=latency, error_rate=error_rate, seed=seed
+        )
+        transport = httpx.ASGITransport(app=receiver.app)
+        url = "http://remote-write/api/v1/write"
+
+    duration, latencies, results = asyncio.run(_run(url, transport, shards))
+    batches = sum(len(batches) for batches in shards)
+    samples = sum(samples for batches in shards for _, samples in batches)
+    failed = sum(
+        count
+        for status, count in results.items()
+        if status != "accepted_samples" and not status.startswith("2")
+    )
+
+    stats = {
+        "batches": batches,
+        "samples": samples,
+        "bytes_sent": sum(len(body) for batches in shards for body, _ in batches),
+        "encode_seconds": encode_duration,
+        "duration_seconds": duration,
+        "accepted_samples_per_second": (
+            results["accepted_samples"] / duration if duration else 0
+        ),
+        "latency_p50_seconds": percentile(latencies, 50),
+        "latency_p90_seconds": percentile(latencies, 90),
+        "latency_p99_seconds": percentile(latencies, 99),
+        "error_rate": failed / batches if batches else 0,
+    }
+    for status, count in sorted(results.items()):
+        if status != "accepted_samples":
+            stats[f"responses_{status}"] = count
+    if receiver:
+        stats["receiver_series"] = len(receiver.series)
+    return stats
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from monitoring.benchmark import percentile
+from monitoring.benchmark.fake_mediawiki import FakeMediaWiki
+from monitoring.benchmark.payloads import generate_bursts
+
+
+async def _run(wiki: FakeMediaWiki, rounds: List[List[Dict]], timeout: float) -> Dict:
+    # Imported here so the updater picks up the environment set by run_benchmark
+    from monitoring.receivers import wiki_updater, wikipedia
+
+    wikipedia.set_transport(httpx.ASGITransport(app=wiki.app))
+    latencies = []
+    alerts = sum(len(payload["alerts"]) for payloads in rounds for payload in payloads)
+    started = time.monotonic()
+    async with wiki_updater._lifespan(wiki_updater.app):
+        queue = wiki_updater.app.state.queue
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=wiki_updater.app),
+            base_url="http://wiki-updater",
+        ) as client:
+            for payloads in rounds:
+                for payload in payloads:
+                    sent = time.monotonic()
+                    r = await client.post("/alertmanager", json=payload)
+                    r.raise_for_status()
+                    latencies.append(time.monotonic() - sent)
+
+                # Let the workers drain the round before alertmanager re-sends it
+                while queue.stats()["depth"] and time.monotonic() - started < timeout:
+                    await asyncio.sleep(0.05)
+
+        drained = time.monotonic() - started
+        pending = queue.stats()["depth"]
+    wikipedia.set_transport(None)
+
+    return {
+        "alerts": alerts,
+        "payloads": len(latencies),
+        "duration_seconds": drained,
+        "throughput_alerts_per_second": alerts / drained if drained else 0,
+        "webhook_p50_seconds": percentile(latencies, 50),
+        "webhook_p99_seconds": percentile(latencies, 99),
+        "http_calls": wiki.total_calls,
+        "http_calls_per_alert": wiki.total_calls / alerts if alerts else 0,
+        "edits": wiki.calls[("POST", "edit")],
+        "pending_updates": pending,
+    }
+
+
+def run_benchmark(
+    hosts: int,
+    pages: int,
+    alerts: int,
+    alerts_per_payload: int,
+    resends: int,
+    flap_rate: float,
+    latency: float,
+    error_rate: float,
+    rate_limit: float,
+    lag: float,
+    timeout: float,
+    seed: int = 0,
+) -> Dict:
+    """Drive the wiki updater with generated bursts against a fake wiki, fully offline."""
+    with tempfile.TemporaryDirectory() as data_directory:
+        os.environ["TOOL_DATA_DIR"] = data_directory
+        os.environ.setdefault("WIKI_UPDATER_USERNAME", "benchmark")
+        os.environ.setdefault("WIKI_UPDATER_PASSWORD", "benchmark")
+
+        wiki = FakeMediaWiki(
+            latency=latency,
+            error_rate=error_rate,
+            rate_limit=rate_limit,
+            lag=lag,
+            seed=seed,
+        )
+        rounds = list(
+            generate_bursts(
+                hosts=hosts,
+                pages=pages,
+                alerts=alerts,
+                alerts_per_payload=alerts_per_payload,
+                resends=resends,
+                flap_rate=flap_rate,
+                seed=seed,
+            )
+        )
+        return asyncio.run(_run(wiki, rounds, timeout))
@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import PosixPath
+from typing import Dict, List, Tuple
+
+import httpx
+from fastapi import FastAPI, Response
+
+from monitoring.helpers import get_persistent_data_directory, write_file_atomically
+from monitoring.inventory import Bot, load_inventory
+from monitoring.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge
+from monitoring.rules import THRESHOLD_LABELS, THRESHOLD_METRIC, bot_thresholds
+
+logging.basicConfig(
+    level=logging.INFO,
+    stream=sys.stderr,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.environ.get("BOT_ACTIVITY_INTERVAL", "60"))
+# Replication lag (seconds) above which the API should refuse our requests
+MAX_LAG = os.environ.get("BOT_ACTIVITY_MAXLAG", "5")
+RECENT_WINDOW = 86400
+# Listings start this far before the previous poll, edits can show up late
+MARK_OVERLAP = 300
+# Users per list=usercontribs and titles per prop=revisions call (non-bot limit)
+MAX_BATCH = 50
+
+BOT_LABELS = ["username", "domain"]
+LAST_CONTRIBUTION = Gauge(
+    "cbng_monitoring_last_user_contribution_time",
+    "Unix time of the user's last contribution",
+    BOT_LABELS,
+)
+RECENT_CONTRIBUTIONS = Gauge(
+    "cbng_monitoring_recent_user_contributions_count",
+    "Contributions by the user in the last 24 hours",
+    BOT_LABELS,
+)
+ALLOW_RUN = Gauge(
+    "cbng_monitoring_bot_administrator_allow_run",
+    "Whether the bot's run page allows it to run",
+    BOT_LABELS,
+)
+THRESHOLDS = Gauge(
+    THRESHOLD_METRIC,
+    "Alerting threshold per bot and kind, from the inventory",
+    THRESHOLD_LABELS,
+    callback=lambda: app.state.activity.thresholds,
+)
+REQUESTS = Counter(
+    "bot_activity_mediawiki_requests_total",
+    "MediaWiki API calls by host and result",
+    ["host", "result"],
+)
+LAST_POLL = Gauge(
+    "bot_activity_last_poll_timestamp_seconds",
+    "When the bots on a wiki were last polled successfully",
+    ["host"],
+)
+
+
+class MediaWikiError(Exception):
+    pass
+
+
+def _parse_timestamp(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _format_timestamp(value: float) -> str:
+    return datetime.fromtimestamp(value, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _batches(values: List[str], size: int = MAX_BATCH) -> List[List[str]]:
+    return [values[offset : offset + size] for offset in range(0, len(values), size)]
+
+
+class BotActivity:
+    """Poll contributions and run pages of the inventory bots, per wiki.
+
+    Contributions are listed oldest first from each user's high-water mark
+    (shortly before the previous poll), so after the first poll only new
+    edits are fetched. The edits of the last 24 hours are kept, by revision
+    id, in a state file so a restart does not list them again.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, state_path: PosixPath):
+        self.client = client
+        self.state_path = state_path
+        self.state: Dict[str, Dict[str, Dict]] = {}
+        try:
+            self.state = json.loads(state_path.read_text())
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            # Costs one full listing, rather than not starting at all
+            logger.warning(f"Ignoring unreadable state {state_path}: {e}")
+        if not isinstance(self.state, dict):
+            logger.warning(f"Ignoring malformed state {state_path}")
+            self.state = {}
+        self.bots: Dict[str, Dict[str, Bot]] = {}
+        self.thresholds: Dict[Tuple[str, ...], float] = {}
+
+    async def _api(self, host: str, params: Dict[str, str]) -> Dict:
+        try:
+            r = await self.client.get(
+                f"https://{host}/w/api.php",
+                params={
+                    **params,
+                    "format": "json",
+                    "formatversion": "2",
+                    "maxlag": MAX_LAG,
+                },
+            )
+            r.raise_for_status()
+            response = r.json()
+        except (httpx.HTTPError, ValueError):
+            REQUESTS.inc(host=host, result="error")
+            raise
+
+        if error := response.get("error"):
+            REQUESTS.inc(host=host, result="error")
+            raise MediaWikiError(f"{host}: {error.get('code')} {error.get('info')}")
+        REQUESTS.inc(host=host, result="success")
+        return response
+
+    async def _list(self, host: str, params: Dict[str, str]) -> List[Dict]:
+        """All results of a list= query, following continuation."""
+        results = []
+        continuation: Dict[str, str] = {}
+        while True:
+            response = await self._api(host, {**params, **continuation})
+            results.extend(response.get("query", {}).get(params["list"], []))
+            if "continue" not in response:
+                return results
+            continuation = response["continue"]
+
+    async def _update_contributions(
+        self, host: str, users: List[str], now: float
+    ) -> None:
+        state = self.state.setdefault(host, {})
+        for user in users:
+            state.setdefault(
+                user, {"mark": now - RECENT_WINDOW, "last": None, "edits": {}}
+            )
+
+        for batch in _batches(users):
+            # Overlapping edits are listed again and deduplicated by id, after
+            # a long outage only the window is listed
+            start = max(min(state[user]["mark"] for user in batch), now - RECENT_WINDOW)
+            for contribution in await self._list(
+                host,
+                {
+                    "action": "query",
+                    "list": "usercontribs",
+                    "ucuser": "|".join(batch),
+                    "ucprop": "ids|timestamp",
+                    "ucdir": "newer",
+                    "ucstart": _format_timestamp(start),
+                    "uclimit": "max",
+                },
+            ):
+                if not (user_state := state.get(contribution["user"])):
+                    continue
+                timestamp = _parse_timestamp(contribution["timestamp"])
+                user_state["edits"][str(contribution["revid"])] = timestamp
+                user_state["last"] = max(user_state["last"] or 0, timestamp)
+            for user in batch:
+                state[user]["mark"] = now - MARK_OVERLAP
+
+        for user in users:
+            user_state = state[user]
+            user_state["edits"] = {
+                revid: timestamp
+                for revid, timestamp in user_state["edits"].items()
+                if timestamp > now - RECENT_WINDOW
+            }
+            if (
+                user_state["last"] is None
+                and now - user_state.get("checked", 0) > RECENT_WINDOW
+            ):
+                # Nothing in the last 24 hours, newer edits show up in the listing
+                # so an empty answer holds until the window has passed again
+                contributions = (
+                    await self._api(
+                        host,
+                        {
+                            "action": "query",
+                            "list": "usercontribs",
+                            "ucuser": user,
+                            "ucprop": "timestamp",
+                            "uclimit": "1",
+                        },
+                    )
+                )["query"]["usercontribs"]
+                user_state["checked"] = now
+                if contributions:
+                    user_state["last"] = _parse_timestamp(contributions[0]["timestamp"])
+
+    async def _fetch_run_pages(self, host: str, titles: List[str]) -> Dict[str, str]:
+        contents = {}
+        for batch in _batches(titles):
+            query = (
+                await self._api(
+                    host,
+                    {
+                        "action": "query",
+                        "prop": "revisions",
+                        "rvprop": "content",
+                        "rvslots": "main",
+                        "titles": "|".join(batch),
+                    },
+                )
+            )["query"]
+            requested_titles = {
+                normalized["to"]: normalized["from"]
+                for normalized in query.get("normalized", [])
+            }
+            for page in query.get("pages", []):
+                if revisions := page.get("revisions"):
+                    title = requested_titles.get(page["title"], page["title"])
+                    contents[title] = revisions[0]["slots"]["main"]["content"]
+        return contents
+
+    async def poll(self, host: str, bots: Dict[str, Bot]) -> None:
+        now = time.time()
+        users = sorted(bots)
+        await self._update_contributions(host, users, now)
+        run_pages = await self._fetch_run_pages(
+            host, sorted({bot.run_page for bot in bots.values() if bot.run_page})
+        )
+
+        for user, bot in bots.items():
+            user_state = self.state[host][user]
+            if user_state["last"] is not None:
+                LAST_CONTRIBUTION.set(user_state["last"], username=user, domain=host)
+            RECENT_CONTRIBUTIONS.set(
+                len(user_state["edits"]), username=user, domain=host
+            )
+            if bot.run_page and (content := run_pages.get(bot.run_page)) is not None:
+                ALLOW_RUN.set(
+                    1 if content.strip().lower().startswith("true") else 0,
+                    username=user,
+                    domain=host,
+                )
+        LAST_POLL.set(now, host=host)
+
+    def load_bots(self) -> None:
+        inventory = load_inventory()
+        bots: Dict[str, Dict[str, Bot]] = {}
+        for name, bot in inventory.bots.items():
+            bots.setdefault(bot.domain, {})[name] = bot
+
+        for host, host_bots in self.bots.items():
+            for user in host_bots:
+                if user not in bots.get(host, {}):
+                    logger.info(f"No longer tracking {user} on {host}")
+                    for gauge in (LAST_CONTRIBUTION, RECENT_CONTRIBUTIONS, ALLOW_RUN):
+                        gauge.remove(username=user, domain=host)
+                    self.state.get(host, {}).pop(user, None)
+        self.bots = bots
+        self.thresholds = bot_thresholds(inventory)
+
+    async def run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                self.load_bots()
+            except Exception as e:
+                logger.error(f"Failed to load inventory: {e}")
+
+            for host, bots in self.bots.items():
+                try:
+                    await self.poll(host, bots)
+                except (httpx.HTTPError, ValueError, KeyError, MediaWikiError) as e:
+                    # The last values keep being served, LAST_POLL shows their age
+                    logger.error(f"Failed to poll {host}: {e}")
+            write_file_atomically(self.state_path, json.dumps(self.state))
+            await asyncio.sleep(max(POLL_INTERVAL - (time.monotonic() - started), 1))
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    async with httpx.AsyncClient(
+        headers={"User-Agent": "ClueBot NG Monitoring - Bot Activity Exporter"},
+        timeout=30,
+    ) as client:
+        app.state.activity = BotActivity(
+            client, get_persistent_data_directory("bot-activity") / "state.json"
+        )
+        task = asyncio.create_task(app.state.activity.run())
+        yield
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+app = FastAPI(lifespan=_lifespan)
+
+
+@app.get("/metrics")
+async def _render_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/health")
+async def _render_health():
+    return "OK"
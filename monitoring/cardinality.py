@@ -0,0 +1,180 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+import httpx
+
+from monitoring import promql
+
+# Used when Prometheus has not compacted any blocks yet, typical for real workloads
+DEFAULT_BYTES_PER_SAMPLE = 1.5
+
+
+class PrometheusAPI:
+    def __init__(self, url: str, client: Optional[httpx.Client] = None):
+        self.client = client or httpx.Client(timeout=60)
+        self.url = url.rstrip("/")
+
+    def get(self, path: str, **params) -> Dict:
+        r = self.client.get(f"{self.url}{path}", params=params)
+        r.raise_for_status()
+        return r.json()["data"]
+
+    def query(self, expr: str) -> List[Dict]:
+        return self.get("/api/v1/query", query=expr)["result"]
+
+    def scalar(self, expr: str) -> Optional[float]:
+        result = self.query(expr)
+        return float(result[0]["value"][1]) if result else None
+
+
+def referenced_metrics(
+    metric_names: Iterable[str], expressions: Iterable[str]
+) -> Set[str]:
+    """Metrics used by any of the expressions, including via `__name__=~` matchers."""
+    names: Set[str] = set()
+    patterns: List[re.Pattern] = []
+    for expr in expressions:
+        for selector in promql.selectors(expr):
+            if selector.metric:
+                names.add(selector.metric)
+            for label, op, value in selector.matchers:
+                if label == "__name__" and op == "=":
+                    names.add(value)
+                elif label == "__name__" and op == "=~":
+                    try:
+                        patterns.append(re.compile(value))
+                    except re.error:
+                        pass
+
+    return {
+        name
+        for name in metric_names
+        if name in names or any(pattern.fullmatch(name) for pattern in patterns)
+    }
+
+
+def analyze(api: PrometheusAPI, expressions: List[str], top: int = 20) -> Dict:
+    tsdb = api.get("/api/v1/status/tsdb", limit=top)
+    head_series = int(tsdb["headStats"]["numSeries"])
+
+    # Head series include everything seen in the last ~2-3 hours, the instant
+    # query only what is still reporting, the difference is churn.
+    by_metric = [
+        (entry["name"], int(entry["value"]))
+        for entry in tsdb["seriesCountByMetricName"]
+    ]
+    active = {}
+    if by_metric:
+        names = "|".join(name for name, _ in by_metric)
+        active = {
+            result["metric"].get("__name__", ""): int(float(result["value"][1]))
+            for result in api.query(f'count by (__name__) ({{__name__=~"{names}"}})')
+        }
+
+    metadata = api.get("/api/v1/metadata")
+    metrics = [
+        {
+            "name": name,
+            "type": metadata.get(name, [{}])[0].get("type", "unknown"),
+            "head_series": series,
+            "active_series": active.get(name, 0),
+            "churned_series": max(series - active.get(name, 0), 0),
+            "share": series / head_series if head_series else 0,
+        }
+        for name, series in by_metric
+    ]
+
+    label_pairs = [
+        {"pair": entry["name"], "head_series": int(entry["value"])}
+        for entry in tsdb["seriesCountByLabelValuePair"]
+    ]
+    label_names = [
+        {"label": entry["name"], "values": int(entry["value"])}
+        for entry in tsdb["labelValueCountByLabelName"]
+    ]
+
+    flags = api.get("/api/v1/status/flags")
+    retention = flags.get("storage.tsdb.retention.time", "0s")
+    retention_seconds = promql.parse_duration(retention) or 0
+
+    samples_per_second = (
+        api.scalar("rate(prometheus_tsdb_head_samples_appended_total[1h])") or 0
+    )
+    bytes_per_sample = (
+        api.scalar(
+            "rate(prometheus_tsdb_compaction_chunk_size_bytes_sum[1d])"
+            " / rate(prometheus_tsdb_compaction_chunk_samples_sum[1d])"
+        )
+        or DEFAULT_BYTES_PER_SAMPLE
+    )
+    blocks_bytes = api.scalar("prometheus_tsdb_storage_blocks_bytes") or 0
+
+    all_metrics = api.get("/api/v1/label/__name__/values")
+    unreferenced = sorted(
+        set(all_metrics) - referenced_metrics(all_metrics, expressions)
+    )
+
+    return {
+        "head_series": head_series,
+        "head_churned_series": sum(metric["churned_series"] for metric in metrics),
+        "metrics": metrics,
+        "label_pairs": label_pairs,
+        "label_names": label_names,
+        "retention": retention,
+        "samples_per_second": samples_per_second,
+        "bytes_per_sample": bytes_per_sample,
+        "blocks_bytes": blocks_bytes,
+        "projected_bytes": samples_per_second * bytes_per_sample * retention_seconds,
+        "unreferenced_metrics": [
+            {
+                "name": name,
+                "head_series": dict(by_metric).get(name),
+            }
+            for name in unreferenced
+        ],
+    }
+
+
+def _size(value: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024:
+            return f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}TiB"
+
+
+def format_report(report: Dict, volume_bytes: Optional[float] = None) -> str:
+    lines = [
+        f"Head series:      {report['head_series']} ({report['head_churned_series']} churned in the top metrics)",
+        f"Ingestion:        {report['samples_per_second']:.1f} samples/s at {report['bytes_per_sample']:.2f} bytes/sample",
+        f"Blocks on disk:   {_size(report['blocks_bytes'])}",
+        f"Projected ({report['retention']}): {_size(report['projected_bytes'])}",
+    ]
+    if volume_bytes:
+        lines.append(
+            f"Volume use:       {report['projected_bytes'] / volume_bytes:.0%} of {_size(volume_bytes)}"
+        )
+
+    lines += [
+        "",
+        f"{'Metric':<50} {'Type':<9} {'Series':>8} {'Active':>8} {'Churned':>8} {'Share':>6}",
+    ]
+    for metric in report["metrics"]:
+        lines.append(
+            f"{metric['name']:<50} {metric['type']:<9} {metric['head_series']:>8} {metric['active_series']:>8}"
+            f" {metric['churned_series']:>8} {metric['share']:>6.1%}"
+        )
+
+    lines += ["", f"{'Label pair':<69} {'Series':>8}"]
+    for pair in report["label_pairs"]:
+        lines.append(f"{pair['pair']:<69} {pair['head_series']:>8}")
+
+    lines += ["", f"{'Label':<69} {'Values':>8}"]
+    for label in report["label_names"]:
+        lines.append(f"{label['label']:<69} {label['values']:>8}")
+
+    lines += ["", "Metrics not referenced by any rule or dashboard:"]
+    for metric in report["unreferenced_metrics"]:
+        series = metric["head_series"]
+        lines.append(f"  {metric['name']}" + (f" ({series} series)" if series else ""))
+    return "\n".join(lines)
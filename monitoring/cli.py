@@ -1,13 +1,38 @@
 #!/usr/bin/env python3
+import json
 import logging
+import os
+import subprocess
 import sys
+import time
+from pathlib import PosixPath
+from typing import Dict, Optional, Tuple
 
 import click
+import httpx
+import uvicorn
+import yaml
 
+from monitoring import cardinality, promql, recording_rules, rule_lint
+from monitoring.benchmark import alert_latency, remote_write, wiki_updater
+from monitoring.downsample import Downsampler
+from monitoring.helpers import write_file_atomically
+from monitoring.rules import generate_bot_rules
 from monitoring.service.alert_manager import AlertManager
 from monitoring.service.blackbox_exporter import BlackboxExporter
 from monitoring.service.grafana import Grafana
+from monitoring.service.long_term_prometheus import LongTermPrometheus
 from monitoring.service.prometheus import Prometheus
+from monitoring.supervisor import Supervisor
+
+
+def _echo_results(results: Dict) -> None:
+    for key, value in results.items():
+        click.echo(
+            f"{key:<32} {value:.4f}"
+            if isinstance(value, float)
+            else f"{key:<32} {value}"
+        )
 
 
 @click.group()
@@ -20,32 +45,320 @@ def cli():
 
 
 @cli.command()
-def prometheus():
-    service = Prometheus()
+@click.option("--supervise", is_flag=True, help="Hot reload on config changes")
+@click.option("--replica", default=0, help="Replica index when running several")
+def prometheus(supervise: bool, replica: int):
+    service = Prometheus(replica)
+    if supervise:
+        return Supervisor(service).run()
+
     service.write_configuration()
     service.execute()
 
 
 @cli.command()
-def alert_manager():
-    service = AlertManager()
+@click.option("--supervise", is_flag=True, help="Hot reload on config changes")
+@click.option("--replica", default=0, help="Replica index when running several")
+def alert_manager(supervise: bool, replica: int):
+    service = AlertManager(replica)
+    if supervise:
+        return Supervisor(service).run()
+
     service.write_configuration()
     service.execute()
 
 
 @cli.command()
-def blackbox_exporter():
+@click.option("--supervise", is_flag=True, help="Hot reload on config changes")
+def blackbox_exporter(supervise: bool):
     service = BlackboxExporter()
+    if supervise:
+        return Supervisor(service).run()
+
     service.write_configuration()
     service.execute()
 
 
 @cli.command()
-def grafana():
+@click.option("--supervise", is_flag=True, help="Hot reload on config changes")
+def grafana(supervise: bool):
     service = Grafana()
+    if supervise:
+        return Supervisor(service).run()
+
+    service.write_configuration()
+    service.execute()
+
+
+@cli.command()
+@click.option("--supervise", is_flag=True, help="Hot reload on config changes")
+def long_term_prometheus(supervise: bool):
+    service = LongTermPrometheus()
+    if supervise:
+        return Supervisor(service).run()
+
     service.write_configuration()
     service.execute()
 
 
+@cli.command()
+@click.option("--host", default="0.0.0.0", help="Address to listen on")
+@click.option("--port", default=8901, help="Port to listen on")
+def remote_write_proxy(host: str, port: int):
+    uvicorn.run("monitoring.receivers.remote_write_proxy:app", host=host, port=port)
+
+
+@cli.command()
+@click.option("--host", default="0.0.0.0", help="Address to listen on")
+@click.option("--port", default=8902, help="Port to listen on")
+def prober(host: str, port: int):
+    uvicorn.run("monitoring.prober:app", host=host, port=port)
+
+
+@cli.command()
+@click.option("--host", default="0.0.0.0", help="Address to listen on")
+@click.option("--port", default=8903, help="Port to listen on")
+def query_frontend(host: str, port: int):
+    uvicorn.run("monitoring.query_frontend:app", host=host, port=port)
+
+
+@cli.command()
+@click.option("--host", default="0.0.0.0", help="Address to listen on")
+@click.option("--port", default=8904, help="Port to listen on")
+def status_page(host: str, port: int):
+    uvicorn.run("monitoring.status_page:app", host=host, port=port)
+
+
+@cli.command()
+@click.option("--host", default="0.0.0.0", help="Address to listen on")
+@click.option("--port", default=8905, help="Port to listen on")
+def bot_activity(host: str, port: int):
+    uvicorn.run("monitoring.bot_activity:app", host=host, port=port)
+
+
+@cli.command()
+@click.option("--prometheus-url", default="http://prometheus:9090")
+@click.option("--metrics", default=".+", help="Regex of metric names to downsample")
+@click.option("--interval", type=int, help="Keep running, every this many seconds")
+def downsample(prometheus_url: str, metrics: str, interval: Optional[int]):
+    downsampler = Downsampler(cardinality.PrometheusAPI(prometheus_url), metrics)
+    if not interval:
+        downsampler.run()
+        return
+
+    while True:
+        try:
+            downsampler.run()
+        except (httpx.HTTPError, subprocess.CalledProcessError) as e:
+            logging.error(f"Downsampling failed: {e}")
+        time.sleep(interval)
+
+
+@cli.command()
+def generate_rules():
+    path = Prometheus.files_path / "rules" / "bots.yml"
+    if write_file_atomically(path, generate_bot_rules()):
+        click.echo(f"Updated {path}")
+
+
+@cli.command()
+@click.option(
+    "--dashboards",
+    multiple=True,
+    type=click.Path(exists=True, path_type=PosixPath),
+    help="Dashboard JSON file or directory",
+)
+@click.option("--grafana-url", help="Fetch dashboards from Grafana instead")
+@click.option(
+    "--output-dashboards",
+    type=click.Path(file_okay=False, path_type=PosixPath),
+    help="Directory to write rewritten dashboards to",
+)
+@click.option("--min-occurrences", default=2, help="Uses before a query is recorded")
+def generate_recording_rules(
+    dashboards: Tuple[PosixPath, ...],
+    grafana_url: Optional[str],
+    output_dashboards: Optional[PosixPath],
+    min_occurrences: int,
+):
+    loaded = recording_rules.load_dashboards(list(dashboards))
+    if grafana_url:
+        loaded |= recording_rules.fetch_dashboards(
+            grafana_url, os.environ.get("GRAFANA_TOKEN")
+        )
+
+    rules_path = Prometheus.files_path / "rules"
+    expressions = list(recording_rules.rule_expressions(rules_path)) + [
+        target["expr"]
+        for dashboard in loaded.values()
+        for target in recording_rules.dashboard_targets(dashboard)
+    ]
+    candidates = recording_rules.find_candidates(expressions, min_occurrences)
+
+    path = rules_path / recording_rules.RECORDING_RULES_FILE
+    if write_file_atomically(
+        path, recording_rules.generate_recording_rules(candidates)
+    ):
+        click.echo(f"Updated {path}")
+
+    if output_dashboards:
+        output_dashboards.mkdir(parents=True, exist_ok=True)
+        for name, dashboard in recording_rules.rewrite_dashboards(
+            loaded, candidates
+        ).items():
+            write_file_atomically(
+                output_dashboards / name, json.dumps(dashboard, indent=2)
+            )
+            click.echo(f"Rewrote {output_dashboards / name}")
+
+
+@cli.command()
+@click.option(
+    "--series-counts",
+    type=click.Path(exists=True, dir_okay=False, path_type=PosixPath),
+    help="YAML/JSON mapping of metric name to series count",
+)
+@click.option("--prometheus-url", help="Take series counts from a live Prometheus")
+@click.option("--max-range", default="1d", help="Longest range window allowed")
+@click.option("--budget", type=float, help="Maximum samples scanned per evaluation")
+@click.option("--default-series", default=1, help="Series assumed for unknown metrics")
+@click.option(
+    "--rules-path",
+    type=click.Path(exists=True, file_okay=False, path_type=PosixPath),
+    default=Prometheus.files_path / "rules",
+)
+def lint_rules(
+    series_counts: Optional[PosixPath],
+    prometheus_url: Optional[str],
+    max_range: str,
+    budget: Optional[float],
+    default_series: int,
+    rules_path: PosixPath,
+):
+    rules = list(rule_lint.load_rules(rules_path))
+    if prometheus_url:
+        counts = rule_lint.live_series_counts(
+            cardinality.PrometheusAPI(prometheus_url),
+            {name for rule in rules for name in promql.metric_names(rule.expr)},
+        )
+    elif series_counts:
+        counts = rule_lint.fixture_series_counts(series_counts)
+    else:
+        raise click.UsageError("One of --series-counts or --prometheus-url is needed")
+
+    config = yaml.safe_load(Prometheus().generate_configuration())["global"]
+    linter = rule_lint.Linter(
+        counts,
+        promql.parse_duration(config["scrape_interval"]),
+        promql.parse_duration(config["evaluation_interval"]),
+        promql.parse_duration(max_range),
+        default_series,
+    )
+    costs = [linter.cost(rule) for rule in rules]
+    findings = linter.findings(rules)
+    click.echo(rule_lint.format_report(rules, costs, findings, budget))
+
+    over_budget = budget is not None and sum(c["samples"] for c in costs) > budget
+    if over_budget or any(finding.severity == "error" for finding in findings):
+        sys.exit(1)
+
+
+@cli.command()
+@click.option("--prometheus-url", default="http://prometheus:9090")
+@click.option(
+    "--dashboards",
+    multiple=True,
+    type=click.Path(exists=True, path_type=PosixPath),
+    help="Dashboard JSON file or directory checked for metric references",
+)
+@click.option("--grafana-url", help="Check dashboards in Grafana for references")
+@click.option("--top", default=20, help="Number of metrics and label pairs to rank")
+@click.option("--volume-size", type=float, help="Persistent volume size in GiB")
+@click.option("--json", "as_json", is_flag=True, help="Output the report as JSON")
+def analyze_cardinality(
+    prometheus_url: str,
+    dashboards: Tuple[PosixPath, ...],
+    grafana_url: Optional[str],
+    top: int,
+    volume_size: Optional[float],
+    as_json: bool,
+):
+    loaded = recording_rules.load_dashboards(list(dashboards))
+    if grafana_url:
+        loaded |= recording_rules.fetch_dashboards(
+            grafana_url, os.environ.get("GRAFANA_TOKEN")
+        )
+
+    expressions = list(
+        recording_rules.rule_expressions(
+            Prometheus.files_path / "rules", include_recording=True
+        )
+    ) + [
+        target["expr"]
+        for dashboard in loaded.values()
+        for target in recording_rules.dashboard_targets(dashboard)
+    ]
+
+    report = cardinality.analyze(
+        cardinality.PrometheusAPI(prometheus_url), expressions, top
+    )
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+    else:
+        click.echo(
+            cardinality.format_report(
+                report, volume_size * 1024**3 if volume_size else None
+            )
+        )
+
+
+@cli.command()
+@click.option("--hosts", default=2, help="Number of wiki hosts")
+@click.option("--pages", default=20, help="Number of status pages per host")
+@click.option("--alerts", default=200, help="Number of alerts per round")
+@click.option("--alerts-per-payload", default=10, help="Alerts grouped per webhook")
+@click.option("--resends", default=2, help="Number of times each round is re-sent")
+@click.option("--flap-rate", default=0.2, help="Fraction of alerts changing per round")
+@click.option("--latency", default=0.05, help="Fake wiki response latency (seconds)")
+@click.option("--error-rate", default=0.0, help="Fraction of fake wiki 503 responses")
+@click.option("--rate-limit", default=0.0, help="Fake wiki requests/second before 429s")
+@click.option("--lag", default=0.0, help="Fake wiki replication lag (seconds)")
+@click.option("--timeout", default=300.0, help="Maximum time to wait for the queue")
+def benchmark_wiki_updater(**kwargs):
+    _echo_results(wiki_updater.run_benchmark(**kwargs))
+
+
+@cli.command()
+@click.option("--url", help="Remote write endpoint, defaults to a stand-in receiver")
+@click.option("--series", default=10000, help="Number of active series")
+@click.option("--metrics", default=100, help="Number of metric names")
+@click.option("--label-cardinality", default=50, help="Distinct instance labels")
+@click.option("--churn", default=0.01, help="Fraction of series replaced per round")
+@click.option("--rounds", default=10, help="Samples sent per series")
+@click.option("--batch-size", default=2000, help="Samples per request")
+@click.option("--concurrency", default=4, help="Number of parallel senders (shards)")
+@click.option("--latency", default=0.0, help="Stand-in receiver latency (seconds)")
+@click.option("--error-rate", default=0.0, help="Fraction of stand-in 503 responses")
+def benchmark_remote_write(**kwargs):
+    _echo_results(remote_write.run_benchmark(**kwargs))
+
+
+@cli.command()
+@click.option(
+    "--bot", default="ClueBot NG", help="Inventory bot whose alert is simulated"
+)
+@click.option("--runs", default=1000, help="Number of simulated outages")
+@click.option(
+    "--updates",
+    default=20,
+    type=click.IntRange(min=1),
+    help="Number of measured wiki updates",
+)
+@click.option("--latency", default=0.05, help="Fake wiki response latency (seconds)")
+@click.option("--timeout", default=60.0, help="Maximum time to wait for an update")
+def benchmark_alert_latency(**kwargs):
+    _echo_results(alert_latency.run_benchmark(**kwargs))
+
+
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,175 @@
+import json
+import logging
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import PosixPath
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple
+
+from monitoring.cardinality import PrometheusAPI
+from monitoring.helpers import (
+    PROMTOOL_PATH,
+    get_persistent_data_directory,
+    write_file_atomically,
+)
+from monitoring.service.long_term_prometheus import LongTermPrometheus
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {"5m": 300, "1h": 3600}
+AGGREGATIONS = ("min", "max", "avg", "count")
+# Range handled per query and per backfilled block
+WINDOW = 86400
+# Samples can arrive late via remote write, leave recent buckets alone
+DELAY = 3600
+# How far back the very first run starts
+INITIAL_LOOKBACK = 14 * 86400
+
+
+def downsampled_name(metric: str, aggregation: str, resolution: str) -> str:
+    return f"{metric}:{aggregation}_{resolution}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def write_family(fh: TextIO, name: str, results: List[Dict]) -> int:
+    """Write one OpenMetrics gauge family from a range query result."""
+    fh.write(f"# TYPE {name} gauge\n")
+    samples = 0
+    for series in results:
+        labels = ",".join(
+            f'{label}="{_escape(value)}"'
+            for label, value in sorted(series["metric"].items())
+            if label != "__name__"
+        )
+        selector = f"{name}{{{labels}}}" if labels else name
+        for timestamp, value in series["values"]:
+            fh.write(f"{selector} {value} {timestamp}\n")
+            samples += 1
+    return samples
+
+
+class Downsampler:
+    """Backfill min/max/avg/count aggregates of completed ranges into the long-term TSDB.
+
+    Each aggregate at time t covers the raw samples in (t - resolution, t],
+    the same as `<aggregation>_over_time(metric[resolution])` evaluated at t.
+    Progress is kept per resolution, a failed window is retried next run.
+    """
+
+    def __init__(
+        self,
+        api: PrometheusAPI,
+        metrics: str = ".+",
+        state_path: Optional[PosixPath] = None,
+        output_path: Optional[PosixPath] = None,
+    ):
+        self.api = api
+        self.metrics = re.compile(metrics)
+        work_path = get_persistent_data_directory("downsample")
+        self.state_path = state_path or work_path / "state.json"
+        self.staging_path = work_path / "staging"
+        self.output_path = output_path or get_persistent_data_directory(
+            LongTermPrometheus.storage_directory
+        )
+
+    def load_state(self) -> Dict[str, int]:
+        try:
+            return json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return {}
+
+    def save_state(self, state: Dict[str, int]) -> None:
+        write_file_atomically(self.state_path, json.dumps(state, indent=2))
+
+    def pending_windows(
+        self, resolution: str, state: Dict[str, int], now: float
+    ) -> Iterable[Tuple[int, int]]:
+        step = RESOLUTIONS[resolution]
+        end = int((now - DELAY) // step * step)
+        start = state.get(resolution) or int((now - INITIAL_LOOKBACK) // step * step)
+        while start < end:
+            yield start, min(start + WINDOW, end)
+            start = min(start + WINDOW, end)
+
+    def _metric_names(self) -> List[str]:
+        return sorted(
+            name
+            for name in self.api.get("/api/v1/label/__name__/values")
+            if self.metrics.fullmatch(name)
+        )
+
+    def write_window(
+        self, fh: TextIO, resolution: str, start: int, end: int, metrics: List[str]
+    ) -> int:
+        step = RESOLUTIONS[resolution]
+        samples = 0
+        for metric in metrics:
+            for aggregation in AGGREGATIONS:
+                results = self.api.get(
+                    "/api/v1/query_range",
+                    query=f'{aggregation}_over_time({{__name__="{metric}"}}[{resolution}])',
+                    start=start + step,
+                    end=end,
+                    step=step,
+                )["result"]
+                if results:
+                    samples += write_family(
+                        fh, downsampled_name(metric, aggregation, resolution), results
+                    )
+        fh.write("# EOF\n")
+        return samples
+
+    def create_blocks(self, openmetrics_path: PosixPath) -> None:
+        blocks_path = PosixPath(
+            tempfile.mkdtemp(prefix="blocks-", dir=self.staging_path)
+        )
+        try:
+            subprocess.run(
+                [
+                    PROMTOOL_PATH.as_posix(),
+                    "tsdb",
+                    "create-blocks-from",
+                    "openmetrics",
+                    f"--max-block-duration={WINDOW}s",
+                    openmetrics_path.as_posix(),
+                    blocks_path.as_posix(),
+                ],
+                check=True,
+                capture_output=True,
+            )
+            # Blocks only become visible once complete, the rename is atomic
+            for block in blocks_path.iterdir():
+                block.rename(self.output_path / block.name)
+        finally:
+            shutil.rmtree(blocks_path, ignore_errors=True)
+
+    def run(self, now: Optional[float] = None) -> int:
+        """Downsample everything completed since the last run, returns the sample count."""
+        now = now or time.time()
+        self.staging_path.mkdir(parents=True, exist_ok=True)
+        state = self.load_state()
+        metrics = self._metric_names()
+        total = 0
+        for resolution in RESOLUTIONS:
+            for start, end in self.pending_windows(resolution, state, now):
+                openmetrics_path = self.staging_path / f"{resolution}-{start}.om"
+                try:
+                    with openmetrics_path.open("w") as fh:
+                        samples = self.write_window(fh, resolution, start, end, metrics)
+                    if samples:
+                        self.create_blocks(openmetrics_path)
+                finally:
+                    openmetrics_path.unlink(missing_ok=True)
+
+                logger.info(
+                    f"Downsampled {samples} {resolution} samples from {start} to {end}"
+                )
+                total += samples
+                state[resolution] = end
+                self.save_state(state)
+        return total
@@ -1,6 +1,9 @@
 import os
 from pathlib import PosixPath
-from typing import Optional
+from typing import List, Optional
+
+# Installed by setup.py next to prometheus
+PROMTOOL_PATH = PosixPath("/workspace/bin/promtool")
 
 
 def get_tool_home_directory() -> PosixPath:
@@ -19,3 +22,29 @@ def get_persistent_data_directory(sub_directory: Optional[str] = None):
         path = path / sub_directory
     path.mkdir(parents=True, exist_ok=True)
     return path.absolute()
+
+
+def write_file_atomically(path: PosixPath, content: str) -> bool:
+    """Replace the file contents via a rename, returns False if nothing changed."""
+    try:
+        if path.read_text() == content:
+            return False
+    except FileNotFoundError:
+        pass
+
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temporary_path.write_text(content)
+    os.replace(temporary_path, path)
+    return True
+
+
+def get_replica_count(env_name: str) -> int:
+    return max(int(os.environ.get(env_name, "1")), 1)
+
+
+def get_replica_hosts(service: str, replicas: int) -> List[str]:
+    """Host names of a replicated service, the first replica keeps the plain name."""
+    return [
+        service if replica == 0 else f"{service}-{replica}"
+        for replica in range(replicas)
+    ]
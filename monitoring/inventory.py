@@ -0,0 +1,63 @@
+import os
+from pathlib import PosixPath
+from typing import Dict, List, Optional
+
+import yaml
+from pydantic import BaseModel
+
+DEFAULT_INVENTORY_PATH = PosixPath(__file__).parent.parent / "inventory.yml"
+
+
+class ScrapeJob(BaseModel):
+    targets: List[str]
+    interval: Optional[str] = None
+    metrics_path: Optional[str] = None
+    # Keep the exporter's labels (e.g. tool) over the target labels on conflicts
+    honor_labels: bool = False
+
+
+class Tool(BaseModel):
+    owner: str
+    probes: List[str] = []
+    probe_interval: Optional[str] = None
+    scrape_jobs: Dict[str, ScrapeJob] = {}
+
+
+class Bot(BaseModel):
+    domain: str
+    # Tool the bot runs from, relates the bot's alerts to the tool's probe alerts
+    tool: Optional[str] = None
+    # Page updated by the wiki updater with the bot status
+    status_page: Optional[str] = None
+    # Page administrators use to disable the bot
+    run_page: Optional[str] = None
+    # Alert when the last edit is older than this many seconds
+    max_edit_age: Optional[int] = None
+    # Alert when there are fewer edits than this in the last 24 hours
+    min_recent_edits: Optional[int] = None
+
+
+class Inhibition(BaseModel):
+    # Root cause alert
+    source: str
+    # Symptom alerts, suppressed while the source fires
+    targets: List[str]
+    # Labels that must match, scoping the suppression to the same bot or tool
+    equal: List[str] = []
+
+
+class Inventory(BaseModel):
+    tools: Dict[str, Tool] = {}
+    bots: Dict[str, Bot] = {}
+    inhibitions: List[Inhibition] = []
+
+
+def get_inventory_path() -> PosixPath:
+    if path := os.environ.get("MONITORING_INVENTORY"):
+        return PosixPath(path)
+    return DEFAULT_INVENTORY_PATH
+
+
+def load_inventory(path: Optional[PosixPath] = None) -> Inventory:
+    with (path or get_inventory_path()).open("r") as fh:
+        return Inventory.model_validate(yaml.safe_load(fh) or {})
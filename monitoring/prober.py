@@ -0,0 +1,310 @@
+import asyncio
+import contextvars
+import logging
+import os
+import socket
+import ssl
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import httpcore
+from fastapi import FastAPI, Response
+
+from monitoring import promql
+from monitoring.inventory import load_inventory
+from monitoring.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge
+
+logging.basicConfig(
+    level=logging.INFO,
+    stream=sys.stderr,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Default interval for tools without a probe_interval in the inventory
+PROBE_INTERVAL = float(os.environ.get("PROBER_INTERVAL", "60"))
+PROBE_TIMEOUT = float(os.environ.get("PROBER_TIMEOUT", "10"))
+# getaddrinfo does not expose record TTLs, cache lookups for a fixed time
+DNS_TTL = float(os.environ.get("PROBER_DNS_TTL", "300"))
+INVENTORY_RELOAD_INTERVAL = 60
+MAX_REDIRECTS = 10
+PHASES = ("resolve", "connect", "tls", "processing", "transfer")
+
+# Same names as blackbox_exporter so rules and dashboards keep working
+TARGET_LABELS = ["instance", "tool", "owner"]
+PROBE_SUCCESS = Gauge("probe_success", "Whether the probe was a success", TARGET_LABELS)
+PROBE_DURATION = Gauge(
+    "probe_duration_seconds", "How long the probe took", TARGET_LABELS
+)
+PROBE_DNS_LOOKUP = Gauge(
+    "probe_dns_lookup_time_seconds",
+    "Time spent resolving, 0 when cached",
+    TARGET_LABELS,
+)
+PROBE_HTTP_DURATION = Gauge(
+    "probe_http_duration_seconds",
+    "Duration of the http request by phase, summed over all redirects",
+    TARGET_LABELS + ["phase"],
+)
+PROBE_HTTP_STATUS = Gauge(
+    "probe_http_status_code", "Response HTTP status code", TARGET_LABELS
+)
+PROBE_HTTP_REDIRECTS = Gauge(
+    "probe_http_redirects", "The number of redirects", TARGET_LABELS
+)
+PROBE_SSL_EXPIRY = Gauge(
+    "probe_ssl_earliest_cert_expiry",
+    "Expiry of the peer certificate in unixtime",
+    TARGET_LABELS,
+)
+PROBE_ERRORS = Counter(
+    "prober_unexpected_errors_total",
+    "Probes that failed with an unexpected exception, i.e. a prober bug",
+    TARGET_LABELS,
+)
+
+# Phase timings of the probe running in the current task
+_phases: contextvars.ContextVar[Dict[str, float]] = contextvars.ContextVar("phases")
+
+
+class CachingResolverBackend(httpcore.AsyncNetworkBackend):
+    """Network backend that resolves (IPv4 only) through a TTL cache.
+
+    TLS still verifies against, and sends SNI for, the requested host as
+    httpcore takes those from the request origin rather than the address.
+    """
+
+    def __init__(self, ttl: float = DNS_TTL):
+        self.ttl = ttl
+        self._backend = httpcore.AnyIOBackend()
+        self._cache: Dict[str, Tuple[float, str]] = {}
+
+    async def resolve(self, host: str) -> str:
+        if (cached := self._cache.get(host)) and cached[0] > time.monotonic():
+            return cached[1]
+
+        started = time.monotonic()
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            host, None, family=socket.AF_INET, type=socket.SOCK_STREAM
+        )
+        if phases := _phases.get(None):
+            phases["resolve"] += time.monotonic() - started
+        address = addresses[0][4][0]
+        self._cache[host] = (time.monotonic() + self.ttl, address)
+        return address
+
+    def forget(self, host: str) -> None:
+        self._cache.pop(host, None)
+
+    async def connect_tcp(
+        self, host, port, timeout=None, local_address=None, socket_options=None
+    ):
+        return await self._backend.connect_tcp(
+            await self.resolve(host),
+            port,
+            timeout=timeout,
+            local_address=local_address,
+            socket_options=socket_options,
+        )
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(
+            path, timeout=timeout, socket_options=socket_options
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class Prober:
+    """Probe the inventory targets over a shared keep-alive connection pool.
+
+    Connections are reused between probes, so connect and TLS timings are
+    only non-zero when a new connection had to be made.
+    """
+
+    def __init__(self):
+        self.backend = CachingResolverBackend()
+        self.pool = httpcore.AsyncConnectionPool(
+            network_backend=self.backend,
+            keepalive_expiry=PROBE_INTERVAL * 2,
+            max_connections=50,
+        )
+        # target -> (interval, labels)
+        self.targets: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        self._next_probe: Dict[str, float] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+
+    def load_targets(self) -> None:
+        targets = {}
+        for name, tool in load_inventory().tools.items():
+            interval = PROBE_INTERVAL
+            if tool.probe_interval:
+                interval = promql.parse_duration(tool.probe_interval) or interval
+            for target in tool.probes:
+                targets[target] = (
+                    interval,
+                    {"instance": target, "tool": name, "owner": tool.owner},
+                )
+
+        for target, (_, labels) in self.targets.items():
+            if target not in targets:
+                logger.info(f"No longer probing {target}")
+                for gauge in (
+                    PROBE_SUCCESS,
+                    PROBE_DURATION,
+                    PROBE_DNS_LOOKUP,
+                    PROBE_HTTP_STATUS,
+                    PROBE_HTTP_REDIRECTS,
+                    PROBE_SSL_EXPIRY,
+                ):
+                    gauge.remove(**labels)
+                for phase in PHASES:
+                    PROBE_HTTP_DURATION.remove(**labels, phase=phase)
+                self._next_probe.pop(target, None)
+        self.targets = targets
+
+    async def _request(
+        self, url: str, phases: Dict[str, float]
+    ) -> Tuple[int, Optional[str], Optional[float]]:
+        marks: Dict[str, float] = {}
+
+        async def trace(event_name: str, _info: Dict) -> None:
+            marks[event_name.split(".", 1)[1]] = time.monotonic()
+
+        parts = urlsplit(url)
+        resolve_before = phases["resolve"]
+        async with self.pool.stream(
+            "GET",
+            url,
+            headers=[
+                ("Host", parts.netloc),
+                ("User-Agent", "ClueBot NG Monitoring Prober"),
+            ],
+            extensions={"trace": trace, "timeout": {"pool": PROBE_TIMEOUT}},
+        ) as response:
+            await response.aread()
+            finished = time.monotonic()
+
+            cert_expiry = None
+            if stream := response.extensions.get("network_stream"):
+                if ssl_object := stream.get_extra_info("ssl_object"):
+                    if cert := ssl_object.getpeercert():
+                        cert_expiry = ssl.cert_time_to_seconds(cert["notAfter"])
+            location = dict(
+                (k.decode("latin-1").lower(), v.decode("latin-1"))
+                for k, v in response.headers
+            ).get("location")
+
+        def span(start: str, end: str) -> float:
+            return marks[end] - marks[start] if start in marks and end in marks else 0
+
+        resolved = phases["resolve"] - resolve_before
+        phases["connect"] += max(
+            span("connect_tcp.started", "connect_tcp.complete") - resolved, 0
+        )
+        phases["tls"] += span("start_tls.started", "start_tls.complete")
+        phases["processing"] += span(
+            "send_request_headers.started", "receive_response_headers.complete"
+        )
+        if "receive_response_headers.complete" in marks:
+            phases["transfer"] += finished - marks["receive_response_headers.complete"]
+        return response.status, location, cert_expiry
+
+    async def probe(self, target: str) -> None:
+        _, labels = self.targets[target]
+        phases = dict.fromkeys(PHASES, 0.0)
+        token = _phases.set(phases)
+        # Like blackbox_exporter, targets without a scheme are probed over http
+        url = target if "://" in target else f"http://{target}"
+        started = time.monotonic()
+        status, redirects, cert_expiry = 0, 0, None
+        try:
+            async with asyncio.timeout(PROBE_TIMEOUT):
+                while True:
+                    status, location, cert_expiry = await self._request(url, phases)
+                    if 300 <= status < 400 and location and redirects < MAX_REDIRECTS:
+                        url = urljoin(url, location)
+                        redirects += 1
+                        continue
+                    break
+        except (
+            httpcore.NetworkError,
+            httpcore.TimeoutException,
+            OSError,
+            TimeoutError,
+        ) as e:
+            logger.warning(f"Probe of {target} failed: {type(e).__name__} {e}")
+            # The address may have moved, resolve again next time
+            self.backend.forget(urlsplit(url).hostname or "")
+            status = 0
+        except (httpcore.ProtocolError, httpcore.UnsupportedProtocol) as e:
+            logger.warning(f"Probe of {target} failed: {type(e).__name__} {e}")
+            status = 0
+        except Exception:
+            # Still report the target as down, rather than keeping its last result
+            logger.exception(f"Unexpected error probing {target}")
+            PROBE_ERRORS.inc(**labels)
+            status = 0
+        finally:
+            _phases.reset(token)
+
+        PROBE_SUCCESS.set(1 if 200 <= status < 300 else 0, **labels)
+        PROBE_DURATION.set(time.monotonic() - started, **labels)
+        PROBE_DNS_LOOKUP.set(phases["resolve"], **labels)
+        PROBE_HTTP_STATUS.set(status, **labels)
+        PROBE_HTTP_REDIRECTS.set(redirects, **labels)
+        if cert_expiry is not None:
+            PROBE_SSL_EXPIRY.set(cert_expiry, **labels)
+        for phase, duration in phases.items():
+            PROBE_HTTP_DURATION.set(duration, **labels, phase=phase)
+
+    async def _probe_target(self, target: str) -> None:
+        try:
+            await self.probe(target)
+        finally:
+            self._running.pop(target, None)
+
+    async def run(self) -> None:
+        next_reload = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= next_reload:
+                try:
+                    self.load_targets()
+                except Exception as e:
+                    logger.error(f"Failed to load inventory: {e}")
+                next_reload = now + INVENTORY_RELOAD_INTERVAL
+
+            for target, (interval, _) in self.targets.items():
+                if target in self._running or self._next_probe.get(target, 0) > now:
+                    continue
+                self._next_probe[target] = now + interval
+                self._running[target] = asyncio.create_task(self._probe_target(target))
+            await asyncio.sleep(1)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    app.state.prober = Prober()
+    task = asyncio.create_task(app.state.prober.run())
+    yield
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await app.state.prober.pool.aclose()
+
+
+app = FastAPI(lifespan=_lifespan)
+
+
+@app.get("/metrics")
+async def _render_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/health")
+async def _render_health():
+    return "OK"
@@ -0,0 +1,435 @@
+"""Lightweight PromQL scanning.
+
+This is not a full parser, it tokenizes an expression and recognises the
+pieces we need to reason about cost and reuse: vector selectors (with their
+matchers and range), subqueries, range function calls and the aggregation
+around them.
+"""
+
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+AGGREGATIONS = {
+    "sum",
+    "avg",
+    "min",
+    "max",
+    "count",
+    "group",
+    "stddev",
+    "stdvar",
+    "topk",
+    "bottomk",
+    "quantile",
+    "count_values",
+    "limitk",
+    "limit_ratio",
+}
+RANGE_FUNCTIONS = {
+    "rate",
+    "irate",
+    "increase",
+    "delta",
+    "idelta",
+    "deriv",
+    "changes",
+    "resets",
+    "predict_linear",
+    "holt_winters",
+    "double_exponential_smoothing",
+    "avg_over_time",
+    "min_over_time",
+    "max_over_time",
+    "sum_over_time",
+    "count_over_time",
+    "quantile_over_time",
+    "stddev_over_time",
+    "stdvar_over_time",
+    "last_over_time",
+    "present_over_time",
+    "absent_over_time",
+    "mad_over_time",
+}
+KEYWORDS = {
+    "by",
+    "without",
+    "on",
+    "ignoring",
+    "group_left",
+    "group_right",
+    "offset",
+    "bool",
+    "and",
+    "or",
+    "unless",
+    "inf",
+    "nan",
+    "atan2",
+}
+DURATION_UNITS = {
+    "ms": 0.001,
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 604800,
+    "y": 31536000,
+}
+
+_TOKEN = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<comment>\#[^\n]*)
+    |(?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`[^`]*`)
+    |(?P<duration>(?:\d+(?:ms|[smhdwy]))+)
+    |(?P<number>0x[0-9a-fA-F]+|\d*\.?\d+(?:[eE][+-]?\d+)?)
+    |(?P<variable>\$\{[^}]+\}|\$[A-Za-z_]\w*|\[\[[\w:.]+\]\])
+    |(?P<identifier>(?!:\d)[A-Za-z_:][\w:]*)
+    |(?P<operator>=~|!~|!=|==|>=|<=|[-+*/%^<>=,(){}\[\]@:])
+    """,
+    re.VERBOSE,
+)
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+    start: int
+    end: int
+
+
+class Selector(NamedTuple):
+    metric: Optional[str]
+    matchers: List[Tuple[str, str, str]]
+    range: Optional[str]
+    start: int
+    end: int
+    # Tokens of any `offset` and `@` modifiers, e.g. "offset 1d", empty without
+    modifiers: str = ""
+
+    @property
+    def range_seconds(self) -> Optional[float]:
+        return parse_duration(self.range) if self.range else None
+
+
+class Subquery(NamedTuple):
+    """`expr[range:step]`, start and end span the subqueried expression too."""
+
+    range: str
+    # None for the rule evaluation interval
+    step: Optional[str]
+    start: int
+    end: int
+
+    @property
+    def range_seconds(self) -> Optional[float]:
+        return parse_duration(self.range)
+
+    @property
+    def step_seconds(self) -> Optional[float]:
+        return parse_duration(self.step) if self.step else None
+
+
+class RangeCall(NamedTuple):
+    function: str
+    selector: Selector
+    aggregation: Optional[str]
+    grouping: Optional[Tuple[str, Tuple[str, ...]]]
+    start: int
+    end: int
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Seconds in a PromQL duration such as `1h30m`, None for template variables."""
+    parts = re.findall(r"(\d+)(ms|[smhdwy])", value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    return sum(int(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def tokenize(expr: str) -> List[Token]:
+    tokens = []
+    position = 0
+    while position < len(expr):
+        match = _TOKEN.match(expr, position)
+        if not match:
+            # Something we do not understand, keep it as an opaque token
+            tokens.append(Token("unknown", expr[position], position, position + 1))
+            position += 1
+            continue
+        if match.lastgroup not in ("space", "comment"):
+            tokens.append(Token(match.lastgroup, match.group(), *match.span()))
+        position = match.end()
+    return tokens
+
+
+def _matching(tokens: List[Token], index: int) -> int:
+    """Index of the bracket closing the one at `index`."""
+    pairs = {"(": ")", "{": "}", "[": "]"}
+    opening, closing = tokens[index].value, pairs[tokens[index].value]
+    depth = 0
+    for i in range(index, len(tokens)):
+        if tokens[i].value == opening:
+            depth += 1
+        elif tokens[i].value == closing:
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens) - 1
+
+
+def _opening(tokens: List[Token], index: int) -> int:
+    """Index of the bracket opening the one closed at `index`."""
+    pairs = {")": "(", "}": "{", "]": "["}
+    closing, opening = tokens[index].value, pairs[tokens[index].value]
+    depth = 0
+    for i in range(index, -1, -1):
+        if tokens[i].value == closing:
+            depth += 1
+        elif tokens[i].value == opening:
+            depth -= 1
+            if depth == 0:
+                return i
+    return 0
+
+
+def _subquery(tokens: List[Token]) -> Optional[Tuple[str, Optional[str]]]:
+    """Range and step if the bracket contents are a subquery's `range:step`."""
+    colons = [k for k, token in enumerate(tokens) if token.value == ":"]
+    if len(colons) != 1:
+        return None
+    step = "".join(token.value for token in tokens[colons[0] + 1 :])
+    return "".join(token.value for token in tokens[: colons[0]]), step or None
+
+
+def _skip_modifiers(tokens: List[Token], index: int) -> int:
+    """Index after any `offset <duration>` and `@ <time>` modifiers at `index`."""
+    while index + 1 < len(tokens) and tokens[index].value in ("offset", "@"):
+        index += 1
+        if tokens[index].value in ("-", "+"):
+            index += 1
+        if (
+            index + 1 < len(tokens)
+            and tokens[index].value in ("start", "end")
+            and tokens[index + 1].value == "("
+        ):
+            index = _matching(tokens, index + 1)
+        index += 1
+    return index
+
+
+def _parse_matchers(tokens: List[Token]) -> List[Tuple[str, str, str]]:
+    matchers = []
+    for i in range(len(tokens) - 2):
+        if (
+            tokens[i].kind in ("identifier", "string")
+            and tokens[i + 1].value in ("=", "!=", "=~", "!~")
+            and tokens[i + 2].kind in ("string", "variable")
+        ):
+            name = tokens[i].value.strip("\"'`")
+            value = tokens[i + 2].value
+            if tokens[i + 2].kind == "string":
+                value = value[1:-1]
+            matchers.append((name, tokens[i + 1].value, value))
+    return matchers
+
+
+def _selectors(tokens: List[Token]) -> Iterator[Tuple[Selector, int, int]]:
+    """Yield selectors with the token indexes they span."""
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+
+        # Label lists of by/without/on/ignoring/group_x are not metrics
+        # A subquery's `[range:step]` after a parenthesised expression
+        if token.value == "[":
+            i = _matching(tokens, i) + 1
+            continue
+
+        if token.kind == "identifier" and token.value in KEYWORDS:
+            if following and following.value == "(" and token.value != "offset":
+                i = _matching(tokens, i + 1) + 1
+                continue
+            if token.value == "offset":
+                i = _skip_modifiers(tokens, i)
+                continue
+            i += 1
+            continue
+
+        is_metric = (
+            token.kind == "identifier"
+            and token.value not in AGGREGATIONS | RANGE_FUNCTIONS
+            and not (following and following.value == "(")
+        )
+        if is_metric or token.value == "{":
+            start_index = i
+            metric = token.value if is_metric else None
+            matchers = []
+            j = i + 1 if is_metric else i
+            if j < len(tokens) and tokens[j].value == "{":
+                close = _matching(tokens, j)
+                matchers = _parse_matchers(tokens[j + 1 : close])
+                j = close + 1
+
+            selector_range = None
+            if j < len(tokens) and tokens[j].value == "[":
+                close = _matching(tokens, j)
+                # A subquery over the instant selector is skipped as any other
+                if not _subquery(tokens[j + 1 : close]):
+                    selector_range = "".join(t.value for t in tokens[j + 1 : close])
+                    j = close + 1
+
+            modifiers_start = j
+            j = _skip_modifiers(tokens, j)
+
+            yield Selector(
+                metric,
+                matchers,
+                selector_range,
+                tokens[start_index].start,
+                tokens[j - 1].end,
+                " ".join(t.value for t in tokens[modifiers_start:j]),
+            ), start_index, j - 1
+            i = j
+            continue
+        i += 1
+
+
+def selectors(expr: str) -> List[Selector]:
+    return [selector for selector, _, _ in _selectors(tokenize(expr))]
+
+
+def subqueries(expr: str) -> List[Subquery]:
+    tokens = tokenize(expr)
+    found = []
+    for i, token in enumerate(tokens[1:], 1):
+        if token.value != "[":
+            continue
+        close = _matching(tokens, i)
+        if not (bounds := _subquery(tokens[i + 1 : close])):
+            continue
+
+        # Walk back over the subqueried expression: a call, parentheses or selector
+        start = i - 1
+        if tokens[start].value in (")", "}"):
+            start = _opening(tokens, start)
+        if start > 0 and tokens[start - 1].value == ")":
+            # agg by (labels) (...)
+            grouping = _opening(tokens, start - 1)
+            if grouping > 0 and tokens[grouping - 1].value in ("by", "without"):
+                start = grouping - 1
+        if start > 0 and tokens[start - 1].kind == "identifier":
+            start -= 1
+        found.append(Subquery(*bounds, tokens[start].start, tokens[close].end))
+    return found
+
+
+def metric_names(expr: str) -> Set[str]:
+    return {selector.metric for selector in selectors(expr) if selector.metric} | {
+        value
+        for selector in selectors(expr)
+        for name, op, value in selector.matchers
+        if name == "__name__" and op == "="
+    }
+
+
+def range_calls(expr: str) -> List[RangeCall]:
+    """Range function calls over a plain selector, with any directly enclosing aggregation."""
+    tokens = tokenize(expr)
+    selector_at: Dict[int, Tuple[Selector, int]] = {
+        start: (selector, end) for selector, start, end in _selectors(tokens)
+    }
+
+    calls = []
+    for i, token in enumerate(tokens[:-1]):
+        if token.value not in RANGE_FUNCTIONS or tokens[i + 1].value != "(":
+            continue
+
+        close = _matching(tokens, i + 1)
+        # Only handle the simple (and by far most common) form `fn(selector[range])`
+        arguments = [
+            index
+            for index in range(i + 2, close)
+            if index in selector_at and selector_at[index][0].range
+        ]
+        if len(arguments) != 1 or selector_at[arguments[0]][1] != close - 1:
+            continue
+        if arguments[0] != i + 2:
+            # e.g. quantile_over_time(0.9, x[5m]), keep the whole call anyway
+            if tokens[i + 2].kind != "number" or tokens[i + 3].value != ",":
+                continue
+
+        selector = selector_at[arguments[0]][0]
+        call = RangeCall(
+            token.value, selector, None, None, token.start, tokens[close].end
+        )
+        calls.append(_with_aggregation(tokens, i, close, call))
+    return calls
+
+
+def _with_aggregation(
+    tokens: List[Token], start: int, close: int, call: RangeCall
+) -> RangeCall:
+    # Prefix form: agg by (labels) ( fn(...) )
+    j = start - 1
+    if j < 1 or tokens[j].value != "(":
+        return call
+
+    grouping = None
+    k = j - 1
+    if tokens[k].value == ")":
+        # Walk back over a `by (...)` clause
+        depth = 0
+        while k >= 0:
+            if tokens[k].value == ")":
+                depth += 1
+            elif tokens[k].value == "(":
+                depth -= 1
+                if depth == 0:
+                    break
+            k -= 1
+        if k < 2 or tokens[k - 1].value not in ("by", "without"):
+            return call
+        labels = tuple(
+            t.value.strip("\"'") for t in tokens[k + 1 : j - 1] if t.value != ","
+        )
+        grouping = (tokens[k - 1].value, labels)
+        k -= 2
+
+    if k < 0 or tokens[k].value not in AGGREGATIONS:
+        return call
+    if close + 1 >= len(tokens) or tokens[close + 1].value != ")":
+        return call
+
+    end_index = close + 1
+    # Suffix form: agg ( fn(...) ) by (labels)
+    if (
+        grouping is None
+        and end_index + 2 < len(tokens)
+        and tokens[end_index + 1].value in ("by", "without")
+        and tokens[end_index + 2].value == "("
+    ):
+        label_close = _matching(tokens, end_index + 2)
+        grouping = (
+            tokens[end_index + 1].value,
+            tuple(
+                t.value.strip("\"'")
+                for t in tokens[end_index + 3 : label_close]
+                if t.value != ","
+            ),
+        )
+        end_index = label_close
+
+    return call._replace(
+        aggregation=tokens[k].value,
+        grouping=grouping,
+        start=tokens[k].start,
+        end=tokens[end_index].end,
+    )
+
+
+def format_matchers(matchers: List[Tuple[str, str, str]]) -> str:
+    if not matchers:
+        return ""
+    return "{" + ", ".join(f'{n}{op}"{v}"' for n, op, v in matchers) + "}"
@@ -0,0 +1,414 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import PosixPath
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+from monitoring.helpers import (
+    get_persistent_data_directory,
+    get_replica_count,
+    get_replica_hosts,
+    write_file_atomically,
+)
+from monitoring.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+from monitoring.promql import parse_duration
+
+logging.basicConfig(
+    level=logging.INFO,
+    stream=sys.stderr,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Comma separated, tried in order when one fails, defaults to all Prometheus replicas
+UPSTREAM_URLS = os.environ.get(
+    "QUERY_FRONTEND_UPSTREAM",
+    ",".join(
+        f"http://{host}:9090"
+        for host in get_replica_hosts(
+            "prometheus", get_replica_count("PROMETHEUS_REPLICAS")
+        )
+    ),
+).split(",")
+SPLIT_INTERVAL = int(os.environ.get("QUERY_FRONTEND_SPLIT_INTERVAL", "86400"))
+# Chunks ending within this window may still receive (remote written) samples
+MAX_FRESHNESS = int(os.environ.get("QUERY_FRONTEND_MAX_FRESHNESS", "600"))
+CONCURRENCY = int(os.environ.get("QUERY_FRONTEND_CONCURRENCY", "8"))
+CACHE_BYTES = int(os.environ.get("QUERY_FRONTEND_CACHE_BYTES", str(256 * 1024**2)))
+# Second tier on persistent-data, 0 disables it
+DISK_CACHE_BYTES = int(os.environ.get("QUERY_FRONTEND_DISK_CACHE_BYTES", str(1024**3)))
+# Prometheus' own limit on points per series of a range query
+MAX_POINTS = 11000
+
+CHUNKS = Counter(
+    "query_frontend_chunks_total",
+    "Range query chunks by source (memory, disk, live)",
+    ["source"],
+)
+REQUEST_DURATION = Histogram(
+    "query_frontend_request_duration_seconds",
+    "Time spent answering requests",
+    ["endpoint"],
+)
+FAILOVERS = Counter(
+    "query_frontend_upstream_failovers_total",
+    "Requests retried against another upstream, by the one that failed",
+    ["upstream"],
+)
+CACHE_SIZE = Gauge(
+    "query_frontend_cache_bytes",
+    "Bytes held by the chunk cache",
+    ["tier"],
+    callback=lambda: {
+        ("memory",): app.state.cache.memory_bytes,
+        ("disk",): app.state.cache.disk_bytes,
+    },
+)
+
+
+class ChunkCache:
+    """LRU of finished range query chunks, bounded by size.
+
+    Entries evicted from memory stay available on disk (when configured)
+    until the disk tier is over its own limit, oldest access first.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        path: Optional[PosixPath] = None,
+        max_disk_bytes: int = 0,
+    ):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        if self.path:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.disk_bytes = sum(p.stat().st_size for p in self.path.glob("*.json"))
+
+    def _disk_path(self, key: str) -> PosixPath:
+        return self.path / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def _remember(self, key: str, value: bytes) -> None:
+        if key in self._entries:
+            self.memory_bytes -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self.memory_bytes += len(value)
+        while self.memory_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def get(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        if (value := self._entries.get(key)) is not None:
+            self._entries.move_to_end(key)
+            return value, "memory"
+
+        if self.path:
+            disk_path = self._disk_path(key)
+            try:
+                value = disk_path.read_bytes()
+            except FileNotFoundError:
+                return None, None
+            # mtime tracks last access for eviction
+            os.utime(disk_path)
+            self._remember(key, value)
+            return value, "disk"
+        return None, None
+
+    def put(self, key: str, value: bytes) -> None:
+        self._remember(key, value)
+        if not self.path:
+            return
+
+        disk_path = self._disk_path(key)
+        try:
+            previous_size = disk_path.stat().st_size
+        except FileNotFoundError:
+            previous_size = 0
+        if write_file_atomically(disk_path, value.decode("utf-8")):
+            self.disk_bytes += len(value) - previous_size
+        if self.disk_bytes > self.max_disk_bytes:
+            for path in sorted(
+                self.path.glob("*.json"), key=lambda p: p.stat().st_mtime
+            ):
+                if self.disk_bytes <= self.max_disk_bytes * 0.9:
+                    break
+                self.disk_bytes -= path.stat().st_size
+                path.unlink(missing_ok=True)
+
+
+def parse_time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_step(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        if (seconds := parse_duration(value)) is None:
+            raise ValueError(f"Invalid step {value}")
+        return seconds
+
+
+def validate_range(start: float, end: float, step: float) -> None:
+    """Reject what Prometheus would, before the range is split into chunks."""
+    if not math.isfinite(step) or step <= 0:
+        raise ValueError("step must be a positive duration")
+    if not math.isfinite(start) or not math.isfinite(end):
+        raise ValueError("start and end must be finite")
+    if end < start:
+        raise ValueError("end must not be before start")
+    if (end - start) / step > MAX_POINTS:
+        raise ValueError(
+            f"exceeded maximum resolution of {MAX_POINTS} points per timeseries"
+        )
+
+
+def parse_range_params(params: Dict[str, str]) -> Tuple[str, float, float, float]:
+    """Query, start, end and step of a range query, raising ValueError if invalid."""
+    try:
+        query = params["query"]
+        start, end = parse_time(params["start"]), parse_time(params["end"])
+        step = parse_step(params["step"])
+    except KeyError as e:
+        raise ValueError(f"missing parameter {e}") from e
+    validate_range(start, end, step)
+    return query, start, end, step
+
+
+def split_range(
+    start: float, end: float, step: float, interval: int = SPLIT_INTERVAL
+) -> List[Tuple[float, float]]:
+    """Step aligned (start, end) chunks, each within one `interval` boundary.
+
+    Start and end are aligned down to the step so the evaluation timestamps,
+    and with them the chunk cache keys, are stable across refreshes.
+    """
+    validate_range(start, end, step)
+    start = math.floor(start / step) * step
+    end = math.floor(end / step) * step
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        boundary = (math.floor(chunk_start / interval) + 1) * interval
+        # Last evaluation timestamp before the next boundary
+        chunk_end = min(end, math.ceil(boundary / step) * step - step)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + step
+    return chunks
+
+
+def _merge(results: List[List[Dict]]) -> List[Dict]:
+    merged: Dict[str, Dict] = {}
+    for result in results:
+        for series in result:
+            key = json.dumps(series["metric"], sort_keys=True)
+            if key not in merged:
+                merged[key] = {"metric": series["metric"], "values": []}
+            merged[key]["values"].extend(series.get("values", []))
+    return list(merged.values())
+
+
+class UpstreamError(Exception):
+    """No usable response from any upstream, answered with `status_code`."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _error(status_code: int, error_type: str, message: str) -> JSONResponse:
+    return JSONResponse(
+        {"status": "error", "errorType": error_type, "error": message},
+        status_code=status_code,
+    )
+
+
+class QueryFrontend:
+    def __init__(self, client: httpx.AsyncClient, cache: ChunkCache):
+        self.client = client
+        self.cache = cache
+        self._semaphore = asyncio.Semaphore(CONCURRENCY)
+        # Stick to one replica so the chunks of a query come from the same TSDB
+        self._preferred = 0
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send to the preferred upstream, moving on to the next on errors."""
+        for attempt in range(len(UPSTREAM_URLS)):
+            index = (self._preferred + attempt) % len(UPSTREAM_URLS)
+            last = attempt == len(UPSTREAM_URLS) - 1
+            try:
+                r = await self.client.request(
+                    method, f"{UPSTREAM_URLS[index]}{path}", **kwargs
+                )
+            except httpx.TransportError as e:
+                if last:
+                    raise UpstreamError(503, f"No upstream reachable: {e}") from e
+            else:
+                if r.status_code < 500 or last:
+                    self._preferred = index
+                    return r
+            logger.warning(f"Upstream {UPSTREAM_URLS[index]} failed, trying the next")
+            FAILOVERS.inc(upstream=UPSTREAM_URLS[index])
+
+    async def _query_chunk(
+        self, query: str, start: float, end: float, step: float, cacheable: bool
+    ) -> Tuple[int, Dict]:
+        key = json.dumps([query, step, start, end])
+        if cacheable:
+            value, source = self.cache.get(key)
+            if value is not None:
+                CHUNKS.inc(source=source)
+                return 200, {"status": "success", "data": json.loads(value)}
+
+        async with self._semaphore:
+            r = await self.request(
+                "POST",
+                "/api/v1/query_range",
+                data={"query": query, "start": start, "end": end, "step": step},
+            )
+        CHUNKS.inc(source="live")
+        try:
+            body = r.json()
+            if body["status"] == "success" and not isinstance(
+                body["data"]["result"], list
+            ):
+                raise TypeError("result is not a list")
+        except (ValueError, KeyError, TypeError) as e:
+            raise UpstreamError(
+                502, f"Invalid response from upstream ({r.status_code}): {e!r}"
+            ) from e
+        if cacheable and r.status_code == 200 and not body.get("warnings"):
+            self.cache.put(key, json.dumps(body["data"]).encode("utf-8"))
+        return r.status_code, body
+
+    async def query_range(
+        self, query: str, start: float, end: float, step: float
+    ) -> Tuple[int, Dict]:
+        chunks = split_range(start, end, step)
+        # `@ start()`/`@ end()` results depend on the whole range, never cache those
+        cacheable = "@" not in query
+        complete_before = time.time() - MAX_FRESHNESS
+
+        responses = await asyncio.gather(
+            *(
+                self._query_chunk(
+                    query,
+                    chunk_start,
+                    chunk_end,
+                    step,
+                    cacheable and chunk_end < complete_before,
+                )
+                for chunk_start, chunk_end in chunks
+            )
+        )
+
+        for status, body in responses:
+            if status != 200 or body.get("status") != "success":
+                return status, body
+
+        warnings = [w for _, body in responses for w in body.get("warnings", [])]
+        response = {
+            "status": "success",
+            "data": {
+                "resultType": "matrix",
+                "result": _merge([body["data"]["result"] for _, body in responses]),
+            },
+        }
+        if warnings:
+            response["warnings"] = sorted(set(warnings))
+        return 200, response
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    async with httpx.AsyncClient(timeout=120) as client:
+        app.state.cache = ChunkCache(
+            CACHE_BYTES,
+            (
+                get_persistent_data_directory("query-frontend")
+                if DISK_CACHE_BYTES
+                else None
+            ),
+            DISK_CACHE_BYTES,
+        )
+        app.state.frontend = QueryFrontend(client, app.state.cache)
+        yield
+
+
+app = FastAPI(lifespan=_lifespan)
+
+
+async def _params(request: Request) -> Dict[str, str]:
+    params = dict(request.query_params)
+    if request.method == "POST":
+        params.update(parse_qsl((await request.body()).decode("utf-8")))
+    return params
+
+
+@app.api_route("/api/v1/query_range", methods=["GET", "POST"])
+async def query_range(request: Request):
+    with REQUEST_DURATION.time(endpoint="query_range"):
+        try:
+            query, start, end, step = parse_range_params(await _params(request))
+        except ValueError as e:
+            return _error(400, "bad_data", f"Invalid query_range parameters: {e}")
+        try:
+            status, body = await app.state.frontend.query_range(query, start, end, step)
+        except UpstreamError as e:
+            return _error(e.status_code, "unavailable", str(e))
+        return JSONResponse(body, status_code=status)
+
+
+@app.api_route("/api/{path:path}", methods=["GET", "POST"])
+async def proxy(request: Request, path: str):
+    # Everything else (instant queries, labels, metadata...) goes straight through
+    with REQUEST_DURATION.time(endpoint="proxy"):
+        try:
+            r = await app.state.frontend.request(
+                request.method,
+                f"/api/{path}",
+                params=request.query_params,
+                content=await request.body(),
+                headers={
+                    k: v
+                    for k, v in request.headers.items()
+                    if k.lower() in ("content-type", "accept")
+                },
+            )
+        except UpstreamError as e:
+            return _error(e.status_code, "unavailable", str(e))
+        return Response(
+            r.content,
+            status_code=r.status_code,
+            media_type=r.headers.get("content-type"),
+        )
+
+
+@app.get("/metrics")
+async def _render_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/health")
+async def _render_health():
+    return "OK"
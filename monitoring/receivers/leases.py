@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from pathlib import PosixPath
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseManager:
+    """Expiring per-key leases backed by lock files on a shared directory.
+
+    Lets several updater processes (uvicorn workers or replicas sharing
+    persistent-data) split the queue without editing the same page at the
+    same time. Leases are written to a unique file and hard linked into
+    place, so creating one is atomic and a lease is never seen half written.
+
+    Every change to an existing lease (takeover once expired, renewal,
+    release) first hard links it to a claim file named after its content.
+    Only one process can create that claim, and the claim is checked to
+    still have the content that was read, so a lease is only ever replaced
+    or removed by the single process that won it.
+    """
+
+    def __init__(self, path: PosixPath, ttl: float = 300):
+        self.path = path
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Content of the leases held by this process
+        self._held: Dict[str, str] = {}
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _lease_path(self, key: str) -> PosixPath:
+        return self.path / f"{key}.lease"
+
+    def _read(self, key: str) -> Optional[str]:
+        try:
+            return self._lease_path(key).read_text()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _expires_at(content: str) -> float:
+        try:
+            return json.loads(content)["expires_at"]
+        except (ValueError, KeyError, TypeError):
+            # Not written by us, never take it over
+            return float("inf")
+
+    def _write(self, key: str) -> PosixPath:
+        """A new lease in a file of its own, to be linked or renamed into place."""
+        content = json.dumps(
+            {
+                "owner": self.owner,
+                "expires_at": time.time() + self.ttl,
+                "nonce": uuid.uuid4().hex,
+            }
+        )
+        temporary = self.path / f"{key}.{uuid.uuid4().hex}.tmp"
+        temporary.write_text(content)
+        return temporary
+
+    def _claim(self, key: str, content: str) -> Optional[PosixPath]:
+        """Exclusive right to change the lease while it has `content`."""
+        claim_path = (
+            self.path
+            / f"{key}.{hashlib.sha1(content.encode('utf-8')).hexdigest()}.claim"
+        )
+        try:
+            os.link(self._lease_path(key), claim_path)
+        except FileNotFoundError:
+            return None
+        except FileExistsError:
+            # Another process is changing it, unless it died doing so
+            try:
+                if time.time() - claim_path.stat().st_ctime > self.ttl:
+                    logger.warning(f"Removing abandoned lease claim {claim_path}")
+                    claim_path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+            return None
+
+        if claim_path.read_text() != content:
+            # The lease changed since it was read, the claim linked the new one
+            claim_path.unlink(missing_ok=True)
+            return None
+        return claim_path
+
+    @property
+    def held(self) -> int:
+        return len(self._held)
+
+    def holds(self, key: str) -> bool:
+        return key in self._held
+
+    def acquire(self, key: str) -> bool:
+        if key in self._held:
+            # Held by another worker in this process
+            return False
+
+        temporary = self._write(key)
+        try:
+            try:
+                os.link(temporary, self._lease_path(key))
+            except FileExistsError:
+                pass
+            else:
+                self._held[key] = temporary.read_text()
+                return True
+
+            content = self._read(key)
+            if content is None or self._expires_at(content) > time.time():
+                return False
+
+            # Expired, the holder most likely crashed
+            if not (claim_path := self._claim(key, content)):
+                return False
+            self._held[key] = temporary.read_text()
+            os.replace(temporary, self._lease_path(key))
+            claim_path.unlink(missing_ok=True)
+            logger.warning(
+                f"Took over expired lease {key} from {json.loads(content)['owner']}"
+            )
+            return True
+        finally:
+            temporary.unlink(missing_ok=True)
+
+    def renew(self, key: str) -> bool:
+        """Extend a held lease once half its TTL has passed, False if it was lost."""
+        if not (content := self._held.get(key)):
+            return False
+        if self._expires_at(content) - time.time() > self.ttl / 2:
+            return True
+
+        temporary = self._write(key)
+        try:
+            if not (claim_path := self._claim(key, content)):
+                logger.warning(f"Lost lease {key}, it was taken over after expiring")
+                del self._held[key]
+                return False
+            self._held[key] = temporary.read_text()
+            os.replace(temporary, self._lease_path(key))
+            claim_path.unlink(missing_ok=True)
+            return True
+        finally:
+            temporary.unlink(missing_ok=True)
+
+    def release(self, key: str) -> None:
+        if not (content := self._held.pop(key, None)):
+            return
+
+        if claim_path := self._claim(key, content):
+            self._lease_path(key).unlink(missing_ok=True)
+            claim_path.unlink(missing_ok=True)
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class HostUnavailable(Exception):
+    """The host is backing off or its circuit is open, the call should be deferred."""
+
+    def __init__(self, host: str, retry_after: float, reason: str):
+        super().__init__(f"{host} unavailable for {retry_after:.0f}s: {reason}")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(
+        self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 300,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def remaining(self) -> float:
+        if self._opened_at is None:
+            return 0
+        return max(self.reset_timeout - (self._clock() - self._opened_at), 0)
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            # Let a single request through to see if the host has recovered
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self._opened_at is not None or self.failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+
+
+class HostGuard:
+    """Rate limit, server backoff and circuit breaker state for one wiki host."""
+
+    def __init__(
+        self,
+        host: str,
+        rate: float,
+        burst: int,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.host = host
+        self._clock = clock
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self._backoff_until = 0.0
+
+    def backoff_remaining(self) -> float:
+        return max(self._backoff_until - self._clock(), 0)
+
+    def retry_after(self) -> float:
+        """Seconds until a call to this host is expected to be allowed again."""
+        return max(self.backoff_remaining(), self.breaker.remaining())
+
+    async def acquire(self) -> None:
+        if remaining := self.backoff_remaining():
+            raise HostUnavailable(self.host, remaining, "server requested backoff")
+        if not self.breaker.allow():
+            raise HostUnavailable(
+                self.host, self.breaker.remaining(), "circuit breaker open"
+            )
+        await self.bucket.acquire()
+
+    def record_success(self) -> None:
+        self.breaker.record_success()
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        self.breaker.record_failure()
+        if retry_after:
+            logger.warning(f"{self.host} asked us to back off for {retry_after}s")
+            self._backoff_until = max(self._backoff_until, self._clock() + retry_after)
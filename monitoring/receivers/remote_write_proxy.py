@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+
+from monitoring import remote_write
+from monitoring.helpers import get_replica_count, get_replica_hosts
+from monitoring.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+from monitoring.receivers.series_processor import SeriesProcessor, load_config
+
+logging.basicConfig(
+    level=logging.INFO,
+    stream=sys.stderr,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Comma separated, every upstream (by default each Prometheus replica) gets all samples
+UPSTREAM_URLS = os.environ.get(
+    "REMOTE_WRITE_PROXY_UPSTREAM",
+    ",".join(
+        f"http://{host}:9090/api/v1/write"
+        for host in get_replica_hosts(
+            "prometheus", get_replica_count("PROMETHEUS_REPLICAS")
+        )
+    ),
+).split(",")
+# Small incoming batches are merged up to this many samples per upstream request
+BATCH_SAMPLES = int(os.environ.get("REMOTE_WRITE_PROXY_BATCH_SAMPLES", "2000"))
+FLUSH_INTERVAL = float(os.environ.get("REMOTE_WRITE_PROXY_FLUSH_INTERVAL", "5"))
+AGGREGATION_INTERVAL = float(
+    os.environ.get("REMOTE_WRITE_PROXY_AGGREGATION_INTERVAL", "30")
+)
+# Samples buffered (pending and queued for a healthy upstream) before clients are
+# pushed back, also the most queued for any one upstream before its oldest are dropped
+MAX_PENDING_SAMPLES = int(
+    os.environ.get("REMOTE_WRITE_PROXY_MAX_PENDING_SAMPLES", "200000")
+)
+MAX_RETRY_DELAY = 30
+SHUTDOWN_TIMEOUT = 30
+
+SAMPLES = Counter(
+    "remote_write_proxy_samples_total",
+    "Samples by result (received, dropped, aggregated)",
+    ["result"],
+)
+UPSTREAM_SAMPLES = Counter(
+    "remote_write_proxy_upstream_samples_total",
+    "Samples per upstream by result (forwarded, rejected, dropped)",
+    ["upstream", "result"],
+)
+REQUESTS = Counter(
+    "remote_write_proxy_requests_total",
+    "Incoming remote write requests by response code",
+    ["code"],
+)
+FORWARD_DURATION = Histogram(
+    "remote_write_proxy_forward_duration_seconds",
+    "Time spent sending batches upstream",
+    ["upstream", "outcome"],
+)
+PENDING_SAMPLES = Gauge(
+    "remote_write_proxy_pending_samples",
+    "Samples buffered in the proxy",
+    callback=lambda: {(): app.state.proxy.buffered_samples},
+)
+UPSTREAM_QUEUED_SAMPLES = Gauge(
+    "remote_write_proxy_upstream_queued_samples",
+    "Samples queued for an upstream, including the batch being sent",
+    ["upstream"],
+    callback=lambda: {
+        (upstream.url,): upstream.queued_samples
+        for upstream in app.state.proxy.upstreams
+    },
+)
+AGGREGATED_SERIES = Gauge(
+    "remote_write_proxy_aggregated_input_series",
+    "Input series currently folded into aggregates",
+    callback=lambda: {(): app.state.proxy.processor.aggregated_series},
+)
+
+
+class _Upstream:
+    """Batches waiting for one upstream, bounded by dropping the oldest."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.batches: Deque[Tuple[List[remote_write.TimeSeries], bytes, int]] = deque()
+        self.queued_samples = 0
+        # Whether the last send succeeded, failing upstreams do not push back
+        self.healthy = True
+        self.wakeup = asyncio.Event()
+
+    def put(self, batch: List[remote_write.TimeSeries], body: bytes, size: int) -> None:
+        self.batches.append((batch, body, size))
+        self.queued_samples += size
+        while self.queued_samples > MAX_PENDING_SAMPLES and len(self.batches) > 1:
+            _, _, dropped = self.batches.popleft()
+            self.queued_samples -= dropped
+            UPSTREAM_SAMPLES.inc(dropped, upstream=self.url, result="dropped")
+            logger.warning(f"Dropped {dropped} samples queued for {self.url}")
+        self.wakeup.set()
+
+
+class RemoteWriteProxy:
+    """Buffer processed series and forward them upstream in merged batches.
+
+    Each upstream has a single forwarder sending batches in order, so
+    samples of a series never overtake each other. Upstream failures are
+    retried, which holds samples in that upstream's queue. Clients are
+    pushed back with a 503 once the buffer for the healthy upstreams is
+    full (or for all of them, when none is healthy); an upstream that is
+    down (e.g. a restarting replica) instead drops its own oldest samples,
+    so it does not hold up the others.
+    """
+
+    def __init__(self, processor: SeriesProcessor, client: httpx.AsyncClient):
+        self.processor = processor
+        self.client = client
+        self.pending: Dict[remote_write.Labels, Dict[int, float]] = {}
+        self.pending_samples = 0
+        self.upstreams = [_Upstream(url) for url in UPSTREAM_URLS]
+        self.flush_requested = asyncio.Event()
+
+    @property
+    def queued_samples(self) -> int:
+        return max(upstream.queued_samples for upstream in self.upstreams)
+
+    @property
+    def buffered_samples(self) -> int:
+        """Samples counting towards client push back."""
+        healthy = [u.queued_samples for u in self.upstreams if u.healthy]
+        return self.pending_samples + (max(healthy) if healthy else self.queued_samples)
+
+    def add(self, timeseries: List[remote_write.TimeSeries]) -> None:
+        for series in timeseries:
+            samples = self.pending.setdefault(series.labels, {})
+            before = len(samples)
+            # Duplicates (e.g. series collapsed by dropped labels) keep the last value
+            samples.update((timestamp, value) for value, timestamp in series.samples)
+            self.pending_samples += len(samples) - before
+        if self.pending_samples >= BATCH_SAMPLES:
+            self.flush_requested.set()
+
+    def _take_batches(self) -> List[Tuple[List[remote_write.TimeSeries], int]]:
+        batches, batch, size = [], [], 0
+        for labels, samples in self.pending.items():
+            batch.append(
+                remote_write.TimeSeries(
+                    labels,
+                    [
+                        (value, timestamp)
+                        for timestamp, value in sorted(samples.items())
+                    ],
+                )
+            )
+            size += len(samples)
+            if size >= BATCH_SAMPLES:
+                batches.append((batch, size))
+                batch, size = [], 0
+        if batch:
+            batches.append((batch, size))
+
+        self.pending = {}
+        self.pending_samples = 0
+        return batches
+
+    @staticmethod
+    async def _encode(batch: List[remote_write.TimeSeries]) -> bytes:
+        return await asyncio.to_thread(
+            lambda: remote_write.snappy_compress(
+                remote_write.encode_write_request(batch)
+            )
+        )
+
+    async def flush(self) -> None:
+        for batch, size in self._take_batches():
+            body = await self._encode(batch)
+            for upstream in self.upstreams:
+                upstream.put(batch, body, size)
+
+    async def flusher(self) -> None:
+        next_aggregation = time.monotonic() + AGGREGATION_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_requested.clear()
+
+            if time.monotonic() >= next_aggregation:
+                next_aggregation += AGGREGATION_INTERVAL
+                self.add(self.processor.aggregated(int(time.time() * 1000)))
+            await self.flush()
+
+    async def _send(self, upstream: str, body: bytes) -> Optional[str]:
+        """Returns the outcome, None if the batch should be retried."""
+        with FORWARD_DURATION.time(upstream=upstream, outcome="error") as labels:
+            try:
+                r = await self.client.post(
+                    upstream, content=body, headers=remote_write.HEADERS
+                )
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to forward batch to {upstream}: {e}")
+                return None
+
+            if r.status_code == 429 or r.status_code >= 500:
+                logger.warning(
+                    f"Upstream {upstream} unavailable: [{r.status_code}] {r.text}"
+                )
+                return None
+            if r.status_code >= 400:
+                # Retrying as is will not help (e.g. out of order samples)
+                logger.error(
+                    f"Upstream {upstream} rejected batch: [{r.status_code}] {r.text}"
+                )
+                labels["outcome"] = "rejected"
+                return "rejected"
+
+            labels["outcome"] = "forwarded"
+            return "forwarded"
+
+    async def forwarder(self, upstream: _Upstream) -> None:
+        while True:
+            if not upstream.batches:
+                upstream.wakeup.clear()
+                await upstream.wakeup.wait()
+                continue
+
+            batch, body, size = upstream.batches.popleft()
+            await self._deliver(upstream, batch, body, size)
+            upstream.queued_samples -= size
+
+    async def _deliver(
+        self,
+        upstream: _Upstream,
+        batch: List[remote_write.TimeSeries],
+        body: bytes,
+        size: int,
+    ) -> None:
+        delay = 1
+        while (outcome := await self._send(upstream.url, body)) is None:
+            upstream.healthy = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+        upstream.healthy = True
+
+        if outcome == "rejected" and len(batch) > 1:
+            # Batches merge several clients, Prometheus rejects the whole write for
+            # one bad sample (e.g. out of order), find it by halving the batch
+            middle = len(batch) // 2
+            for half in (batch[:middle], batch[middle:]):
+                await self._deliver(
+                    upstream,
+                    half,
+                    await self._encode(half),
+                    sum(len(series.samples) for series in half),
+                )
+            return
+        UPSTREAM_SAMPLES.inc(size, upstream=upstream.url, result=outcome)
+
+    async def drained(self) -> None:
+        while any(upstream.queued_samples for upstream in self.upstreams):
+            await asyncio.sleep(0.1)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    async with httpx.AsyncClient(timeout=30) as client:
+        app.state.proxy = RemoteWriteProxy(SeriesProcessor(load_config()), client)
+        flusher = asyncio.create_task(app.state.proxy.flusher())
+        forwarders = [
+            asyncio.create_task(app.state.proxy.forwarder(upstream))
+            for upstream in app.state.proxy.upstreams
+        ]
+        yield
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+
+        # Hand over what is buffered before exiting, unless upstream is down
+        await app.state.proxy.flush()
+        try:
+            await asyncio.wait_for(app.state.proxy.drained(), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Dropping {app.state.proxy.queued_samples} samples on shutdown"
+            )
+        for forwarder in forwarders:
+            forwarder.cancel()
+        await asyncio.gather(*forwarders, return_exceptions=True)
+
+
+app = FastAPI(lifespan=_lifespan)
+
+
+def _respond(code: int, body: str = "") -> Response:
+    REQUESTS.inc(code=str(code))
+    if code == 204:
+        return Response(status_code=code)
+    headers = {"Retry-After": str(int(FLUSH_INTERVAL))} if code == 503 else None
+    return PlainTextResponse(body, status_code=code, headers=headers)
+
+
+@app.post("/api/v1/write")
+async def write(request: Request):
+    proxy: RemoteWriteProxy = app.state.proxy
+    if request.headers.get("content-encoding") != remote_write.CONTENT_ENCODING:
+        return _respond(415, "Only snappy encoded remote write is supported")
+
+    if proxy.buffered_samples >= MAX_PENDING_SAMPLES:
+        # Remote write clients retry 5xx responses, keeping the samples on their side
+        return _respond(503, "Buffer full, retry later")
+
+    body = await request.body()
+    try:
+        timeseries = await asyncio.to_thread(
+            lambda: remote_write.decode_write_request(
+                remote_write.snappy_decompress(body)
+            )
+        )
+    except (remote_write.DecodeError, UnicodeDecodeError) as e:
+        return _respond(400, str(e))
+
+    forwarded, dropped, aggregated = proxy.processor.process(timeseries)
+    SAMPLES.inc(sum(len(series.samples) for series in timeseries), result="received")
+    SAMPLES.inc(dropped, result="dropped")
+    SAMPLES.inc(aggregated, result="aggregated")
+    proxy.add(forwarded)
+    return _respond(204)
+
+
+@app.get("/metrics")
+async def _render_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/health")
+async def _render_health():
+    return "OK"
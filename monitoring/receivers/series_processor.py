@@ -0,0 +1,210 @@
+import os
+import re
+from pathlib import PosixPath
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+from pydantic import BaseModel
+
+from monitoring.remote_write import Labels, TimeSeries
+
+DEFAULT_CONFIG_PATH = (
+    PosixPath(__file__).parent.parent.parent / "remote-write-proxy.yml"
+)
+
+
+class DropRule(BaseModel):
+    # Label name to (fully anchored) regex, all must match for the series to be dropped
+    match: Dict[str, str]
+
+
+class RelabelRule(BaseModel):
+    source_labels: List[str]
+    separator: str = ";"
+    regex: str = "(.*)"
+    target_label: str
+    replacement: str = "$1"
+
+
+class AggregateRule(BaseModel):
+    match: Dict[str, str] = {}
+    # Labels summed away, e.g. per-pod labels
+    without: List[str]
+    # Members are counters, member resets and stale members do not lower the sum
+    counter: bool = False
+
+
+class ProxyConfig(BaseModel):
+    drop: List[DropRule] = []
+    relabel: List[RelabelRule] = []
+    drop_labels: List[str] = []
+    aggregate: List[AggregateRule] = []
+
+
+def get_config_path() -> PosixPath:
+    if path := os.environ.get("REMOTE_WRITE_PROXY_CONFIG"):
+        return PosixPath(path)
+    return DEFAULT_CONFIG_PATH
+
+
+def load_config(path: Optional[PosixPath] = None) -> ProxyConfig:
+    with (path or get_config_path()).open("r") as fh:
+        return ProxyConfig.model_validate(yaml.safe_load(fh) or {})
+
+
+def _matches(patterns: Dict[str, re.Pattern], labels: Dict[str, str]) -> bool:
+    return all(
+        pattern.fullmatch(labels.get(name, "")) for name, pattern in patterns.items()
+    )
+
+
+_REFERENCE = re.compile(r"\$(?:(\$)|\{(\w+)\}|(\w+))")
+
+
+def _expand(match: re.Match, replacement: str) -> str:
+    """Prometheus (Go regexp) style expansion of `$1`, `${1}`, `$name` and `$$`.
+
+    As in Go, `$name` takes the longest run of word characters (`$1foo` is
+    the group named `1foo`) and unknown or unmatched groups expand to nothing.
+    """
+
+    def group(reference: re.Match) -> str:
+        if reference.group(1):
+            return "$"
+        name = reference.group(2) or reference.group(3)
+        try:
+            value = match.group(int(name) if name.isdigit() else name)
+        except IndexError:
+            return ""
+        return value or ""
+
+    return _REFERENCE.sub(group, replacement)
+
+
+class _Group:
+    def __init__(self, counter: bool):
+        self.counter = counter
+        # Latest (timestamp, value) per member series
+        self.members: Dict[Labels, Tuple[int, float]] = {}
+        # Counters only, increases of all members (including gone ones) since first seen
+        self.total = 0.0
+        self.updated = False
+
+    def add(self, member: Labels, timestamp: int, value: float) -> None:
+        if (previous := self.members.get(member)) is None:
+            # A counter's first sample is its baseline, earlier increases are unknown
+            self.members[member] = (timestamp, value)
+        elif timestamp > previous[0] or (not self.counter and timestamp == previous[0]):
+            if self.counter:
+                self.total += value - previous[1] if value >= previous[1] else value
+            self.members[member] = (timestamp, value)
+        else:
+            return
+        self.updated = True
+
+    @property
+    def value(self) -> float:
+        if self.counter:
+            return self.total
+        return sum(value for _, value in self.members.values())
+
+
+class SeriesProcessor:
+    """Apply the proxy rules to decoded remote write series.
+
+    Rules run in order: drop, relabel, drop_labels then aggregate. Series
+    matching an aggregate rule are not forwarded, instead the latest value of
+    every member is kept and their sum is emitted by `aggregated()`. Members
+    without a sample within `staleness` are dropped from the sum; for counter
+    rules the sum is of member increases instead, so it never goes down when
+    a member resets or goes away.
+    """
+
+    def __init__(self, config: ProxyConfig, staleness: float = 300):
+        self.staleness_ms = int(staleness * 1000)
+        self._drop = [
+            {name: re.compile(regex) for name, regex in rule.match.items()}
+            for rule in config.drop
+        ]
+        self._relabel = [(rule, re.compile(rule.regex)) for rule in config.relabel]
+        self._drop_labels = set(config.drop_labels)
+        self._aggregate = [
+            (
+                {name: re.compile(regex) for name, regex in rule.match.items()},
+                set(rule.without),
+                rule.counter,
+            )
+            for rule in config.aggregate
+        ]
+        self._groups: Dict[Labels, _Group] = {}
+
+    @property
+    def aggregated_series(self) -> int:
+        return sum(len(group.members) for group in self._groups.values())
+
+    def _relabelled(self, labels: Dict[str, str]) -> Dict[str, str]:
+        for rule, regex in self._relabel:
+            value = rule.separator.join(
+                labels.get(name, "") for name in rule.source_labels
+            )
+            if match := regex.fullmatch(value):
+                if result := _expand(match, rule.replacement):
+                    labels[rule.target_label] = result
+                else:
+                    labels.pop(rule.target_label, None)
+        for name in self._drop_labels:
+            labels.pop(name, None)
+        return labels
+
+    def process(
+        self, timeseries: List[TimeSeries]
+    ) -> Tuple[List[TimeSeries], int, int]:
+        """Returns the series to forward as is, and the number of dropped and aggregated samples."""
+        forwarded: List[TimeSeries] = []
+        dropped = aggregated = 0
+        for series in timeseries:
+            labels = dict(series.labels)
+            if any(_matches(rule, labels) for rule in self._drop):
+                dropped += len(series.samples)
+                continue
+
+            labels = self._relabelled(labels)
+            if not series.samples or "__name__" not in labels:
+                dropped += len(series.samples)
+                continue
+
+            for match, without, counter in self._aggregate:
+                if _matches(match, labels):
+                    key = tuple(
+                        sorted((n, v) for n, v in labels.items() if n not in without)
+                    )
+                    group = self._groups.setdefault(key, _Group(counter))
+                    member = tuple(sorted(labels.items()))
+                    for value, timestamp in sorted(
+                        series.samples, key=lambda sample: sample[1]
+                    ):
+                        group.add(member, timestamp, value)
+                    aggregated += len(series.samples)
+                    break
+            else:
+                forwarded.append(
+                    TimeSeries(tuple(sorted(labels.items())), series.samples)
+                )
+        return forwarded, dropped, aggregated
+
+    def aggregated(self, timestamp: int) -> List[TimeSeries]:
+        """Sum of the latest member values for groups updated since the last call."""
+        output = []
+        for key, group in list(self._groups.items()):
+            group.members = {
+                member: sample
+                for member, sample in group.members.items()
+                if timestamp - sample[0] <= self.staleness_ms
+            }
+            if not group.members:
+                del self._groups[key]
+                continue
+            if group.updated:
+                group.updated = False
+                output.append(TimeSeries(key, [(group.value, timestamp)]))
+        return output
@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import time
+from pathlib import PosixPath
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AppliedStateStore:
+    """Last status applied to a page per alert fingerprint.
+
+    Alertmanager re-sends unchanged notifications every group/repeat interval,
+    anything we have already applied within the TTL can be skipped without
+    talking to the wiki. Entries are stored in a single JSON file and expire
+    after the TTL, after which the page is checked against the wiki again.
+    """
+
+    def __init__(self, path: PosixPath, ttl: float = 3600):
+        self.path = path
+        self.ttl = ttl
+        self._state: Dict[str, Dict] = {}
+        self._load()
+
+    @staticmethod
+    def _key(host: str, page: str, fingerprint: str) -> str:
+        return f"{host}\n{page}\n{fingerprint}"
+
+    def _load(self) -> None:
+        try:
+            self._state = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            self._state = {}
+        except ValueError as e:
+            logger.error(f"Discarding corrupt state store {self.path}: {e}")
+            self._state = {}
+
+    def _save(self) -> None:
+        temporary = self.path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(json.dumps(self._state))
+        os.replace(temporary, self.path)
+
+    def _expire(self) -> None:
+        now = time.time()
+        self._state = {
+            key: entry
+            for key, entry in self._state.items()
+            if now - entry["applied_at"] < self.ttl
+        }
+
+    def is_current(
+        self, host: str, page: str, fingerprint: Optional[str], running: bool
+    ) -> bool:
+        if not fingerprint:
+            return False
+
+        entry = self._state.get(self._key(host, page, fingerprint))
+        return (
+            entry is not None
+            and entry["running"] == running
+            and time.time() - entry["applied_at"] < self.ttl
+        )
+
+    def record(
+        self, host: str, page: str, fingerprint: Optional[str], running: bool
+    ) -> None:
+        if not fingerprint:
+            return
+
+        # Pick up entries recorded by other processes sharing the file
+        self._load()
+        self._expire()
+        self._state[self._key(host, page, fingerprint)] = {
+            "running": running,
+            "applied_at": time.time(),
+        }
+        self._save()
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from pathlib import PosixPath
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from monitoring.receivers.leases import LeaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class PageUpdate(BaseModel):
+    host: str
+    page: str
+    running: bool
+    info: Optional[str] = None
+    fingerprint: Optional[str] = None
+    enqueued_at: float = Field(default_factory=time.time)
+    attempts: int = 0
+    next_attempt_at: float = 0
+    version: str = Field(default_factory=lambda: uuid.uuid4().hex)
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha1(f"{self.host}\n{self.page}".encode("utf-8")).hexdigest()
+
+
+class UpdateQueue:
+    """Bounded, on-disk queue of pending page updates.
+
+    Only the latest desired state per host/page is kept, a newer update
+    supersedes any pending one (keeping the original enqueue time so the
+    reported age reflects how stale the page is). Each entry is a JSON file
+    written atomically, so pending updates survive a restart.
+
+    Updates are claimed through per-page leases, so several processes can
+    drain the same queue directory; processes poll for entries queued by
+    others every `poll_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        path: PosixPath,
+        max_size: int = 1000,
+        max_attempts: int = 10,
+        base_backoff: float = 5,
+        max_backoff: float = 900,
+        leases: Optional[LeaseManager] = None,
+        poll_interval: float = 5,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.leases = leases or LeaseManager(self.path / "leases")
+        self._wakeup = asyncio.Event()
+
+    def _item_path(self, key: str) -> PosixPath:
+        return self.path / f"{key}.json"
+
+    def _read(self, path: PosixPath) -> Optional[PageUpdate]:
+        try:
+            return PageUpdate.model_validate_json(path.read_text())
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.error(f"Discarding corrupt queue entry {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def _write(self, item: PageUpdate) -> None:
+        target = self._item_path(item.key)
+        temporary = target.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(item.model_dump_json())
+        os.replace(temporary, target)
+
+    def items(self) -> List[PageUpdate]:
+        return [
+            item
+            for path in self.path.glob("*.json")
+            if (item := self._read(path)) is not None
+        ]
+
+    def stats(self) -> Dict[str, float]:
+        items = self.items()
+        return {
+            "depth": len(items),
+            "oldest_age_seconds": (
+                time.time() - min(item.enqueued_at for item in items) if items else 0
+            ),
+        }
+
+    def pending(self, item: PageUpdate) -> Optional[PageUpdate]:
+        """The update queued for the same page, if any."""
+        return self._read(self._item_path(item.key))
+
+    def put(self, item: PageUpdate) -> None:
+        if existing := self._read(self._item_path(item.key)):
+            item.enqueued_at = min(item.enqueued_at, existing.enqueued_at)
+        elif len(list(self.path.glob("*.json"))) >= self.max_size:
+            raise QueueFull(f"Queue is full ({self.max_size} entries)")
+
+        self._write(item)
+        self._wakeup.set()
+
+    async def claim(self) -> List[PageUpdate]:
+        """Wait for due updates that no other worker is handling.
+
+        All due updates for the same host are returned together, so they can
+        be checked against the wiki in a single batched query.
+        """
+        while True:
+            now = time.time()
+            next_due = None
+            batch: List[PageUpdate] = []
+            for item in sorted(self.items(), key=lambda i: i.enqueued_at):
+                if item.next_attempt_at > now:
+                    next_due = min(
+                        next_due or item.next_attempt_at, item.next_attempt_at
+                    )
+                    continue
+                if batch and batch[0].host != item.host:
+                    continue
+                if not self.leases.acquire(item.key):
+                    # Being handled by another worker or process
+                    continue
+
+                # Re-read under the lease, the holder before us may have completed it
+                if current := self._read(self._item_path(item.key)):
+                    batch.append(current)
+                else:
+                    self.leases.release(item.key)
+
+            if batch:
+                return batch
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=min(
+                        max(next_due - now, 0.1) if next_due else self.poll_interval,
+                        self.poll_interval,
+                    ),
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def ack(self, item: PageUpdate) -> None:
+        """Remove a completed update, unless it has been superseded in the meantime."""
+        current = self._read(self._item_path(item.key))
+        if current and current.version == item.version:
+            self._item_path(item.key).unlink(missing_ok=True)
+        else:
+            self._wakeup.set()
+        self.leases.release(item.key)
+
+    def retry(self, item: PageUpdate, min_delay: float = 0) -> None:
+        """Schedule a failed update again with exponential backoff."""
+        try:
+            self._reschedule(item, min_delay)
+        finally:
+            self.leases.release(item.key)
+
+    def _reschedule(self, item: PageUpdate, min_delay: float) -> None:
+        current = self._read(self._item_path(item.key))
+        if not current or current.version != item.version:
+            # Superseded by a newer update, which will be processed instead
+            self._wakeup.set()
+            return
+
+        current.attempts += 1
+        if current.attempts >= self.max_attempts:
+            logger.error(
+                f"Giving up on {current.host}/{current.page} after {current.attempts} attempts"
+            )
+            self._item_path(item.key).unlink(missing_ok=True)
+            return
+
+        delay = max(
+            min(self.base_backoff * 2 ** (current.attempts - 1), self.max_backoff),
+            min_delay,
+        )
+        current.next_attempt_at = time.time() + delay
+        logger.info(
+            f"Retrying {current.host}/{current.page} in {delay}s (attempt {current.attempts})"
+        )
+        self._write(current)
@@ -1,14 +1,26 @@
+import asyncio
 import logging
 import os
 import sys
-from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
+from typing import List, Dict, Optional, Tuple
 
-import requests
-from fastapi import FastAPI
+import httpx
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
 
-RUNNING_TEXT = "Running"
-NOT_RUNNING_TEXT = "Not Running"
+from monitoring.helpers import get_persistent_data_directory
+from monitoring.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+from monitoring.receivers.leases import LeaseManager
+from monitoring.receivers.rate_limit import HostUnavailable
+from monitoring.receivers.state_store import AppliedStateStore
+from monitoring.receivers.update_queue import PageUpdate, QueueFull, UpdateQueue
+from monitoring.receivers.wikipedia import (
+    PageRevision,
+    Wikipedia,
+    close_wiki_sessions,
+    get_wiki_session,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,7 +28,41 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 logger = logging.getLogger(__name__)
-app = FastAPI()
+
+# Number of workers draining the queue, i.e. host/page pairs updated concurrently
+MAX_CONCURRENT_UPDATES = int(os.environ.get("WIKI_UPDATER_CONCURRENCY", "4"))
+MAX_QUEUE_SIZE = int(os.environ.get("WIKI_UPDATER_QUEUE_SIZE", "1000"))
+MAX_UPDATE_ATTEMPTS = int(os.environ.get("WIKI_UPDATER_MAX_ATTEMPTS", "10"))
+# How long an applied status is trusted before the page is checked on the wiki again
+STATE_TTL = int(os.environ.get("WIKI_UPDATER_STATE_TTL", "3600"))
+# How long a process may hold a page before another one can take it over
+LEASE_TTL = int(os.environ.get("WIKI_UPDATER_LEASE_TTL", "300"))
+
+WEBHOOK_DURATION = Histogram(
+    "wiki_updater_webhook_duration_seconds",
+    "Time spent handling alertmanager webhooks",
+    ["outcome"],
+)
+PAGES = Counter(
+    "wiki_updater_pages_total",
+    "Page updates by result (updated, skipped, deduplicated, failed)",
+    ["host", "result"],
+)
+QUEUE_DEPTH = Gauge(
+    "wiki_updater_queue_depth",
+    "Number of pending page updates",
+    callback=lambda: {(): app.state.queue.stats()["depth"]},
+)
+LEASES_HELD = Gauge(
+    "wiki_updater_leases_held",
+    "Number of page leases held by this process",
+    callback=lambda: {(): app.state.queue.leases.held},
+)
+QUEUE_OLDEST_AGE = Gauge(
+    "wiki_updater_queue_oldest_age_seconds",
+    "Age of the oldest pending page update",
+    callback=lambda: {(): app.state.queue.stats()["oldest_age_seconds"]},
+)
 
 
 # Define models for better type safety
@@ -24,6 +70,7 @@ class Alert(BaseModel):
     status: str
     labels: Dict[str, str]
     annotations: Dict[str, str]
+    fingerprint: Optional[str] = None
 
 
 class WebhookPayload(BaseModel):
@@ -31,149 +78,111 @@ class WebhookPayload(BaseModel):
     alerts: List[Alert]
 
 
-class Wikipedia:
-    def __init__(
-        self, host: str, page: str, username: Optional[str], password: Optional[str]
-    ):
-        self.host = host
-        self.page = page
-        self._session = requests.session()
-
-        if username and password:
-            if not self._login(username, password):
-                logger.warning(f"Failed to authenticate on {host}")
-
-    def _get_csrf_token(self) -> Optional[str]:
-        r = self._session.get(
-            f"https://{self.host}/w/api.php",
-            headers={
-                "User-Agent": "ClueBot NG Monitoring - Wiki Updater",
-            },
-            params={
-                "action": "query",
-                "meta": "tokens",
-                "type": "csrf",
-                "assert": "user",
-                "format": "json",
-            },
-        )
-        if r.status_code == 200:
-            return r.json().get("query", {}).get("tokens", {}).get("csrftoken")
-
-        logger.warning(
-            f"Failed to get CSRF token for {self.host}/{self.page}: [{r.status_code}] {r.text}"
-        )
-        return None
-
-    def _get_login_token(self) -> Optional[str]:
-        r = self._session.get(
-            f"https://{self.host}/w/api.php",
-            headers={
-                "User-Agent": "ClueBot NG Monitoring - Wiki Updater",
-            },
-            params={
-                "action": "query",
-                "meta": "tokens",
-                "type": "login",
-                "format": "json",
-            },
-        )
-        if r.status_code == 200:
-            return r.json().get("query", {}).get("tokens", {}).get("logintoken")
+async def _update_page(
+    wikipedia: Wikipedia, update: PageUpdate, revision: Optional[PageRevision]
+) -> bool:
+    if revision is None:
+        logger.warning(f"No revision returned for {update.host}/{update.page}")
+        return False
 
-        logger.warning(
-            f"Failed to get LOGIN token for {self.host}/{self.page}: [{r.status_code}] {r.text}"
-        )
-        return None
-
-    def _login(self, username: str, password: str) -> bool:
-        login_token = self._get_login_token()
-        if not login_token:
-            return False
-
-        r = self._session.post(
-            f"https://{self.host}/w/api.php",
-            headers={
-                "User-Agent": "ClueBot NG Reviewer - Wikipedia - Login",
-            },
-            data={
-                "format": "json",
-                "action": "login",
-                "lgname": username,
-                "lgpassword": password,
-                "lgtoken": login_token,
-            },
+    if not wikipedia.page_requires_updating(revision, update.running):
+        logger.info(
+            f"Page does not require update {update.host}/{update.page} ({update.running})"
         )
-        if r.status_code != 200:
-            logger.warning(
-                f"Could not login to {self.host}: [{r.status_code}] {r.text}"
-            )
-            return False
-
-        response = r.json()
-        if response.get("login", {}).get("result") != "Success":
-            logger.warning(f"Login failed to {self.host}: {response}")
-            return False
-
+        PAGES.inc(host=update.host, result="skipped")
         return True
 
-    def page_requires_updating(self, running: bool) -> bool:
-        r = self._session.get(
-            f"https://{self.host}/w/index.php",
-            headers={
-                "User-Agent": "ClueBot NG Monitoring - Wiki Updater",
-            },
-            params={
-                "title": self.page,
-                "action": "raw",
-            },
-        )
-        if r.status_code != 200:
-            logger.warning(
-                f"Could not fetch {self.host}/{self.page}: [{r.status_code}] {r.text}"
-            )
-            return False
-
-        expected_text = RUNNING_TEXT if running else NOT_RUNNING_TEXT
-        return not r.text.strip().startswith(expected_text)
-
-    def update_page(self, running: bool, info: Optional[str]) -> bool:
-        csrf_token = self._get_csrf_token()
-        if not csrf_token:
-            return False
-
-        text = RUNNING_TEXT if running else NOT_RUNNING_TEXT
-        if info:
-            text = f"{text}: {info}"
-
-        r = self._session.post(
-            f"https://{self.host}/w/api.php",
-            headers={
-                "User-Agent": "ClueBot NG Monitoring - Wiki Updater",
-            },
-            data={
-                "action": "edit",
-                "token": csrf_token,
-                "format": "json",
-                "assert": "user",
-                "title": self.page,
-                "text": text,
-                "summary": "Updating status from alerts",
-            },
+    logger.info(f"Updating {update.host}/{update.page} -> {update.running}")
+    if not await wikipedia.update_page(revision, update.running, update.info):
+        logger.error(
+            f"Failed to update {update.host}/{update.page} -> {update.running}"
         )
-
-        if r.status_code != 200:
-            logger.warning(
-                f"Failed to edit {self.host}/{self.page}: [{r.status_code}] {r.text}"
-            )
-            return False
-
-        return True
+        return False
+
+    PAGES.inc(host=update.host, result="updated")
+    return True
+
+
+async def _update_pages(
+    queue: UpdateQueue, updates: List[PageUpdate]
+) -> List[PageUpdate]:
+    """Apply a batch of updates for a single host, returning those that succeeded."""
+    wikipedia = Wikipedia(updates[0].host)
+    completed = []
+    try:
+        revisions = await wikipedia.fetch_pages([update.page for update in updates])
+        if revisions is None:
+            return completed
+
+        for update in updates:
+            # A slow batch must not outlive its leases, renew them as we go
+            if not queue.leases.renew(update.key):
+                continue
+            if await _update_page(wikipedia, update, revisions.get(update.page)):
+                completed.append(update)
+    except HostUnavailable as e:
+        logger.warning(f"Deferring updates for {updates[0].host}: {e}")
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to update pages on {updates[0].host}: {e}")
+
+    return completed
+
+
+async def _worker(queue: UpdateQueue, state_store: AppliedStateStore) -> None:
+    while True:
+        updates = await queue.claim()
+        try:
+            completed = await _update_pages(queue, updates)
+        except Exception:
+            logger.exception(f"Unexpected error updating pages on {updates[0].host}")
+            completed = []
+
+        for update in updates:
+            if update in completed:
+                state_store.record(
+                    update.host, update.page, update.fingerprint, update.running
+                )
+                queue.ack(update)
+            elif not queue.leases.holds(update.key):
+                # Taken over by another process after our lease expired
+                continue
+            else:
+                PAGES.inc(host=update.host, result="failed")
+                queue.retry(
+                    update, min_delay=get_wiki_session(update.host).guard.retry_after()
+                )
 
 
-@app.post("/alertmanager")
-async def alertmanager(payload: WebhookPayload):
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    data_directory = get_persistent_data_directory("wiki-updater")
+    app.state.state_store = AppliedStateStore(
+        data_directory / "state.json", ttl=STATE_TTL
+    )
+    app.state.queue = UpdateQueue(
+        data_directory / "queue",
+        max_size=MAX_QUEUE_SIZE,
+        max_attempts=MAX_UPDATE_ATTEMPTS,
+        leases=LeaseManager(data_directory / "leases", ttl=LEASE_TTL),
+    )
+    workers = [
+        asyncio.create_task(_worker(app.state.queue, app.state.state_store))
+        for _ in range(MAX_CONCURRENT_UPDATES)
+    ]
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await close_wiki_sessions()
+
+
+app = FastAPI(lifespan=_lifespan)
+
+
+def _queue_updates(payload: WebhookPayload) -> None:
     logger.info(f"Received: {payload}")
+    # Only the last state per page matters, later alerts in the payload win
+    updates: Dict[Tuple[str, str], PageUpdate] = {}
     for alert in payload.alerts:
         wiki_host = alert.labels.get("update_wiki_host")
         if not wiki_host:
@@ -194,25 +203,56 @@ async def alertmanager(payload: WebhookPayload):
         logger.info(
             f"Found configuration {wiki_host}/{wiki_page} [{is_running}] ({info})"
         )
-
-        wikipedia = Wikipedia(
-            wiki_host,
-            wiki_page,
-            os.environ.get("WIKI_UPDATER_USERNAME"),
-            os.environ.get("WIKI_UPDATER_PASSWORD"),
+        updates[(wiki_host, wiki_page)] = PageUpdate(
+            host=wiki_host,
+            page=wiki_page,
+            running=is_running,
+            info=info,
+            fingerprint=alert.fingerprint,
         )
-        if wikipedia.page_requires_updating(is_running):
-            logger.info(f"Updating {wiki_host}/{wiki_page} -> {is_running}")
-            if not wikipedia.update_page(is_running, info):
-                logger.error(
-                    f"Failed to update {wiki_host}/{wiki_page} -> {is_running}"
+
+    for update in updates.values():
+        # A pending update is newer than anything applied, compare against it first
+        if pending := app.state.queue.pending(update):
+            if pending.running == update.running and pending.info == update.info:
+                logger.info(
+                    f"Already queued {update.host}/{update.page} -> {update.running}, skipping"
                 )
-        else:
+                PAGES.inc(host=update.host, result="deduplicated")
+                continue
+        elif app.state.state_store.is_current(
+            update.host, update.page, update.fingerprint, update.running
+        ):
             logger.info(
-                f"Page does not require update {wiki_host}/{wiki_page} ({is_running})"
+                f"Already applied {update.host}/{update.page} -> {update.running}, skipping"
             )
+            PAGES.inc(host=update.host, result="deduplicated")
+            continue
 
-    return "OK"
+        try:
+            app.state.queue.put(update)
+        except QueueFull as e:
+            # Let alertmanager retry the notification later
+            logger.error(f"Could not queue {update.host}/{update.page}: {e}")
+            raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.post("/alertmanager", status_code=202)
+async def alertmanager(payload: WebhookPayload):
+    with WEBHOOK_DURATION.time(outcome="error") as labels:
+        _queue_updates(payload)
+        labels["outcome"] = "success"
+    return "Accepted"
+
+
+@app.get("/queue")
+async def _render_queue():
+    return app.state.queue.stats()
+
+
+@app.get("/metrics")
+async def _render_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 
 @app.get("/health")
@@ -0,0 +1,478 @@
+import asyncio
+import functools
+import logging
+import os
+from http.cookiejar import LWPCookieJar, LoadError
+from pathlib import PosixPath
+from typing import Dict, List, Optional
+
+import httpx
+from pydantic import BaseModel
+
+from monitoring.helpers import get_persistent_data_directory
+from monitoring.metrics import Gauge, Histogram
+from monitoring.receivers.rate_limit import HostGuard, HostUnavailable
+
+RUNNING_TEXT = "Running"
+NOT_RUNNING_TEXT = "Not Running"
+
+logger = logging.getLogger(__name__)
+
+# Requests per second (and burst) we allow ourselves against a single wiki
+REQUEST_RATE = float(os.environ.get("WIKI_UPDATER_REQUEST_RATE", "2"))
+REQUEST_BURST = int(os.environ.get("WIKI_UPDATER_REQUEST_BURST", "5"))
+# Replication lag (seconds) above which the API should refuse our requests
+MAX_LAG = os.environ.get("WIKI_UPDATER_MAXLAG", "5")
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("WIKI_UPDATER_CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("WIKI_UPDATER_CIRCUIT_RESET", "300"))
+# Backoff used when the server does not send a usable Retry-After
+DEFAULT_RETRY_AFTER = 30
+
+MEDIAWIKI_REQUEST_DURATION = Histogram(
+    "wiki_updater_mediawiki_request_duration_seconds",
+    "Time spent talking to MediaWiki per phase",
+    ["host", "phase", "outcome"],
+)
+
+
+def _timed_phase(phase: str):
+    """Record the duration of a MediaWiki call, a falsy result counts as a failure."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with MEDIAWIKI_REQUEST_DURATION.time(
+                host=self.host, phase=phase, outcome="error"
+            ) as labels:
+                result = await func(self, *args, **kwargs)
+                labels["outcome"] = "success" if result else "failure"
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def _retry_after(r: httpx.Response) -> float:
+    try:
+        return float(r.headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+    except ValueError:
+        return DEFAULT_RETRY_AFTER
+
+
+def _api_error_code(response: Dict) -> Optional[str]:
+    return response.get("error", {}).get("code")
+
+
+def _is_assert_failure(response: Dict) -> bool:
+    return _api_error_code(response) in {"assertuserfailed", "assertnameduserfailed"}
+
+
+def _is_bad_token(response: Dict) -> bool:
+    return _api_error_code(response) == "badtoken"
+
+
+class WikiSession:
+    """Pooled, keep-alive session for a single wiki host.
+
+    Cookies are persisted so a restart does not require a new login,
+    we only authenticate again when the API reports an `assert=user` failure.
+    """
+
+    def __init__(self, host: str, username: Optional[str], password: Optional[str]):
+        self.host = host
+        self._username = username
+        self._password = password
+        self._csrf_token: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self.guard = HostGuard(
+            host,
+            rate=REQUEST_RATE,
+            burst=REQUEST_BURST,
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=CIRCUIT_RESET_TIMEOUT,
+        )
+
+        self._cookie_jar = LWPCookieJar()
+        if cookie_path := self._get_cookie_path():
+            self._cookie_jar.filename = cookie_path.as_posix()
+            if cookie_path.exists():
+                try:
+                    self._cookie_jar.load(ignore_discard=True, ignore_expires=False)
+                except (OSError, LoadError) as e:
+                    logger.warning(f"Failed to load cookies for {host}: {e}")
+
+        self._client = httpx.AsyncClient(
+            headers={"User-Agent": "ClueBot NG Monitoring - Wiki Updater"},
+            cookies=self._cookie_jar,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+            timeout=httpx.Timeout(30.0),
+            transport=_transport,
+        )
+
+    def _get_cookie_path(self) -> Optional[PosixPath]:
+        try:
+            return (
+                get_persistent_data_directory("wiki-updater") / f"{self.host}.cookies"
+            )
+        except RuntimeError as e:
+            logger.warning(f"Not persisting cookies for {self.host}: {e}")
+            return None
+
+    def _save_cookies(self) -> None:
+        if not self._cookie_jar.filename:
+            return
+        try:
+            self._cookie_jar.save(ignore_discard=True, ignore_expires=False)
+        except OSError as e:
+            logger.warning(f"Failed to save cookies for {self.host}: {e}")
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request through the rate limiter and circuit breaker for this host.
+
+        Raises HostUnavailable (so the update is deferred) when the host is
+        backing off, lagged, or failing.
+        """
+        await self.guard.acquire()
+        try:
+            r = await self._client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            self.guard.record_failure()
+            raise
+
+        if "set-cookie" in r.headers:
+            # Session cookies are also refreshed outside of login, keep the latest
+            self._save_cookies()
+
+        if r.headers.get("MediaWiki-API-Error") == "maxlag":
+            self.guard.record_failure(_retry_after(r))
+            raise HostUnavailable(self.host, _retry_after(r), "replication lag")
+
+        if r.status_code == 429 or r.status_code >= 500:
+            retry_after = _retry_after(r) if "Retry-After" in r.headers else None
+            self.guard.record_failure(retry_after)
+            raise HostUnavailable(
+                self.host, retry_after or 0, f"server returned {r.status_code}"
+            )
+
+        self.guard.record_success()
+        return r
+
+    async def get(self, url: str, params: Dict[str, str]) -> httpx.Response:
+        if url.endswith("/api.php"):
+            params = {**params, "maxlag": MAX_LAG}
+        return await self._request("GET", url, params=params)
+
+    async def post(self, url: str, data: Dict[str, str]) -> httpx.Response:
+        if url.endswith("/api.php"):
+            data = {**data, "maxlag": MAX_LAG}
+        return await self._request("POST", url, data=data)
+
+    async def close(self) -> None:
+        self._save_cookies()
+        await self._client.aclose()
+
+    async def _get_login_token(self) -> Optional[str]:
+        r = await self.get(
+            f"https://{self.host}/w/api.php",
+            params={
+                "action": "query",
+                "meta": "tokens",
+                "type": "login",
+                "format": "json",
+            },
+        )
+        if r.status_code == 200:
+            return r.json().get("query", {}).get("tokens", {}).get("logintoken")
+
+        logger.warning(
+            f"Failed to get LOGIN token for {self.host}: [{r.status_code}] {r.text}"
+        )
+        return None
+
+    @_timed_phase("login")
+    async def _login(self) -> bool:
+        if not self._username or not self._password:
+            logger.warning(f"No credentials available to authenticate on {self.host}")
+            return False
+
+        login_token = await self._get_login_token()
+        if not login_token:
+            return False
+
+        r = await self.post(
+            f"https://{self.host}/w/api.php",
+            data={
+                "format": "json",
+                "action": "login",
+                "lgname": self._username,
+                "lgpassword": self._password,
+                "lgtoken": login_token,
+            },
+        )
+        if r.status_code != 200:
+            logger.warning(
+                f"Could not login to {self.host}: [{r.status_code}] {r.text}"
+            )
+            return False
+
+        response = r.json()
+        if response.get("login", {}).get("result") != "Success":
+            logger.warning(f"Login failed to {self.host}: {response}")
+            return False
+
+        return True
+
+    @_timed_phase("token")
+    async def _fetch_csrf_token(self) -> Optional[str]:
+        r = await self.get(
+            f"https://{self.host}/w/api.php",
+            params={
+                "action": "query",
+                "meta": "tokens",
+                "type": "csrf",
+                "assert": "user",
+                "format": "json",
+            },
+        )
+        if r.status_code == 200:
+            response = r.json()
+            if _is_assert_failure(response):
+                return None
+            return response.get("query", {}).get("tokens", {}).get("csrftoken")
+
+        logger.warning(
+            f"Failed to get CSRF token for {self.host}: [{r.status_code}] {r.text}"
+        )
+        return None
+
+    async def get_csrf_token(self, refresh: bool = False) -> Optional[str]:
+        async with self._lock:
+            if refresh:
+                self._csrf_token = None
+
+            if not self._csrf_token:
+                self._csrf_token = await self._fetch_csrf_token()
+
+            if not self._csrf_token:
+                # Most likely our session has expired, login again and retry
+                if await self._login():
+                    self._csrf_token = await self._fetch_csrf_token()
+
+            return self._csrf_token
+
+    async def _relogin(self) -> bool:
+        async with self._lock:
+            self._csrf_token = None
+            return await self._login()
+
+    @_timed_phase("fetch")
+    async def query_with_token(self, params: Dict[str, str]) -> Optional[Dict]:
+        """Run an action=query, fetching a CSRF token for later writes in the same request."""
+        for attempt in range(2):
+            r = await self.get(
+                f"https://{self.host}/w/api.php",
+                params={
+                    **params,
+                    "action": "query",
+                    "meta": "tokens",
+                    "type": "csrf",
+                    "assert": "user",
+                    "format": "json",
+                    "formatversion": "2",
+                },
+            )
+            if r.status_code != 200:
+                logger.warning(
+                    f"Failed to query {self.host}: [{r.status_code}] {r.text}"
+                )
+                return None
+
+            response = r.json()
+            if _is_assert_failure(response):
+                if attempt == 0 and await self._relogin():
+                    continue
+                return None
+
+            if "error" in response:
+                logger.warning(f"Failed to query {self.host}: {response}")
+                return None
+
+            if (
+                csrf_token := response.get("query", {})
+                .get("tokens", {})
+                .get("csrftoken")
+            ):
+                self._csrf_token = csrf_token
+            return response
+        return None
+
+    async def post_with_token(self, data: Dict[str, str]) -> Optional[httpx.Response]:
+        """POST an authenticated write, re-authenticating once if the session expired."""
+        for attempt in range(2):
+            csrf_token = await self.get_csrf_token(refresh=attempt > 0)
+            if not csrf_token:
+                return None
+
+            r = await self.post(
+                f"https://{self.host}/w/api.php",
+                data={**data, "token": csrf_token, "assert": "user"},
+            )
+            if r.status_code == 200 and (
+                _is_assert_failure(r.json()) or _is_bad_token(r.json())
+            ):
+                logger.info(f"Session for {self.host} is no longer valid, retrying")
+                continue
+            return r
+        return None
+
+
+_sessions: Dict[str, WikiSession] = {}
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def set_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    """Route new sessions through a custom transport (e.g. a fake wiki for benchmarks)."""
+    global _transport
+    _transport = transport
+
+
+def get_wiki_session(host: str) -> WikiSession:
+    if host not in _sessions:
+        _sessions[host] = WikiSession(
+            host,
+            os.environ.get("WIKI_UPDATER_USERNAME"),
+            os.environ.get("WIKI_UPDATER_PASSWORD"),
+        )
+    return _sessions[host]
+
+
+def _guard_states():
+    return {
+        (host, state): float(session.guard.breaker.state == state)
+        for host, session in _sessions.items()
+        for state in (
+            session.guard.breaker.CLOSED,
+            session.guard.breaker.OPEN,
+            session.guard.breaker.HALF_OPEN,
+        )
+    }
+
+
+CIRCUIT_STATE = Gauge(
+    "wiki_updater_circuit_state",
+    "Circuit breaker state per wiki host",
+    ["host", "state"],
+    callback=_guard_states,
+)
+RATE_LIMIT_TOKENS = Gauge(
+    "wiki_updater_rate_limit_tokens",
+    "Requests currently available in the token bucket per wiki host",
+    ["host"],
+    callback=lambda: {
+        (host,): session.guard.bucket.tokens for host, session in _sessions.items()
+    },
+)
+HOST_RETRY_AFTER = Gauge(
+    "wiki_updater_host_retry_after_seconds",
+    "Seconds until calls to a wiki host are allowed again",
+    ["host"],
+    callback=lambda: {
+        (host,): session.guard.retry_after() for host, session in _sessions.items()
+    },
+)
+
+
+async def close_wiki_sessions() -> None:
+    while _sessions:
+        _, session = _sessions.popitem()
+        await session.close()
+
+
+class PageRevision(BaseModel):
+    title: str
+    content: Optional[str] = None
+    revision_id: Optional[int] = None
+
+
+class Wikipedia:
+    # Maximum number of titles the API accepts in a single query
+    max_titles = 50
+
+    def __init__(self, host: str):
+        self.host = host
+        self._session = get_wiki_session(host)
+
+    async def fetch_pages(self, pages: List[str]) -> Optional[Dict[str, PageRevision]]:
+        """Fetch the current revision of each page, batched into as few queries as possible.
+
+        The CSRF token for any following edits is requested in the same round trip.
+        """
+        revisions = {}
+        for offset in range(0, len(pages), self.max_titles):
+            chunk = pages[offset : offset + self.max_titles]
+            response = await self._session.query_with_token(
+                {
+                    "prop": "revisions",
+                    "rvprop": "ids|content",
+                    "rvslots": "main",
+                    "titles": "|".join(chunk),
+                }
+            )
+            if response is None:
+                logger.warning(f"Could not fetch {self.host}/{chunk}")
+                return None
+
+            query = response.get("query", {})
+            # Map the normalised titles back to what we asked for
+            requested_titles = {
+                normalized["to"]: normalized["from"]
+                for normalized in query.get("normalized", [])
+            }
+            for page in query.get("pages", []):
+                title = requested_titles.get(page["title"], page["title"])
+                revision = (page.get("revisions") or [{}])[0]
+                revisions[title] = PageRevision(
+                    title=title,
+                    content=revision.get("slots", {}).get("main", {}).get("content"),
+                    revision_id=revision.get("revid"),
+                )
+
+        return revisions
+
+    @staticmethod
+    def page_requires_updating(revision: PageRevision, running: bool) -> bool:
+        expected_text = RUNNING_TEXT if running else NOT_RUNNING_TEXT
+        return not (revision.content or "").strip().startswith(expected_text)
+
+    @_timed_phase("edit")
+    async def update_page(
+        self, revision: PageRevision, running: bool, info: Optional[str]
+    ) -> bool:
+        text = RUNNING_TEXT if running else NOT_RUNNING_TEXT
+        if info:
+            text = f"{text}: {info}"
+
+        data = {
+            "action": "edit",
+            "format": "json",
+            "title": revision.title,
+            "text": text,
+            "summary": "Updating status from alerts",
+        }
+        if revision.revision_id:
+            # Fail with an edit conflict if the page changed since we fetched it
+            data["baserevid"] = str(revision.revision_id)
+
+        r = await self._session.post_with_token(data)
+        if r is None:
+            logger.warning(f"Failed to authenticate for {self.host}/{revision.title}")
+            return False
+
+        if r.status_code != 200 or "error" in r.json():
+            logger.warning(
+                f"Failed to edit {self.host}/{revision.title}: [{r.status_code}] {r.text}"
+            )
+            return False
+
+        return True
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import re
+from collections import Counter
+from pathlib import PosixPath
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import httpx
+import yaml
+
+from monitoring import promql
+
+logger = logging.getLogger(__name__)
+
+RECORDING_RULES_FILE = "recording.yml"
+# Range windows at least this long are worth recording even if used once
+EXPENSIVE_RANGE_SECONDS = 3600
+
+
+class Candidate(NamedTuple):
+    name: str
+    expr: str
+    # Matchers applied to the recorded series instead of the raw selector
+    outer_matchers: List[Tuple[str, str, str]]
+    range_seconds: float
+
+
+def _sanitize(value: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", value).strip("_")
+
+
+def _candidate(call: promql.RangeCall) -> Optional[Candidate]:
+    selector = call.selector
+    range_seconds = selector.range_seconds
+    if (
+        not selector.metric
+        or range_seconds is None
+        or call.function == "quantile_over_time"
+    ):
+        # Grafana interval variables or parameterised calls, nothing fixed to record
+        return None
+    if selector.modifiers:
+        # Looks at other times (e.g. week over week), the recorded series would not
+        return None
+
+    def survives_aggregation(label: str) -> bool:
+        # Matchers on labels that survive the aggregation can be applied after it
+        if call.aggregation is None:
+            return True
+        if call.grouping and call.grouping[0] == "by":
+            return label in call.grouping[1]
+        if call.grouping and call.grouping[0] == "without":
+            return label not in call.grouping[1]
+        return False
+
+    inner, outer = [], []
+    for name, op, value in selector.matchers:
+        if name != "__name__" and survives_aggregation(name):
+            outer.append((name, op, value))
+        else:
+            inner.append((name, op, value))
+
+    if any("$" in value for _, _, value in inner):
+        # Depends on a dashboard variable that is aggregated away
+        return None
+
+    arguments = f"{selector.metric}{promql.format_matchers(inner)}[{selector.range}]"
+    expr = f"{call.function}({arguments})"
+
+    if call.aggregation:
+        grouping = ""
+        if call.grouping:
+            grouping = f" {call.grouping[0]} ({', '.join(call.grouping[1])})"
+        expr = f"{call.aggregation}{grouping} ({expr})"
+
+    # level:metric:operation
+    if call.aggregation is None:
+        level = "instance"
+    elif call.grouping and call.grouping[0] == "by" and call.grouping[1]:
+        level = "_".join(call.grouping[1])
+    elif call.grouping and call.grouping[0] == "without":
+        level = "without_" + "_".join(call.grouping[1])
+    else:
+        level = "global"
+
+    metric = selector.metric
+    if call.function in ("rate", "irate", "increase"):
+        metric = re.sub(r"_total$", "", metric)
+
+    operation = f"{call.function}{selector.range}"
+    if call.aggregation and call.aggregation != "sum":
+        operation = f"{call.aggregation}_{operation}"
+    if inner:
+        operation += "_" + _sanitize("_".join(f"{n}_{v}" for n, _, v in inner))
+
+    return Candidate(f"{level}:{metric}:{operation}", expr, outer, range_seconds)
+
+
+def rule_expressions(
+    rules_path: PosixPath, include_recording: bool = False
+) -> Iterator[str]:
+    for path in sorted(rules_path.glob("*.yml")):
+        if path.name == RECORDING_RULES_FILE and not include_recording:
+            continue
+        with path.open("r") as fh:
+            for group in (yaml.safe_load(fh) or {}).get("groups", []):
+                for rule in group.get("rules", []):
+                    yield str(rule.get("expr", ""))
+
+
+def _panels(panels: List[Dict]) -> Iterator[Dict]:
+    for panel in panels:
+        yield panel
+        yield from _panels(panel.get("panels", []))
+
+
+def dashboard_targets(dashboard: Dict) -> Iterator[Dict]:
+    for panel in _panels(dashboard.get("panels", [])):
+        for target in panel.get("targets", []):
+            if isinstance(target.get("expr"), str) and target["expr"]:
+                yield target
+
+
+def load_dashboards(paths: List[PosixPath]) -> Dict[str, Dict]:
+    dashboards = {}
+    for path in paths:
+        for file_path in sorted(path.glob("*.json")) if path.is_dir() else [path]:
+            data = json.loads(file_path.read_text())
+            dashboards[file_path.name] = data.get("dashboard", data)
+    return dashboards
+
+
+def fetch_dashboards(grafana_url: str, token: Optional[str]) -> Dict[str, Dict]:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    dashboards = {}
+    with httpx.Client(base_url=grafana_url, headers=headers, timeout=30) as client:
+        r = client.get("/api/search", params={"type": "dash-db"})
+        r.raise_for_status()
+        for result in r.json():
+            r = client.get(f"/api/dashboards/uid/{result['uid']}")
+            r.raise_for_status()
+            dashboards[f"{result['uid']}.json"] = r.json()["dashboard"]
+    return dashboards
+
+
+def find_candidates(
+    expressions: List[str], min_occurrences: int = 2
+) -> Dict[str, Candidate]:
+    """Recordable sub-expressions that are repeated or cover long ranges."""
+    occurrences: Counter = Counter()
+    candidates: Dict[str, Candidate] = {}
+    for expr in expressions:
+        for call in promql.range_calls(expr):
+            if candidate := _candidate(call):
+                occurrences[candidate.expr] += 1
+                candidates[candidate.expr] = candidate
+
+    selected = {}
+    for expr, candidate in candidates.items():
+        if (
+            occurrences[expr] >= min_occurrences
+            or candidate.range_seconds >= EXPENSIVE_RANGE_SECONDS
+        ):
+            name = candidate.name
+            if name in selected and selected[name].expr != expr:
+                digest = hashlib.sha1(expr.encode("utf-8")).hexdigest()[:6]
+                name = f"{name}_{digest}"
+            selected[name] = candidate._replace(name=name)
+    return {candidate.expr: candidate for candidate in selected.values()}
+
+
+def rewrite_expression(expr: str, candidates: Dict[str, Candidate]) -> str:
+    replacements = []
+    for call in promql.range_calls(expr):
+        candidate = _candidate(call)
+        if candidate and candidate.expr in candidates:
+            # The filters on kept labels differ per query, only the recorded part is shared
+            name = candidates[candidate.expr].name
+            outer = promql.format_matchers(candidate.outer_matchers)
+            replacements.append((call.start, call.end, f"{name}{outer}"))
+
+    for start, end, replacement in sorted(replacements, reverse=True):
+        expr = expr[:start] + replacement + expr[end:]
+    return expr
+
+
+def generate_recording_rules(
+    candidates: Dict[str, Candidate], interval: str = "1m"
+) -> str:
+    rules = [
+        {"record": candidate.name, "expr": candidate.expr}
+        for candidate in sorted(candidates.values(), key=lambda c: c.name)
+    ]
+    return (
+        "# Generated by `python -m monitoring.cli generate-recording-rules`, do not edit\n"
+        + yaml.dump(
+            {
+                "groups": [
+                    {
+                        "name": "Dashboard Recording Rules",
+                        "interval": interval,
+                        "rules": rules,
+                    }
+                ]
+            },
+            sort_keys=False,
+            width=1000,
+        )
+    )
+
+
+def rewrite_dashboards(
+    dashboards: Dict[str, Dict], candidates: Dict[str, Candidate]
+) -> Dict[str, Dict]:
+    """Point panel queries at the recorded series, returns only dashboards that changed."""
+    changed = {}
+    for name, dashboard in dashboards.items():
+        updated = False
+        for target in dashboard_targets(dashboard):
+            rewritten = rewrite_expression(target["expr"], candidates)
+            if rewritten != target["expr"]:
+                logger.info(f"{name}: {target['expr']} -> {rewritten}")
+                target["expr"] = rewritten
+                updated = True
+        if updated:
+            changed[name] = dashboard
+    return changed
@@ -0,0 +1,206 @@
+import re
+from collections import defaultdict
+from pathlib import PosixPath
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import yaml
+
+from monitoring import promql
+from monitoring.cardinality import PrometheusAPI
+
+
+class Rule(NamedTuple):
+    file: str
+    group: str
+    name: str
+    expr: str
+    # Group evaluation interval, None for the global one
+    interval: Optional[float]
+
+
+class Finding(NamedTuple):
+    severity: str
+    rules: List[Rule]
+    message: str
+
+
+def load_rules(rules_path: PosixPath) -> Iterator[Rule]:
+    for path in sorted(rules_path.glob("*.yml")):
+        with path.open("r") as fh:
+            for group in (yaml.safe_load(fh) or {}).get("groups", []):
+                interval = None
+                if group.get("interval"):
+                    interval = promql.parse_duration(group["interval"])
+                for rule in group.get("rules", []):
+                    yield Rule(
+                        path.name,
+                        group["name"],
+                        rule.get("alert") or rule.get("record"),
+                        str(rule.get("expr", "")),
+                        interval,
+                    )
+
+
+def _selector_metrics(selector: promql.Selector) -> List[str]:
+    if selector.metric:
+        return [selector.metric]
+    return [
+        value
+        for name, op, value in selector.matchers
+        if name == "__name__" and op == "="
+    ]
+
+
+def is_unbounded(selector: promql.Selector) -> bool:
+    """No metric name and no equality matcher, every series has to be checked."""
+    return not _selector_metrics(selector) and not any(
+        op == "=" and value for _, op, value in selector.matchers
+    )
+
+
+def fixture_series_counts(path: PosixPath) -> Dict[str, int]:
+    """Series per metric name from a YAML/JSON mapping, `__total__` for all head series."""
+    with path.open("r") as fh:
+        return {name: int(count) for name, count in (yaml.safe_load(fh) or {}).items()}
+
+
+def live_series_counts(api: PrometheusAPI, metrics: Iterable[str]) -> Dict[str, int]:
+    tsdb = api.get("/api/v1/status/tsdb")
+    counts = {"__total__": int(tsdb["headStats"]["numSeries"])}
+    if names := sorted(metrics):
+        for result in api.query(
+            f'count by (__name__) ({{__name__=~"{"|".join(names)}"}})'
+        ):
+            counts[result["metric"].get("__name__", "")] = int(
+                float(result["value"][1])
+            )
+    return counts
+
+
+class Linter:
+    """Estimate what every rule evaluation reads and flag expensive patterns.
+
+    A selector touches all series of its metric (label matchers are not
+    taken into account, so this is an upper bound) and scans one sample per
+    series, or a range's worth at the scrape interval. Selectors without a
+    metric name touch every head series. Inside a subquery this is repeated
+    for every step of its range.
+    """
+
+    def __init__(
+        self,
+        series_counts: Dict[str, int],
+        scrape_interval: float,
+        evaluation_interval: float,
+        max_range: float,
+        default_series: int = 1,
+    ):
+        self.series_counts = series_counts
+        self.total_series = series_counts.get("__total__") or sum(
+            series_counts.values()
+        )
+        self.scrape_interval = scrape_interval
+        self.evaluation_interval = evaluation_interval
+        self.max_range = max_range
+        self.default_series = default_series
+
+    def _series(self, selector: promql.Selector) -> int:
+        if names := _selector_metrics(selector):
+            return sum(
+                self.series_counts.get(name, self.default_series) for name in names
+            )
+        return self.total_series
+
+    def _steps(self, subquery: promql.Subquery) -> float:
+        # Without a step Prometheus uses the global evaluation interval
+        step = subquery.step_seconds or self.evaluation_interval
+        return max((subquery.range_seconds or 0) / step, 1)
+
+    def cost(self, rule: Rule) -> Dict[str, float]:
+        series = samples = 0.0
+        subqueries = promql.subqueries(rule.expr)
+        for selector in promql.selectors(rule.expr):
+            touched = self._series(selector)
+            series += touched
+            steps = 1.0
+            for subquery in subqueries:
+                if subquery.start <= selector.start and selector.end <= subquery.end:
+                    steps *= self._steps(subquery)
+            samples += (
+                touched
+                * steps
+                * max((selector.range_seconds or 0) / self.scrape_interval, 1)
+            )
+        return {
+            "series": series,
+            "samples": samples,
+            "samples_per_hour": samples
+            * 3600
+            / (rule.interval or self.evaluation_interval),
+        }
+
+    def findings(self, rules: List[Rule]) -> List[Finding]:
+        findings = []
+        for rule in rules:
+            for selector in promql.selectors(rule.expr):
+                text = rule.expr[selector.start : selector.end]
+                if is_unbounded(selector):
+                    findings.append(
+                        Finding("error", [rule], f"Unbounded selector {text}")
+                    )
+                if selector.range_seconds and selector.range_seconds > self.max_range:
+                    findings.append(
+                        Finding("error", [rule], f"Range of {selector.range} in {text}")
+                    )
+            for subquery in promql.subqueries(rule.expr):
+                text = rule.expr[subquery.start : subquery.end]
+                if subquery.range_seconds and subquery.range_seconds > self.max_range:
+                    findings.append(
+                        Finding("error", [rule], f"Range of {subquery.range} in {text}")
+                    )
+
+        # The same range call evaluated more than once per cycle
+        users: Dict[str, List[Rule]] = defaultdict(list)
+        for rule in rules:
+            for call in promql.range_calls(rule.expr):
+                text = re.sub(r"\s+", " ", rule.expr[call.start : call.end])
+                users[re.sub(r"([(\[]) | (?=[)\]])", r"\1", text)].append(rule)
+        for call, call_rules in sorted(users.items()):
+            if len(call_rules) > 1:
+                findings.append(
+                    Finding(
+                        "warning",
+                        call_rules,
+                        f"{call} is evaluated {len(call_rules)} times,"
+                        " consider a recording rule (generate-recording-rules)",
+                    )
+                )
+        return findings
+
+
+def format_report(
+    rules: List[Rule],
+    costs: List[Dict[str, float]],
+    findings: List[Finding],
+    budget: Optional[float],
+) -> str:
+    lines = [f"{'Rule':<50} {'Series':>10} {'Samples':>12} {'Samples/h':>14}"]
+    for rule, cost in sorted(
+        zip(rules, costs), key=lambda item: item[1]["samples"], reverse=True
+    ):
+        lines.append(
+            f"{rule.file + ':' + rule.name:<50} {cost['series']:>10.0f}"
+            f" {cost['samples']:>12.0f} {cost['samples_per_hour']:>14.0f}"
+        )
+
+    total = sum(cost["samples"] for cost in costs)
+    lines += ["", f"Samples scanned per evaluation cycle: {total:.0f}"]
+    if budget is not None:
+        lines.append(f"Budget: {budget:.0f} ({total / budget:.0%} used)")
+
+    if findings:
+        lines.append("")
+    for finding in findings:
+        names = ", ".join(f"{rule.file}:{rule.name}" for rule in finding.rules)
+        lines.append(f"{finding.severity.upper()}: {names}: {finding.message}")
+    return "\n".join(lines)
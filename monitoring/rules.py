@@ -0,0 +1,141 @@
+from typing import Dict, Tuple
+
+import yaml
+
+from monitoring.inventory import Inventory
+
+THRESHOLD_METRIC = "cbng_monitoring_threshold"
+# Labels of the threshold series, those a bot does not use are left empty
+THRESHOLD_LABELS = [
+    "username",
+    "domain",
+    "kind",
+    "summary",
+    "update_wiki_host",
+    "update_wiki_page",
+    "tool",
+]
+
+
+def humanize_seconds(seconds: int) -> str:
+    for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= size and seconds % size == 0:
+            count = seconds // size
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+    return f"{seconds} seconds"
+
+
+def bot_thresholds(inventory: Inventory) -> Dict[Tuple[str, ...], float]:
+    """Threshold series per bot and kind, keyed by THRESHOLD_LABELS values.
+
+    These are exported by the bot activity exporter next to the values they
+    are compared against, so adding a bot adds series but no rules.
+    """
+    thresholds = {}
+
+    def add(bot: str, domain: str, kind: str, value: int, summary: str, **labels):
+        thresholds[
+            tuple(
+                {
+                    "username": bot,
+                    "domain": domain,
+                    "kind": kind,
+                    "summary": summary,
+                    **labels,
+                }.get(name, "")
+                for name in THRESHOLD_LABELS
+            )
+        ] = value
+
+    for bot, config in inventory.bots.items():
+        # Replaces the scrape target's tool, so inhibitions can match the bot's probes
+        tool_labels = {"tool": config.tool} if config.tool else {}
+        if config.max_edit_age is not None:
+            status_labels = {}
+            if config.status_page:
+                status_labels = {
+                    "update_wiki_host": config.domain,
+                    "update_wiki_page": config.status_page,
+                }
+            add(
+                bot,
+                config.domain,
+                "max_edit_age",
+                config.max_edit_age,
+                f"{bot} has not edited for > {humanize_seconds(config.max_edit_age)}",
+                **status_labels,
+                **tool_labels,
+            )
+
+        if config.min_recent_edits is not None:
+            add(
+                bot,
+                config.domain,
+                "min_recent_edits",
+                config.min_recent_edits,
+                f"{bot} has made less than {config.min_recent_edits} edits in the last 24 hours",
+                **tool_labels,
+            )
+
+        if config.run_page:
+            add(
+                bot,
+                config.domain,
+                "admin_allow_run",
+                0,
+                f"{bot} has been disabled via {config.run_page}",
+                **tool_labels,
+            )
+
+    return thresholds
+
+
+def generate_bot_rules() -> str:
+    """Alert rules for every bot, joined against the exported thresholds.
+
+    Each kind is a single vectorised rule, so the number of rules does not
+    grow with the bot list. The summary comes with the threshold's labels,
+    the annotation does not need to query anything.
+    """
+    alerts = [
+        {
+            "alert": "BotNotEditedRecently",
+            "expr": (
+                "time() - cbng_monitoring_last_user_contribution_time"
+                " > on(username, domain) group_left(update_wiki_host, update_wiki_page, tool, summary)"
+                f' {THRESHOLD_METRIC}{{kind="max_edit_age"}}'
+            ),
+            "for": "5m",
+            "annotations": {"summary": "{{ $labels.summary }}"},
+        },
+        {
+            "alert": "BotHasLowEditCount",
+            "expr": (
+                "cbng_monitoring_recent_user_contributions_count"
+                " < on(username, domain) group_left(tool, summary)"
+                f' {THRESHOLD_METRIC}{{kind="min_recent_edits"}}'
+            ),
+            "for": "5m",
+            "annotations": {"summary": "{{ $labels.summary }}"},
+        },
+        {
+            "alert": "BotHasBeenAdminDisabled",
+            "expr": (
+                "cbng_monitoring_bot_administrator_allow_run"
+                " == on(username, domain) group_left(tool, summary)"
+                f' {THRESHOLD_METRIC}{{kind="admin_allow_run"}}'
+            ),
+            "for": "5m",
+            "annotations": {"summary": "{{ $labels.summary }}"},
+        },
+    ]
+
+    return (
+        "# Generated by `python -m monitoring.cli generate-rules`, do not edit\n"
+        "# The thresholds per bot are exported by bot-activity from inventory.yml\n"
+        + yaml.dump(
+            {"groups": [{"name": "Bots", "rules": alerts}]},
+            sort_keys=False,
+            width=1000,
+        )
+    )
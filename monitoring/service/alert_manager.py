@@ -1,18 +1,48 @@
 import json
 import os
 from pathlib import PosixPath
+from typing import Dict, List, Optional
 
 import yaml
 
-from monitoring.helpers import get_persistent_data_directory
+from monitoring.helpers import (
+    get_persistent_data_directory,
+    get_replica_count,
+    get_replica_hosts,
+    write_file_atomically,
+)
+from monitoring.inventory import Inventory, load_inventory
+
+# One email per alert name, fan-out is cut by the inventory inhibitions instead
+DEFAULT_GROUP_BY = ["alertname", "cluster", "service"]
+# The wiki updater edits one page per notification
+WIKI_UPDATER_GROUP_BY = ["update_wiki_host", "update_wiki_page"]
 
 
 class AlertManager:
     files_path = PosixPath(__file__).parent.parent / "alertmanager"
     binary_path = PosixPath("/workspace/bin/alertmanager")
     configuration_path = PosixPath("/tmp/alertmanager.yml")
+    reload_url = "http://localhost:9093/-/reload"
+    cluster_port = 9094
+
+    def __init__(self, replica: int = 0):
+        self.replica = replica
+
+    def generate_inhibit_rules(self, inventory: Inventory) -> List[Dict]:
+        return [
+            {
+                "source_matchers": [f'alertname="{inhibition.source}"'],
+                "target_matchers": [
+                    f'alertname=~"{"|".join(sorted(inhibition.targets))}"'
+                ],
+                "equal": inhibition.equal,
+            }
+            for inhibition in inventory.inhibitions
+        ]
 
-    def generate_configuration(self) -> str:
+    def generate_configuration(self, inventory: Optional[Inventory] = None) -> str:
+        inventory = inventory or load_inventory()
         send_alerts_to = json.loads(os.environ.get("MONITORING_SEND_ALERTS_TO", "[]"))
 
         config = {
@@ -22,7 +52,7 @@ class AlertManager:
                 "smtp_smarthost": "mail.tools.wmcloud.org:25",
             },
             "route": {
-                "group_by": ["alertname", "cluster", "service"],
+                "group_by": DEFAULT_GROUP_BY,
                 "group_wait": "30s",
                 "group_interval": "5m",
                 "repeat_interval": "12h",
@@ -30,6 +60,7 @@ class AlertManager:
                 "routes": [
                     {
                         "receiver": "wiki-updater",
+                        "group_by": WIKI_UPDATER_GROUP_BY,
                         "group_wait": "1m",
                         "matchers": [
                             "update_wiki_host=~.+",
@@ -41,6 +72,9 @@ class AlertManager:
             "receivers": [],
         }
 
+        if inhibit_rules := self.generate_inhibit_rules(inventory):
+            config["inhibit_rules"] = inhibit_rules
+
         # Calculate receivers
         email_contacts = {
             "name": "email_contacts",
@@ -80,19 +114,38 @@ class AlertManager:
 
         return yaml.dump(config)
 
-    def write_configuration(self) -> None:
-        with self.configuration_path.open("w") as fh:
-            fh.write(self.generate_configuration())
+    def watched_paths(self) -> List[PosixPath]:
+        return sorted((self.files_path / "template").glob("*.tmpl"))
 
-    def execute(self) -> None:
-        return os.execv(
+    def write_configuration(self) -> bool:
+        return write_file_atomically(
+            self.configuration_path, self.generate_configuration()
+        )
+
+    def arguments(self) -> List[str]:
+        storage = get_replica_hosts("alert-manager", self.replica + 1)[self.replica]
+        arguments = [
             self.binary_path.as_posix(),
-            [
-                self.binary_path.as_posix(),
-                "--config.file",
-                self.configuration_path.as_posix(),
-                "--storage.path",
-                get_persistent_data_directory("alert-manager").as_posix(),
-                "--log.level=debug",
-            ],
+            "--config.file",
+            self.configuration_path.as_posix(),
+            "--storage.path",
+            get_persistent_data_directory(storage).as_posix(),
+            "--log.level=debug",
+        ]
+
+        peers = get_replica_hosts(
+            "alertmanager", get_replica_count("ALERTMANAGER_REPLICAS")
         )
+        if len(peers) > 1:
+            # Gossip silences and notification logs so only one replica notifies
+            arguments.append(f"--cluster.listen-address=0.0.0.0:{self.cluster_port}")
+            arguments += [
+                f"--cluster.peer={peer}:{self.cluster_port}"
+                for replica, peer in enumerate(peers)
+                if replica != self.replica
+            ]
+        return arguments
+
+    def execute(self) -> None:
+        arguments = self.arguments()
+        return os.execv(arguments[0], arguments)
@@ -1,12 +1,16 @@
 import os
 from pathlib import PosixPath
+from typing import List
 
 import yaml
 
+from monitoring.helpers import write_file_atomically
+
 
 class BlackboxExporter:
     binary_path = PosixPath("/workspace/bin/blackbox_exporter")
     configuration_path = PosixPath("/tmp/blackbox_exporter.yml")
+    reload_url = "http://localhost:9115/-/reload"
 
     def generate_configuration(self) -> str:
         config = {
@@ -21,17 +25,22 @@ class BlackboxExporter:
         }
         return yaml.dump(config)
 
-    def write_configuration(self) -> None:
-        with self.configuration_path.open("w") as fh:
-            fh.write(self.generate_configuration())
+    def watched_paths(self) -> List[PosixPath]:
+        return []
 
-    def execute(self) -> None:
-        return os.execv(
-            self.binary_path.as_posix(),
-            [
-                self.binary_path.as_posix(),
-                f"--config.file={self.configuration_path.as_posix()}",
-                "--log.level=debug",
-                "--log.prober=debug",
-            ],
+    def write_configuration(self) -> bool:
+        return write_file_atomically(
+            self.configuration_path, self.generate_configuration()
         )
+
+    def arguments(self) -> List[str]:
+        return [
+            self.binary_path.as_posix(),
+            f"--config.file={self.configuration_path.as_posix()}",
+            "--log.level=debug",
+            "--log.prober=debug",
+        ]
+
+    def execute(self) -> None:
+        arguments = self.arguments()
+        return os.execv(arguments[0], arguments)
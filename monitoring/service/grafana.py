@@ -2,16 +2,24 @@ import configparser
 import io
 import os
 from pathlib import PosixPath
+from typing import Dict, List
 
 import yaml
 
-from monitoring.helpers import get_persistent_data_directory
+from monitoring.helpers import (
+    get_persistent_data_directory,
+    get_replica_count,
+    get_replica_hosts,
+    write_file_atomically,
+)
 
 
 class Grafana:
     home_path = PosixPath("/workspace/grafana")
     binary_path = PosixPath("/workspace/grafana/bin/grafana")
     configuration_path = PosixPath("/tmp/grafana.ini")
+    # Grafana has no config reload, so the supervisor restarts it instead
+    reload_url = None
 
     def generate_grafana_configuration(self) -> str:
         tools_db_user = os.environ.get("TOOL_TOOLSDB_USER")
@@ -64,39 +72,68 @@ class Grafana:
                         "name": "Prometheus",
                         "type": "prometheus",
                         "access": "proxy",
-                        "url": "http://prometheus:9090",
+                        # Query frontend, caches and splits range queries and fails over
+                        # between Prometheus replicas
+                        "url": "http://query-frontend:8903",
                         "isDefault": True,
                     },
                     {
-                        "name": "Alertmanager",
-                        "type": "alertmanager",
+                        "name": "Prometheus (long-term)",
+                        "type": "prometheus",
                         "access": "proxy",
-                        "url": "http://alertmanager:9093",
-                        "isDefault": True,
+                        # Downsampled history, see `monitoring.cli downsample`
+                        "url": "http://long-term-prometheus:9091",
                     },
-                ],
+                ]
+                + self._alertmanager_datasources(),
             }
         )
 
-    def write_configuration(self) -> None:
-        with self.configuration_path.open("w") as fh:
-            fh.write(self.generate_grafana_configuration())
+    def _alertmanager_datasources(self) -> List[Dict]:
+        # One per replica, silences gossip between them so any can be used while
+        # another is down
+        return [
+            {
+                "name": "Alertmanager" if replica == 0 else f"Alertmanager ({host})",
+                "type": "alertmanager",
+                "access": "proxy",
+                "url": f"http://{host}:9093",
+                "isDefault": replica == 0,
+            }
+            for replica, host in enumerate(
+                get_replica_hosts(
+                    "alertmanager", get_replica_count("ALERTMANAGER_REPLICAS")
+                )
+            )
+        ]
+
+    def watched_paths(self) -> List[PosixPath]:
+        return []
+
+    def write_configuration(self) -> bool:
+        changed = write_file_atomically(
+            self.configuration_path, self.generate_grafana_configuration()
+        )
 
         persistent_path = get_persistent_data_directory("grafana")
         provisioning_dir = persistent_path / "provisioning"
         provisioning_dir.mkdir(exist_ok=True)
-        with (provisioning_dir / "datasources.yaml").open("w") as fh:
-            fh.write(self.generate_provisioning_configuration())
+        changed |= write_file_atomically(
+            provisioning_dir / "datasources.yaml",
+            self.generate_provisioning_configuration(),
+        )
+        return changed
 
-    def execute(self) -> None:
-        return os.execv(
+    def arguments(self) -> List[str]:
+        return [
             self.binary_path.as_posix(),
-            [
-                self.binary_path.as_posix(),
-                "server",
-                "--config",
-                self.configuration_path.as_posix(),
-                "--homepath",
-                self.home_path.as_posix(),
-            ],
-        )
+            "server",
+            "--config",
+            self.configuration_path.as_posix(),
+            "--homepath",
+            self.home_path.as_posix(),
+        ]
+
+    def execute(self) -> None:
+        arguments = self.arguments()
+        return os.execv(arguments[0], arguments)
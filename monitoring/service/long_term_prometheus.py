@@ -0,0 +1,48 @@
+import os
+from pathlib import PosixPath
+from typing import List
+
+import yaml
+
+from monitoring.helpers import get_persistent_data_directory, write_file_atomically
+
+
+class LongTermPrometheus:
+    """Serves the downsampled history written by `monitoring.cli downsample`.
+
+    Nothing is scraped, the TSDB only receives backfilled blocks.
+    """
+
+    binary_path = PosixPath("/workspace/bin/prometheus")
+    configuration_path = PosixPath("/tmp/prometheus-long-term.yml")
+    reload_url = "http://localhost:9091/-/reload"
+    storage_directory = "prometheus-long-term"
+
+    def generate_configuration(self) -> str:
+        return yaml.dump({"global": {"evaluation_interval": "1h"}})
+
+    def watched_paths(self) -> List[PosixPath]:
+        return []
+
+    def write_configuration(self) -> bool:
+        return write_file_atomically(
+            self.configuration_path, self.generate_configuration()
+        )
+
+    def arguments(self) -> List[str]:
+        return [
+            self.binary_path.as_posix(),
+            "--web.enable-lifecycle",
+            "--web.listen-address",
+            ":9091",
+            "--config.file",
+            self.configuration_path.as_posix(),
+            "--storage.tsdb.path",
+            get_persistent_data_directory(self.storage_directory).as_posix(),
+            "--storage.tsdb.retention.time",
+            os.environ.get("LONG_TERM_PROMETHEUS_RETENTION", "2y"),
+        ]
+
+    def execute(self) -> None:
+        arguments = self.arguments()
+        return os.execv(arguments[0], arguments)
@@ -1,17 +1,37 @@
+import json
+import logging
 import os
 from pathlib import PosixPath
+from typing import Dict, List
 
 import yaml
 
-from monitoring.helpers import get_persistent_data_directory
+from monitoring.helpers import (
+    get_persistent_data_directory,
+    get_replica_count,
+    get_replica_hosts,
+    write_file_atomically,
+)
+from monitoring.inventory import load_inventory
+
+logger = logging.getLogger(__name__)
 
 
 class Prometheus:
     files_path = PosixPath(__file__).parent.parent.parent / "prometheus"
     binary_path = PosixPath("/workspace/bin/prometheus")
     configuration_path = PosixPath("/tmp/prometheus.yml")
+    reload_url = "http://localhost:9090/-/reload"
+    targets_path = PosixPath("/tmp/prometheus-targets")
+
+    def __init__(self, replica: int = 0):
+        self.replica = replica
+        self.name = get_replica_hosts("prometheus", replica + 1)[replica]
 
     def generate_configuration(self) -> str:
+        alertmanagers = get_replica_hosts(
+            "alertmanager", get_replica_count("ALERTMANAGER_REPLICAS")
+        )
         config = {
             "global": {
                 "scrape_interval": "60s",
@@ -20,12 +40,24 @@ class Prometheus:
             },
             "scrape_configs": [],
             "alerting": {
+                # Every peer gets every alert, the cluster deduplicates notifications
                 "alertmanagers": [
-                    {"static_configs": [{"targets": ["alertmanager:9093"]}]}
+                    {
+                        "static_configs": [
+                            {"targets": [f"{host}:9093" for host in alertmanagers]}
+                        ]
+                    }
                 ]
             },
         }
 
+        if get_replica_count("PROMETHEUS_REPLICAS") > 1:
+            config["global"]["external_labels"] = {"replica": self.name}
+            # Alerts from all replicas must be identical to be deduplicated
+            config["alerting"]["alert_relabel_configs"] = [
+                {"action": "labeldrop", "regex": "replica"}
+            ]
+
         if rule_files := [
             path.absolute().as_posix()
             for path in (self.files_path / "rules").glob("*.yml")
@@ -40,73 +72,126 @@ class Prometheus:
             }
         )
 
-        # Alertmanager
+        # Inventory scrape jobs, the job label is set per target group
         config["scrape_configs"].append(
             {
-                "job_name": "alertmanager",
-                "static_configs": [{"targets": ["alertmanager:9093"]}],
-            }
-        )
-
-        # Checker
-        config["scrape_configs"].append(
-            {
-                "job_name": "checker",
-                "static_configs": [{"targets": ["checker:8090"]}],
+                "job_name": "inventory",
+                "file_sd_configs": [
+                    {"files": [(self.targets_path / "scrape-*.json").as_posix()]}
+                ],
             }
         )
-
-        # Blackbox probes
         config["scrape_configs"].append(
             {
-                "job_name": "blackbox",
-                "metrics_path": "/probe",
-                "params": {
-                    "module": [
-                        "http_2xx",
-                    ],
-                },
-                "static_configs": [
-                    {
-                        "targets": [
-                            "cluebotng.toolforge.org",
-                            "cluebotng-review.toolforge.org",
-                            "cluebotng-editsets.toolforge.org",
-                            "cluebotng-staging.toolforge.org",
-                            "cluebotng-trainer.toolforge.org",
-                        ]
-                    }
-                ],
-                "relabel_configs": [
-                    {
-                        "source_labels": ["__address__"],
-                        "target_label": "__param_target",
-                    },
-                    {"source_labels": ["__param_target"], "target_label": "instance"},
-                    {
-                        "target_label": "__address__",
-                        "replacement": "blackbox-exporter:9115",
-                    },
+                "job_name": "inventory-honor-labels",
+                "honor_labels": True,
+                "file_sd_configs": [
+                    {"files": [(self.targets_path / "honor-labels-*.json").as_posix()]}
                 ],
             }
         )
 
-        # Blackbox metrics
-        config["scrape_configs"].append(
-            {
-                "job_name": "blackbox_exporter",
-                "static_configs": [{"targets": ["blackbox-exporter:9115"]}],
-            }
-        )
+        if os.environ.get("PROMETHEUS_PROBER", "blackbox") == "native":
+            # All probe results in one scrape, the prober sets the target labels
+            config["scrape_configs"].append(
+                {
+                    "job_name": "blackbox",
+                    "honor_labels": True,
+                    "static_configs": [{"targets": ["prober:8902"]}],
+                }
+            )
+        else:
+            # Blackbox probes
+            config["scrape_configs"].append(
+                {
+                    "job_name": "blackbox",
+                    "metrics_path": "/probe",
+                    "params": {
+                        "module": [
+                            "http_2xx",
+                        ],
+                    },
+                    "file_sd_configs": [
+                        {"files": [(self.targets_path / "probe-*.json").as_posix()]}
+                    ],
+                    "relabel_configs": [
+                        {
+                            "source_labels": ["__address__"],
+                            "target_label": "__param_target",
+                        },
+                        {
+                            "source_labels": ["__param_target"],
+                            "target_label": "instance",
+                        },
+                        {
+                            "target_label": "__address__",
+                            "replacement": "blackbox-exporter:9115",
+                        },
+                    ],
+                }
+            )
 
         # Note: Most metrics are pushed via grafana-alloy
         return yaml.dump(config)
 
-    def write_configuration(self) -> None:
-        with self.configuration_path.open("w") as fh:
-            fh.write(self.generate_configuration())
+    def watched_paths(self) -> List[PosixPath]:
+        return sorted((self.files_path / "rules").glob("*.yml"))
+
+    def generate_targets(self) -> Dict[str, str]:
+        """file_sd target files (by name) generated from the inventory."""
+        targets = {}
+        for name, tool in load_inventory().tools.items():
+            labels = {"tool": name, "owner": tool.owner}
+            if tool.probes:
+                if tool.probe_interval:
+                    labels["__scrape_interval__"] = tool.probe_interval
+                targets[f"probe-{name}.json"] = [
+                    {"targets": tool.probes, "labels": labels}
+                ]
+
+            for job_name, job in tool.scrape_jobs.items():
+                job_labels = {**labels, "job": job_name}
+                if job.interval:
+                    job_labels["__scrape_interval__"] = job.interval
+                if job.metrics_path:
+                    job_labels["__metrics_path__"] = job.metrics_path
+                prefix = "honor-labels" if job.honor_labels else "scrape"
+                targets[f"{prefix}-{job_name}.json"] = [
+                    {"targets": job.targets, "labels": job_labels}
+                ]
 
-    def execute(self) -> None:
+        return {
+            name: json.dumps(target_groups, indent=2, sort_keys=True)
+            for name, target_groups in targets.items()
+        }
+
+    def write_targets(self) -> List[str]:
+        """Write the target files Prometheus watches, only touching those that changed."""
+        self.targets_path.mkdir(parents=True, exist_ok=True)
+        targets = self.generate_targets()
+        changed = [
+            name
+            for name, content in targets.items()
+            if write_file_atomically(self.targets_path / name, content)
+        ]
+
+        for path in self.targets_path.glob("*.json"):
+            if path.name not in targets:
+                path.unlink()
+                changed.append(path.name)
+
+        if changed:
+            logger.info(f"Updated target files: {changed}")
+        return changed
+
+    def write_configuration(self) -> bool:
+        # Target changes are picked up by file_sd, they never need a reload
+        self.write_targets()
+        return write_file_atomically(
+            self.configuration_path, self.generate_configuration()
+        )
+
+    def arguments(self) -> List[str]:
         tool_data_dir = os.environ.get("TOOL_DATA_DIR")
         if not tool_data_dir:
             raise RuntimeError(f"No TOOL_DATA_DIR")
@@ -115,16 +200,19 @@ class Prometheus:
         if not home_dir.exists():
             raise RuntimeError(f"Data directory does not exist: {home_dir.as_posix()}")
 
-        return os.execv(
+        return [
             self.binary_path.as_posix(),
-            [
-                self.binary_path.as_posix(),
-                "--web.enable-remote-write-receiver",
-                "--config.file",
-                self.configuration_path.as_posix(),
-                "--storage.tsdb.path",
-                get_persistent_data_directory("prometheus").as_posix(),
-                "--storage.tsdb.retention.time",
-                "90d",
-            ],
-        )
+            "--web.enable-remote-write-receiver",
+            "--web.enable-lifecycle",
+            "--config.file",
+            self.configuration_path.as_posix(),
+            "--storage.tsdb.path",
+            get_persistent_data_directory(self.name).as_posix(),
+            "--storage.tsdb.retention.time",
+            # Lower once `downsample` keeps the long-term history
+            os.environ.get("PROMETHEUS_RETENTION", "90d"),
+        ]
+
+    def execute(self) -> None:
+        arguments = self.arguments()
+        return os.execv(arguments[0], arguments)
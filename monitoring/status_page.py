@@ -0,0 +1,287 @@
+import asyncio
+import hashlib
+import html
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+from monitoring.inventory import load_inventory
+from monitoring.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge
+
+logging.basicConfig(
+    level=logging.INFO,
+    stream=sys.stderr,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_URL = os.environ.get("STATUS_PAGE_PROMETHEUS_URL", "http://prometheus:9090")
+ALERTMANAGER_URL = os.environ.get(
+    "STATUS_PAGE_ALERTMANAGER_URL", "http://alertmanager:9093"
+)
+REFRESH_INTERVAL = int(os.environ.get("STATUS_PAGE_REFRESH_INTERVAL", "60"))
+
+REFRESHES = Counter(
+    "status_page_refreshes_total", "Status refreshes by result", ["result"]
+)
+RESPONSES = Counter(
+    "status_page_responses_total",
+    "Responses by document and code (200 or 304)",
+    ["document", "code"],
+)
+LAST_REFRESH = Gauge(
+    "status_page_last_refresh_timestamp_seconds",
+    "When the status was last refreshed successfully",
+)
+
+
+class Document:
+    """A pre-rendered response body with its validator."""
+
+    def __init__(self, body: bytes, media_type: str, etag: str):
+        self.body = body
+        self.media_type = media_type
+        self.etag = etag
+
+
+def body_etag(body: bytes) -> str:
+    """Validator over the exact bytes served.
+
+    The status holds only absolute times (ages are computed by the page's
+    script), so the body and its ETag stay the same until something changes.
+    """
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match list matches, compared weakly as RFC 9110 says."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for candidate in if_none_match.split(",")
+    )
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat(timespec="seconds")
+
+
+async def _query(client: httpx.AsyncClient, expr: str) -> List[Dict]:
+    r = await client.get(f"{PROMETHEUS_URL}/api/v1/query", params={"query": expr})
+    r.raise_for_status()
+    return r.json()["data"]["result"]
+
+
+async def collect_status(client: httpx.AsyncClient) -> Dict:
+    probes, edits, alerts = await asyncio.gather(
+        _query(client, "probe_success"),
+        _query(client, "cbng_monitoring_last_user_contribution_time"),
+        client.get(
+            f"{ALERTMANAGER_URL}/api/v2/alerts",
+            params={"active": "true", "silenced": "false", "inhibited": "false"},
+        ),
+    )
+    alerts.raise_for_status()
+
+    max_edit_ages = {
+        (name, bot.domain): bot.max_edit_age
+        for name, bot in load_inventory().bots.items()
+    }
+
+    bots = []
+    for result in edits:
+        labels = result["metric"]
+        evaluated_at, last_edit = result["value"][0], float(result["value"][1])
+        max_age = max_edit_ages.get((labels.get("username"), labels.get("domain")))
+        bots.append(
+            {
+                "username": labels.get("username"),
+                "domain": labels.get("domain"),
+                "last_edit_at": _timestamp(last_edit),
+                "ok": max_age is None or evaluated_at - last_edit <= max_age,
+            }
+        )
+
+    return {
+        "tools": sorted(
+            (
+                {
+                    "tool": result["metric"].get("tool"),
+                    "instance": result["metric"].get("instance"),
+                    "ok": result["value"][1] == "1",
+                }
+                for result in probes
+            ),
+            key=lambda tool: (tool["tool"] or "", tool["instance"] or ""),
+        ),
+        "bots": sorted(
+            bots, key=lambda bot: (bot["username"] or "", bot["domain"] or "")
+        ),
+        "alerts": sorted(
+            (
+                {
+                    "alertname": alert["labels"].get("alertname"),
+                    "summary": alert.get("annotations", {}).get("summary"),
+                    "starts_at": alert.get("startsAt"),
+                }
+                for alert in alerts.json()
+            ),
+            key=lambda alert: (alert["alertname"] or "", alert["starts_at"] or ""),
+        ),
+    }
+
+
+def _state(ok: bool) -> str:
+    return '<td class="ok">OK</td>' if ok else '<td class="down">DOWN</td>'
+
+
+def _time(timestamp: Optional[str]) -> str:
+    if not timestamp:
+        return ""
+    return f'<time datetime="{html.escape(timestamp)}">{html.escape(timestamp)}</time>'
+
+
+def render_html(status: Dict) -> str:
+    rows = []
+    for tool in status["tools"]:
+        rows.append(
+            f"<tr><td>{html.escape(tool['tool'] or '')}</td>"
+            f"<td>{html.escape(tool['instance'] or '')}</td>{_state(tool['ok'])}</tr>"
+        )
+    bot_rows = []
+    for bot in status["bots"]:
+        bot_rows.append(
+            f"<tr><td>{html.escape(bot['username'] or '')}</td>"
+            f"<td>{html.escape(bot['domain'] or '')}</td>"
+            f"<td>{_time(bot['last_edit_at'])}</td>{_state(bot['ok'])}</tr>"
+        )
+    alert_rows = []
+    for alert in status["alerts"]:
+        alert_rows.append(
+            f"<tr><td>{html.escape(alert['alertname'] or '')}</td>"
+            f"<td>{html.escape(alert['summary'] or '')}</td>"
+            f"<td>{_time(alert['starts_at'])}</td></tr>"
+        )
+
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>ClueBot Status</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+td, th {{ border: 1px solid #ccc; padding: 0.3em 0.8em; text-align: left; }}
+.ok {{ color: #1a7f37; }}
+.down {{ color: #cf222e; font-weight: bold; }}
+</style>
+</head>
+<body>
+<h1>ClueBot Status</h1>
+<p>Also available as <a href="status.json">JSON</a>.</p>
+<h2>Tools</h2>
+<table><tr><th>Tool</th><th>Endpoint</th><th>Status</th></tr>
+{''.join(rows)}</table>
+<h2>Bots</h2>
+<table><tr><th>Bot</th><th>Wiki</th><th>Last edit</th><th>Status</th></tr>
+{''.join(bot_rows)}</table>
+<h2>Firing alerts</h2>
+<table><tr><th>Alert</th><th>Summary</th><th>Since</th></tr>
+{''.join(alert_rows) or '<tr><td colspan="3">None</td></tr>'}</table>
+<script>
+// Relative times are computed here, the cached page only holds absolute ones
+for (const time of document.querySelectorAll("time")) {{
+  const minutes = Math.max(0, Math.round((Date.now() - Date.parse(time.dateTime)) / 60000));
+  time.textContent = `${{minutes}} minute${{minutes === 1 ? "" : "s"}} ago`;
+  time.title = time.dateTime;
+}}
+</script>
+</body>
+</html>
+"""
+
+
+async def _refresh(app: FastAPI, client: httpx.AsyncClient) -> None:
+    while True:
+        started = time.monotonic()
+        try:
+            status = await collect_status(client)
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            # Keep serving the previous status, the last refresh gauge shows its age
+            logger.error(f"Failed to refresh status: {e}")
+            REFRESHES.inc(result="error")
+        else:
+            json_body = json.dumps(status, indent=2).encode("utf-8")
+            html_body = render_html(status).encode("utf-8")
+            app.state.documents = {
+                "json": Document(json_body, "application/json", body_etag(json_body)),
+                "html": Document(
+                    html_body, "text/html; charset=utf-8", body_etag(html_body)
+                ),
+            }
+            REFRESHES.inc(result="success")
+            LAST_REFRESH.set(time.time())
+        await asyncio.sleep(max(REFRESH_INTERVAL - (time.monotonic() - started), 1))
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    app.state.documents = {}
+    async with httpx.AsyncClient(timeout=30) as client:
+        task = asyncio.create_task(_refresh(app, client))
+        yield
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+app = FastAPI(lifespan=_lifespan)
+
+
+def _serve(request: Request, name: str) -> Response:
+    document: Optional[Document] = app.state.documents.get(name)
+    if document is None:
+        RESPONSES.inc(document=name, code="503")
+        return Response(
+            "Status not available yet", status_code=503, headers={"Retry-After": "10"}
+        )
+
+    headers = {
+        "ETag": document.etag,
+        # Lets browsers and any proxy in front share one copy per refresh
+        "Cache-Control": f"public, max-age={REFRESH_INTERVAL}",
+    }
+    if etag_matches(request.headers.get("if-none-match", ""), document.etag):
+        RESPONSES.inc(document=name, code="304")
+        return Response(status_code=304, headers=headers)
+
+    RESPONSES.inc(document=name, code="200")
+    return Response(document.body, media_type=document.media_type, headers=headers)
+
+
+@app.get("/")
+async def _render_page(request: Request):
+    return _serve(request, "html")
+
+
+@app.get("/status.json")
+async def _render_status(request: Request):
+    return _serve(request, "json")
+
+
+@app.get("/metrics")
+async def _render_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/health")
+async def _render_health():
+    return "OK"
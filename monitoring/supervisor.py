@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import signal
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """Keep a service binary running and hot reload it when its inputs change.
+
+    The configuration is regenerated every `interval` seconds, it is only
+    written (atomically) when the content changed. A change to the generated
+    configuration or any of the service's watched files (rules, templates)
+    triggers the binary's `/-/reload` endpoint, services without one are
+    restarted instead.
+    """
+
+    def __init__(self, service, interval: float = 30):
+        self.service = service
+        self.interval = interval
+        self._process: Optional[subprocess.Popen] = None
+        self._watched_hash: Optional[str] = None
+        self._stopping = False
+
+    def _hash_watched_paths(self) -> str:
+        digest = hashlib.sha256()
+        for path in self.service.watched_paths():
+            try:
+                content = path.read_bytes()
+            except FileNotFoundError:
+                # Deleted since it was listed, hash it as removed
+                continue
+            digest.update(path.as_posix().encode("utf-8"))
+            digest.update(content)
+        return digest.hexdigest()
+
+    def _inputs_changed(self) -> bool:
+        config_changed = self.service.write_configuration()
+        watched_hash = self._hash_watched_paths()
+        watched_changed = watched_hash != self._watched_hash
+        self._watched_hash = watched_hash
+        return config_changed or watched_changed
+
+    def _start(self) -> None:
+        arguments: List[str] = self.service.arguments()
+        logger.info(f"Starting {arguments}")
+        self._process = subprocess.Popen(arguments)
+
+    def _stop(self) -> None:
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+
+    def _reload(self) -> None:
+        started = time.monotonic()
+        if self.service.reload_url:
+            try:
+                r = httpx.post(self.service.reload_url, timeout=120)
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to reload {self.service.reload_url}: {e}")
+                return
+
+            if r.status_code != 200:
+                logger.error(
+                    f"Failed to reload {self.service.reload_url}: [{r.status_code}] {r.text}"
+                )
+                return
+        else:
+            self._stop()
+            self._start()
+
+        logger.info(
+            f"Reloaded {type(self.service).__name__} in {time.monotonic() - started:.3f}s"
+        )
+
+    def _handle_signal(self, signum, _) -> None:
+        if signum == signal.SIGHUP:
+            # Force a reload on the next check
+            self._watched_hash = None
+            return
+
+        self._stopping = True
+        if self._process:
+            self._process.send_signal(signum)
+
+    def run(self) -> None:
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self._handle_signal)
+
+        self._inputs_changed()
+        self._start()
+        while True:
+            deadline = time.monotonic() + self.interval
+            while time.monotonic() < deadline:
+                if (exit_code := self._process.poll()) is not None:
+                    logger.info(f"Process exited with {exit_code}")
+                    sys.exit(exit_code)
+                time.sleep(1)
+
+            if not self._stopping and self._inputs_changed():
+                logger.info(f"Inputs for {type(self.service).__name__} changed")
+                self._reload()
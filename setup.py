@@ -71,6 +71,7 @@ def install_alertmanager():
             f"/tmp/alertmanager-{RELEASE_ALERT_MANAGER}.linux-amd64.tar.gz",
             "--strip-components=1",
             f"alertmanager-{RELEASE_ALERT_MANAGER}.linux-amd64/alertmanager",
+            f"alertmanager-{RELEASE_ALERT_MANAGER}.linux-amd64/amtool",
         ],
         check=True,
     )
@@ -0,0 +1,16 @@
+import pytest
+from click.testing import CliRunner
+
+from monitoring.benchmark import alert_latency
+from monitoring.cli import cli
+
+
+def test_benchmark_needs_an_update():
+    with pytest.raises(ValueError):
+        alert_latency.run_benchmark(
+            "ClueBot NG", runs=10, updates=0, latency=0, timeout=1
+        )
+
+    result = CliRunner().invoke(cli, ["benchmark-alert-latency", "--updates", "0"])
+    assert result.exit_code == 2
+    assert "--updates" in result.output
@@ -0,0 +1,193 @@
+import shutil
+import socket
+import subprocess
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+import httpx
+import pytest
+import yaml
+
+from monitoring.inventory import Inventory, load_inventory
+from monitoring.service.alert_manager import AlertManager
+
+Labels = Dict[str, str]
+
+
+def _binary(name: str) -> str:
+    path = AlertManager.binary_path.parent / name
+    if path.exists():
+        return path.as_posix()
+    if found := shutil.which(name):
+        return found
+    pytest.skip(f"{name} is not installed")
+
+
+def _outage_alerts(inventory: Inventory) -> List[Labels]:
+    """Alerts firing together when every inventory bot stops editing."""
+    alerts = []
+    for username, bot in inventory.bots.items():
+        labels = {"username": username, "domain": bot.domain}
+        if bot.tool:
+            labels["tool"] = bot.tool
+        alerts += [
+            {
+                "alertname": "BotNotEditedRecently",
+                **labels,
+                "update_wiki_host": bot.domain,
+                "update_wiki_page": bot.status_page,
+            },
+            {"alertname": "BotHasLowEditCount", **labels},
+        ]
+    alerts.append(
+        {
+            "alertname": "ReportInterfaceDown",
+            "instance": "cluebotng.toolforge.org",
+            "tool": "cluebotng",
+        }
+    )
+    return alerts
+
+
+def _write_configuration(tmp_path, inventory: Inventory, name: str) -> str:
+    path = tmp_path / f"{name}.yml"
+    path.write_text(AlertManager().generate_configuration(inventory))
+    return path.as_posix()
+
+
+@contextmanager
+def _alertmanager(tmp_path, configuration_path: str):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    storage_path = tmp_path / f"storage-{port}"
+    storage_path.mkdir()
+
+    process = subprocess.Popen(
+        [
+            _binary("alertmanager"),
+            "--config.file",
+            configuration_path,
+            "--storage.path",
+            storage_path.as_posix(),
+            f"--web.listen-address=127.0.0.1:{port}",
+            # No clustering, a single instance
+            "--cluster.listen-address=",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if client.get("/-/ready").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Alertmanager did not become ready")
+                time.sleep(0.1)
+            yield client
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def _count_deliveries(
+    client: httpx.Client, configuration_path: str, alerts: List[Labels]
+) -> Dict[str, int]:
+    """Notifications of the first flush per receiver, from the groups Alertmanager built."""
+    with open(configuration_path) as fh:
+        integrations = {
+            receiver["name"]: sum(
+                len(configs)
+                for key, configs in receiver.items()
+                if key.endswith("_configs")
+            )
+            for receiver in yaml.safe_load(fh)["receivers"]
+        }
+
+    client.post(
+        "/api/v2/alerts", json=[{"labels": labels} for labels in alerts]
+    ).raise_for_status()
+
+    deadline = time.monotonic() + 10
+    while sum(
+        len(group["alerts"]) for group in client.get("/api/v2/alerts/groups").json()
+    ) < len(alerts):
+        if time.monotonic() > deadline:
+            raise TimeoutError("Alerts were not grouped")
+        time.sleep(0.1)
+    # The inhibitor consumes the same alert stream as the dispatcher, let it catch up
+    time.sleep(0.5)
+
+    deliveries: Counter = Counter()
+    for group in client.get(
+        "/api/v2/alerts/groups", params={"inhibited": "false"}
+    ).json():
+        if group["alerts"]:
+            deliveries[group["receiver"]["name"]] += integrations[
+                group["receiver"]["name"]
+            ]
+    return dict(deliveries)
+
+
+@pytest.fixture
+def inventory(monkeypatch) -> Inventory:
+    monkeypatch.delenv("MONITORING_SEND_ALERTS_TO", raising=False)
+    return load_inventory()
+
+
+def test_configuration_is_valid(tmp_path, inventory):
+    subprocess.run(
+        [
+            _binary("amtool"),
+            "check-config",
+            _write_configuration(tmp_path, inventory, "alertmanager"),
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+
+def test_outage_routes(tmp_path, inventory):
+    configuration_path = _write_configuration(tmp_path, inventory, "alertmanager")
+    for labels in _outage_alerts(inventory):
+        expected = "wiki-updater" if "update_wiki_page" in labels else "email_contacts"
+        result = subprocess.run(
+            [
+                _binary("amtool"),
+                "config",
+                "routes",
+                "test",
+                f"--config.file={configuration_path}",
+                f"--verify.receivers={expected}",
+                *(f'{name}="{value}"' for name, value in labels.items()),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, f"{labels}: {result.stdout}{result.stderr}"
+
+
+def test_outage_deliveries(tmp_path, inventory):
+    """A stopped bot updates its status page and sends nothing else."""
+    alerts = _outage_alerts(inventory)
+    before_path = _write_configuration(
+        tmp_path, inventory.model_copy(update={"inhibitions": []}), "before"
+    )
+    after_path = _write_configuration(tmp_path, inventory, "after")
+
+    with _alertmanager(tmp_path, before_path) as client:
+        before = _count_deliveries(client, before_path, alerts)
+    with _alertmanager(tmp_path, after_path) as client:
+        after = _count_deliveries(client, after_path, alerts)
+
+    status_pages = len({bot.status_page for bot in inventory.bots.values()})
+    # Low edit counts are grouped into one email, the probe alert into another
+    assert before == {"wiki-updater": status_pages, "email_contacts": 2}
+    assert after == {"wiki-updater": status_pages}
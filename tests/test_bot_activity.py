@@ -0,0 +1,79 @@
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+
+from monitoring.bot_activity import (
+    MARK_OVERLAP,
+    RECENT_WINDOW,
+    BotActivity,
+    _format_timestamp,
+)
+
+HOST, USER = "en.wikipedia.org", "ClueBot NG"
+
+
+def _activity(tmp_path, requests: List[httpx.Request], contributions: List[dict]):
+    def mediawiki(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"query": {"usercontribs": contributions}})
+
+    return BotActivity(
+        httpx.AsyncClient(transport=httpx.MockTransport(mediawiki)),
+        tmp_path / "state.json",
+    )
+
+
+def _poll(activity: BotActivity, now: float) -> None:
+    asyncio.run(activity._update_contributions(HOST, [USER], now))
+
+
+def test_corrupt_state_is_ignored(tmp_path):
+    (tmp_path / "state.json").write_text('{"en.wikipedia.org": {"ClueBot')
+    assert _activity(tmp_path, [], []).state == {}
+
+    (tmp_path / "state.json").write_text("[]")
+    assert _activity(tmp_path, [], []).state == {}
+
+
+def test_listing_starts_at_most_a_window_back(tmp_path):
+    now = time.time()
+    (tmp_path / "state.json").write_text(
+        json.dumps(
+            {
+                HOST: {
+                    USER: {
+                        # The exporter was down for a week
+                        "mark": now - 7 * RECENT_WINDOW,
+                        "last": now - 7 * RECENT_WINDOW,
+                        "edits": {},
+                    }
+                }
+            }
+        )
+    )
+    requests: List[httpx.Request] = []
+    activity = _activity(tmp_path, requests, [])
+
+    _poll(activity, now)
+    assert requests[0].url.params["ucstart"] == _format_timestamp(now - RECENT_WINDOW)
+    assert activity.state[HOST][USER]["mark"] == now - MARK_OVERLAP
+
+
+def test_no_edits_lookup_is_cached_for_the_window(tmp_path):
+    requests: List[httpx.Request] = []
+    activity = _activity(tmp_path, requests, [])
+    now = time.time()
+
+    def lookups() -> int:
+        return sum(request.url.params.get("uclimit") == "1" for request in requests)
+
+    _poll(activity, now)
+    assert lookups() == 1
+    _poll(activity, now + 60)
+    _poll(activity, now + 3600)
+    assert lookups() == 1
+    _poll(activity, now + RECENT_WINDOW + 60)
+    assert lookups() == 2
@@ -0,0 +1,126 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import PosixPath
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from click.testing import CliRunner
+
+from monitoring.cardinality import (
+    DEFAULT_BYTES_PER_SAMPLE,
+    PrometheusAPI,
+    analyze,
+    format_report,
+    referenced_metrics,
+)
+from monitoring.cli import cli
+
+FIXTURES_PATH = PosixPath(__file__).parent / "fixtures"
+
+
+class _PrometheusStandIn(BaseHTTPRequestHandler):
+    """Answers the Prometheus HTTP API from fixture data, unknown queries are empty."""
+
+    fixtures = json.loads((FIXTURES_PATH / "prometheus_api.json").read_text())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/v1/query":
+            query = parse_qs(url.query)["query"][0]
+            data = {
+                "resultType": "vector",
+                "result": self.fixtures[url.path].get(query, []),
+            }
+        elif url.path in self.fixtures:
+            data = self.fixtures[url.path]
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps({"status": "success", "data": data}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def prometheus_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _PrometheusStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_analyze_ranks_series_and_churn(prometheus_url):
+    report = analyze(
+        PrometheusAPI(prometheus_url), ["probe_success == 0", 'up{job="x"} == 0']
+    )
+
+    assert report["head_series"] == 1200
+    container = report["metrics"][0]
+    assert container["name"] == "container_cpu_usage_seconds_total"
+    assert container["type"] == "counter"
+    assert (container["active_series"], container["churned_series"]) == (300, 600)
+    assert container["share"] == 0.75
+    assert report["head_churned_series"] == 620
+    assert report["label_pairs"][0]["head_series"] == 900
+    assert report["label_names"][0] == {"label": "pod", "values": 450}
+
+
+def test_analyze_projects_disk_use_at_retention(prometheus_url):
+    report = analyze(PrometheusAPI(prometheus_url), [])
+
+    assert report["retention"] == "90d"
+    # No compaction yet, the default bytes per sample is assumed
+    assert report["bytes_per_sample"] == DEFAULT_BYTES_PER_SAMPLE
+    assert report["projected_bytes"] == 100 * DEFAULT_BYTES_PER_SAMPLE * 90 * 86400
+    assert report["blocks_bytes"] == 1024**3
+
+
+def test_analyze_flags_unreferenced_metrics(prometheus_url):
+    report = analyze(
+        PrometheusAPI(prometheus_url),
+        ['{__name__=~"probe_.*"}', "rate(container_cpu_usage_seconds_total[5m])"],
+    )
+    assert report["unreferenced_metrics"] == [
+        {"name": "unused_metric", "head_series": 20},
+        {"name": "up", "head_series": 60},
+    ]
+    assert "unused_metric (20 series)" in format_report(report, 100 * 1024**3)
+
+
+def test_referenced_metrics_follows_name_matchers():
+    assert referenced_metrics(
+        ["up", "probe_success", "probe_duration_seconds", "other"],
+        ['{__name__=~"probe_.*"}', '{__name__="up"}'],
+    ) == {"up", "probe_success", "probe_duration_seconds"}
+
+
+def test_command_reports_against_stand_in(prometheus_url):
+    result = CliRunner().invoke(
+        cli,
+        [
+            "analyze-cardinality",
+            "--prometheus-url",
+            prometheus_url,
+            "--dashboards",
+            (FIXTURES_PATH / "dashboard.json").as_posix(),
+            "--json",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    unreferenced = {
+        metric["name"] for metric in json.loads(result.output)["unreferenced_metrics"]
+    }
+    # Used by the dashboard, the repo rules and nothing at all respectively
+    assert "container_cpu_usage_seconds_total" not in unreferenced
+    assert "probe_success" not in unreferenced
+    assert "unused_metric" in unreferenced
@@ -0,0 +1,132 @@
+import io
+import re
+import shutil
+
+import pytest
+
+from monitoring import downsample
+from monitoring.downsample import DELAY, WINDOW, Downsampler
+from monitoring.helpers import PROMTOOL_PATH
+
+# A day boundary, so windows line up with both resolutions
+NOW = 1792353600 + DELAY
+
+
+class StubAPI:
+    """Answers range queries with one sample per step, recording the queries."""
+
+    def __init__(self, fail_after=None):
+        self.queries = []
+        self.fail_after = fail_after
+
+    def get(self, path, **params):
+        if path == "/api/v1/label/__name__/values":
+            return ["up", "probe_success", "go_goroutines"]
+        assert path == "/api/v1/query_range"
+        if self.fail_after is not None and len(self.queries) >= self.fail_after:
+            raise ConnectionError("Prometheus went away")
+        self.queries.append(params)
+        return {
+            "result": [
+                {
+                    "metric": {"job": "prober", "instance": 'probe "a"'},
+                    "values": [
+                        [timestamp, "1"]
+                        for timestamp in range(
+                            params["start"], params["end"] + 1, params["step"]
+                        )
+                    ],
+                }
+            ]
+        }
+
+
+@pytest.fixture
+def downsampler(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOOL_DATA_DIR", tmp_path.as_posix())
+    return Downsampler(StubAPI(), metrics="up|probe_success")
+
+
+def test_first_run_windows_cover_the_lookback(downsampler):
+    windows = list(downsampler.pending_windows("1h", {}, NOW + 1799))
+
+    assert windows[0][0] == NOW - downsample.INITIAL_LOOKBACK
+    # Whole steps only, the hour still receiving samples is left alone
+    assert windows[-1] == (NOW - WINDOW, NOW - DELAY)
+    assert all(end - start == WINDOW for start, end in windows[:-1])
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+
+
+def test_windows_resume_where_the_last_run_stopped(downsampler):
+    state = {"5m": NOW - DELAY - 600}
+
+    assert list(downsampler.pending_windows("5m", state, NOW + 299)) == [
+        (NOW - DELAY - 600, NOW - DELAY)
+    ]
+    assert list(downsampler.pending_windows("5m", {"5m": NOW - DELAY}, NOW)) == []
+
+
+def test_window_is_written_as_openmetrics(downsampler):
+    fh = io.StringIO()
+    start = NOW - DELAY - 900
+
+    samples = downsampler.write_window(
+        fh, "5m", start, NOW - DELAY, downsampler._metric_names()
+    )
+
+    lines = fh.getvalue().splitlines()
+    # 3 buckets of 4 aggregations of 2 metrics
+    assert samples == 24
+    assert lines[:4] == [
+        "# TYPE probe_success:min_5m gauge",
+        f'probe_success:min_5m{{instance="probe \\"a\\"",job="prober"}} 1 {start + 300}',
+        f'probe_success:min_5m{{instance="probe \\"a\\"",job="prober"}} 1 {start + 600}',
+        f'probe_success:min_5m{{instance="probe \\"a\\"",job="prober"}} 1 {start + 900}',
+    ]
+    assert lines[-1] == "# EOF"
+    # The first bucket ends one step in, the window's start belongs to the previous one
+    assert downsampler.api.queries[0] == {
+        "query": 'min_over_time({__name__="probe_success"}[5m])',
+        "start": start + 300,
+        "end": NOW - DELAY,
+        "step": 300,
+    }
+    assert {
+        re.match(r"\w+_over_time", query["query"]).group(0)
+        for query in downsampler.api.queries
+    } == {f"{aggregation}_over_time" for aggregation in downsample.AGGREGATIONS}
+
+
+def test_failed_window_is_retried(downsampler, monkeypatch):
+    blocks = []
+    monkeypatch.setattr(
+        downsampler, "create_blocks", lambda path: blocks.append(path.read_text())
+    )
+    monkeypatch.setattr(downsample, "INITIAL_LOOKBACK", 2 * WINDOW)
+    # Fails half way through the first 1h window
+    downsampler.api.fail_after = 16 + 4
+
+    with pytest.raises(ConnectionError):
+        downsampler.run(NOW)
+    assert downsampler.load_state() == {"5m": NOW - DELAY}
+    assert len(blocks) == 2
+    assert not list(downsampler.staging_path.iterdir())
+
+    downsampler.api.fail_after = None
+    downsampler.run(NOW)
+    assert downsampler.load_state() == {"5m": NOW - DELAY, "1h": NOW - DELAY}
+    assert len(blocks) == 4
+
+
+def test_promtool_accepts_the_window(downsampler, tmp_path, monkeypatch):
+    if PROMTOOL_PATH.exists():
+        promtool = PROMTOOL_PATH
+    elif found := shutil.which("promtool"):
+        promtool = downsample.PosixPath(found)
+    else:
+        pytest.skip("promtool is not installed")
+    monkeypatch.setattr(downsample, "PROMTOOL_PATH", promtool)
+    monkeypatch.setattr(downsample, "INITIAL_LOOKBACK", WINDOW)
+
+    assert downsampler.run(NOW) == 2 * 4 * (276 + 23)
+    assert [path.name for path in downsampler.output_path.iterdir()]
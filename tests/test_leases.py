@@ -0,0 +1,100 @@
+import threading
+import time
+
+from monitoring.receivers.leases import LeaseManager
+
+
+def _expired_lease(path) -> LeaseManager:
+    crashed = LeaseManager(path, ttl=0.01)
+    assert crashed.acquire("page")
+    time.sleep(0.02)
+    return crashed
+
+
+def test_lease_is_exclusive_until_released(tmp_path):
+    first, second = LeaseManager(tmp_path), LeaseManager(tmp_path)
+    assert first.acquire("page")
+    assert not second.acquire("page")
+    first.release("page")
+    assert second.acquire("page")
+
+
+def test_only_one_takes_over_an_expired_lease(tmp_path):
+    for attempt in range(20):
+        path = tmp_path / str(attempt)
+        _expired_lease(path)
+        managers = [LeaseManager(path) for _ in range(16)]
+        barrier = threading.Barrier(len(managers))
+        won = []
+
+        def contend(manager):
+            barrier.wait()
+            if manager.acquire("page"):
+                won.append(manager)
+
+        threads = [threading.Thread(target=contend, args=(m,)) for m in managers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(won) == 1
+
+
+def test_stale_read_does_not_take_over_a_new_lease(tmp_path):
+    crashed = _expired_lease(tmp_path)
+    expired = crashed._read("page")
+    slow, fast = LeaseManager(tmp_path), LeaseManager(tmp_path)
+
+    # Both saw the expired lease, the fast one replaces it first
+    assert fast.acquire("page")
+    slow._read = lambda key: expired
+    assert not slow.acquire("page")
+    assert fast.renew("page")
+    assert "page" in fast._held and fast._read("page") == fast._held["page"]
+
+
+def test_expired_holder_loses_its_lease(tmp_path):
+    crashed = _expired_lease(tmp_path)
+    assert LeaseManager(tmp_path).acquire("page")
+    assert not crashed.renew("page")
+    assert not crashed.holds("page")
+    # Releasing a lost lease leaves the new holder's lease in place
+    crashed.release("page")
+    assert (tmp_path / "page.lease").exists()
+
+
+def test_renewal_extends_the_lease(tmp_path):
+    holder = LeaseManager(tmp_path, ttl=0.2)
+    assert holder.acquire("page")
+    for _ in range(5):
+        time.sleep(0.12)
+        assert holder.renew("page")
+    assert not LeaseManager(tmp_path).acquire("page")
+    assert not list(tmp_path.glob("*.claim")) and not list(tmp_path.glob("*.tmp"))
+
+
+def test_lease_is_linked_into_place_whole(tmp_path):
+    holder = LeaseManager(tmp_path)
+    assert holder.acquire("page")
+
+    lease_path = tmp_path / "page.lease"
+    # The unique file it was written to is gone, leaving the single link
+    assert lease_path.stat().st_nlink == 1
+    assert [path.name for path in tmp_path.iterdir()] == ["page.lease"]
+    assert lease_path.read_text() == holder._held["page"]
+
+
+def test_claim_blocks_other_changes_until_abandoned(tmp_path):
+    crashed = _expired_lease(tmp_path)
+    content = crashed._read("page")
+    # A process that died between claiming the expired lease and replacing it
+    claim_path = LeaseManager(tmp_path)._claim("page", content)
+    assert claim_path.stat().st_nlink == 2
+
+    other = LeaseManager(tmp_path, ttl=0.01)
+    assert not other.acquire("page")
+    time.sleep(0.02)
+    # The first attempt clears the abandoned claim, the next takes over
+    assert not other.acquire("page")
+    assert not claim_path.exists()
+    assert other.acquire("page")
@@ -0,0 +1,40 @@
+import asyncio
+
+from monitoring import prober
+from monitoring.metrics import Metric, format_labels
+
+TARGET = "cluebotng.toolforge.org"
+LABELS = {"instance": TARGET, "tool": "cluebotng", "owner": "cluebotng"}
+
+
+def _value(metric: Metric) -> float:
+    prefix = f"{metric.name}{format_labels(LABELS)} "
+    line = next(
+        line for line in metric.render().splitlines() if line.startswith(prefix)
+    )
+    return float(line[len(prefix) :])
+
+
+def test_unexpected_error_fails_the_probe():
+    async def run():
+        target_prober = prober.Prober()
+        target_prober.targets = {TARGET: (60, LABELS)}
+
+        async def respond(url, phases):
+            return 200, None, None
+
+        async def broken(url, phases):
+            raise ValueError("unexpected")
+
+        target_prober._request = respond
+        await target_prober.probe(TARGET)
+        assert _value(prober.PROBE_SUCCESS) == 1
+
+        target_prober._request = broken
+        await target_prober.probe(TARGET)
+        await target_prober.pool.aclose()
+
+    asyncio.run(run())
+    assert _value(prober.PROBE_SUCCESS) == 0
+    assert _value(prober.PROBE_HTTP_STATUS) == 0
+    assert _value(prober.PROBE_ERRORS) == 1
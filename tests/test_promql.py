@@ -0,0 +1,58 @@
+from monitoring import promql
+from monitoring.rule_lint import Linter, Rule
+
+
+def _rule(expr: str) -> Rule:
+    return Rule("test.yml", "test", "test", expr, None)
+
+
+def test_subquery_is_not_a_selector():
+    expr = "max_over_time(rate(x[5m])[1h:1m])"
+
+    assert [
+        (selector.metric, selector.range) for selector in promql.selectors(expr)
+    ] == [("x", "5m")]
+    assert promql.metric_names(expr) == {"x"}
+    (subquery,) = promql.subqueries(expr)
+    assert (subquery.range_seconds, subquery.step_seconds) == (3600, 60)
+    assert expr[subquery.start : subquery.end] == "rate(x[5m])[1h:1m]"
+
+
+def test_subquery_forms():
+    expr = (
+        'max_over_time(up{job="a"}[1h:] offset 5m)'
+        " + min_over_time(sum by (job) (rate(y[5m]))[30m:1m])"
+        " + avg_over_time(z[$__range:$__interval])"
+    )
+
+    assert [
+        (selector.metric, selector.range) for selector in promql.selectors(expr)
+    ] == [("up", None), ("y", "5m"), ("z", None)]
+    assert [
+        (expr[subquery.start : subquery.end], subquery.step)
+        for subquery in promql.subqueries(expr)
+    ] == [
+        ('up{job="a"}[1h:]', None),
+        ("sum by (job) (rate(y[5m]))[30m:1m]", "1m"),
+        ("z[$__range:$__interval]", "$__interval"),
+    ]
+
+
+def test_recording_rule_names_are_metrics():
+    assert promql.metric_names("job:x:rate5m[1h:] > 0") == {"job:x:rate5m"}
+
+
+def test_lint_counts_subquery_steps():
+    linter = Linter(
+        {"x": 10}, scrape_interval=60, evaluation_interval=60, max_range=86400
+    )
+
+    # 5 samples of 10 series, at 60 steps of the hour
+    assert linter.cost(_rule("max_over_time(rate(x[5m])[1h:1m])"))["samples"] == (
+        10 * 5 * 60
+    )
+    assert linter.cost(_rule("max_over_time(x[1h:])"))["samples"] == 10 * 60
+    assert [
+        finding.message
+        for finding in linter.findings([_rule("max_over_time(rate(x[5m])[7d:1h])")])
+    ] == ["Range of 7d in rate(x[5m])[7d:1h]"]
@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+
+from monitoring import query_frontend
+from monitoring.query_frontend import split_range
+
+
+@pytest.mark.parametrize(
+    "start, end, step",
+    [
+        (100, 200, -10),
+        (100, 200, 0),
+        (100, 200, float("nan")),
+        (200, 100, 10),
+        # 30 days at a 1s step is far over Prometheus' 11000 points
+        (0, 30 * 86400, 1),
+    ],
+)
+def test_split_range_rejects_invalid_ranges(start, end, step):
+    with pytest.raises(ValueError):
+        split_range(start, end, step)
+
+
+def test_split_range_aligns_chunks_to_interval():
+    assert split_range(0, 7200, 600, interval=3600) == [
+        (0, 3000),
+        (3600, 6600),
+        (7200, 7200),
+    ]
+
+
+def _not_queried(request):
+    raise AssertionError("Prometheus must not be queried")
+
+
+async def _get(path, params, upstream=_not_queried):
+    async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+        query_frontend.app.state.frontend = query_frontend.QueryFrontend(
+            client, query_frontend.ChunkCache(1024, None, 0)
+        )
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=query_frontend.app),
+            base_url="http://query-frontend",
+        ) as frontend:
+            return await frontend.get(path, params=params)
+
+
+async def _query_range(params, upstream=_not_queried):
+    return await _get("/api/v1/query_range", params, upstream)
+
+
+@pytest.mark.parametrize("step", ["-10", "0", "0s"])
+def test_invalid_step_is_a_bad_request(step):
+    r = asyncio.run(
+        _query_range({"query": "up", "start": "100", "end": "200", "step": step})
+    )
+    assert r.status_code == 400
+    assert r.json()["errorType"] == "bad_data"
+
+
+def test_missing_parameter_is_a_bad_request():
+    r = asyncio.run(_query_range({"query": "up", "start": "100", "end": "200"}))
+    assert r.status_code == 400
+    assert r.json()["errorType"] == "bad_data"
+
+
+def _unreachable(request):
+    raise httpx.ConnectError("Connection refused", request=request)
+
+
+def _html(request):
+    return httpx.Response(200, text="<html>Bad gateway</html>")
+
+
+@pytest.mark.parametrize("upstream, status_code", [(_unreachable, 503), (_html, 502)])
+def test_upstream_failure_is_unavailable(monkeypatch, upstream, status_code):
+    monkeypatch.setattr(
+        query_frontend,
+        "UPSTREAM_URLS",
+        ["http://prometheus:9090", "http://prometheus-1:9090"],
+    )
+    r = asyncio.run(
+        _query_range(
+            {"query": "up", "start": "100", "end": "200", "step": "10"}, upstream
+        )
+    )
+    assert r.status_code == status_code
+    assert r.json()["errorType"] == "unavailable"
+
+
+def test_proxied_request_with_no_upstream_is_unavailable(monkeypatch):
+    monkeypatch.setattr(query_frontend, "UPSTREAM_URLS", ["http://prometheus:9090"])
+    r = asyncio.run(_get("/api/v1/query", {"query": "up"}, _unreachable))
+    assert r.status_code == 503
+    assert r.json() == {
+        "status": "error",
+        "errorType": "unavailable",
+        "error": "No upstream reachable: Connection refused",
+    }
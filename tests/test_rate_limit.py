@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from monitoring.receivers.rate_limit import (
+    CircuitBreaker,
+    HostGuard,
+    HostUnavailable,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=5, clock=clock)
+
+    for _ in range(5):
+        asyncio.run(bucket.acquire())
+    assert bucket.tokens == 0
+
+    clock.now += 1.5
+    assert bucket.tokens == 3
+    clock.now += 60
+    assert bucket.tokens == 5
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60, clock=clock)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    clock.now += 45
+    assert breaker.remaining() == 15
+
+    clock.now += 15
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only the single trial request goes through
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_failed_trial_reopens_and_successful_trial_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=clock)
+    breaker.record_failure()
+
+    clock.now += 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.remaining() == 60
+
+    clock.now += 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0 and breaker.allow()
+
+
+def test_retry_after_overrides_the_bucket():
+    clock = FakeClock()
+    guard = HostGuard(
+        "en.wikipedia.org",
+        rate=10,
+        burst=10,
+        failure_threshold=5,
+        reset_timeout=60,
+        clock=clock,
+    )
+    guard.record_failure(retry_after=120)
+
+    with pytest.raises(HostUnavailable) as e:
+        asyncio.run(guard.acquire())
+    assert e.value.retry_after == 120
+    # Backoff is longer than the circuit breaker would wait
+    assert guard.retry_after() == 120
+    assert guard.bucket.tokens == 10
+
+    clock.now += 120
+    asyncio.run(guard.acquire())
+    assert guard.bucket.tokens == 9
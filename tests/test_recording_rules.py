@@ -0,0 +1,24 @@
+from monitoring.recording_rules import find_candidates, rewrite_expression
+
+CURRENT = "sum by (job) (rate(x_total[5m]))"
+WEEK_AGO = "sum by (job) (rate(x_total[5m] offset 1w))"
+PINNED = "sum by (job) (rate(x_total[5m] @ end()))"
+
+
+def test_repeated_call_is_recorded():
+    candidates = find_candidates([CURRENT, CURRENT])
+
+    assert [candidate.name for candidate in candidates.values()] == ["job:x:rate5m"]
+    assert rewrite_expression(CURRENT, candidates) == "job:x:rate5m"
+
+
+def test_modified_selectors_are_not_recorded():
+    candidates = find_candidates([CURRENT, CURRENT, WEEK_AGO, WEEK_AGO, PINNED, PINNED])
+
+    assert list(candidates) == ["sum by (job) (rate(x_total[5m]))"]
+    # A week over week panel keeps comparing against last week's data
+    assert (
+        rewrite_expression(f"{CURRENT} / {WEEK_AGO}", candidates)
+        == f"job:x:rate5m / {WEEK_AGO}"
+    )
+    assert rewrite_expression(PINNED, candidates) == PINNED
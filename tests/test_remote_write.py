@@ -0,0 +1,57 @@
+import pytest
+
+from monitoring import remote_write
+
+SERIES = [
+    remote_write.TimeSeries(
+        (("__name__", "up"), ("instance", "bot-activity:8905")),
+        [(1.0, 1700000000000), (0.5, -1)],
+    ),
+    remote_write.TimeSeries((("__name__", "x" * 300),), [(2.0, 0)]),
+]
+
+
+def test_round_trip():
+    body = remote_write.snappy_compress(remote_write.encode_write_request(SERIES))
+    assert (
+        remote_write.decode_write_request(remote_write.snappy_decompress(body))
+        == SERIES
+    )
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"\x05\x01",
+        b"\xff\xff\xff\xff\x7f",
+        b"\x80",
+        b"\x0a\x00\xff",
+    ],
+)
+def test_malformed_snappy_is_a_decode_error(body):
+    with pytest.raises(remote_write.DecodeError):
+        remote_write.snappy_decompress(body)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        # Truncated in the middle of a series
+        remote_write.encode_write_request(SERIES)[:-3],
+        # Varint that never ends
+        b"\x0a" + b"\xff" * 11,
+        # Length past the end of the message
+        b"\x0a\x05\x0a",
+        # Label encoded as a varint
+        b"\x0a\x04\x0a\x02\x08\x01",
+        # Sample value shorter than a double
+        b"\x0a\x06\x12\x04\x09\x00\x00\x00",
+        # Deprecated group wire type
+        b"\x0b",
+        # Label value that is not UTF-8
+        b"\x0a\x08\x0a\x06\x0a\x01a\x12\x01\xff",
+    ],
+)
+def test_malformed_protobuf_is_a_decode_error(data):
+    with pytest.raises(remote_write.DecodeError):
+        remote_write.decode_write_request(data)
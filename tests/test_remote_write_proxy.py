@@ -0,0 +1,127 @@
+import asyncio
+
+import httpx
+import pytest
+
+from monitoring import remote_write
+from monitoring.receivers import remote_write_proxy
+from monitoring.receivers.series_processor import ProxyConfig, SeriesProcessor
+
+HEALTHY, DOWN = (
+    "http://prometheus:9090/api/v1/write",
+    "http://prometheus-1:9090/api/v1/write",
+)
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(remote_write_proxy, "UPSTREAM_URLS", [HEALTHY, DOWN])
+    monkeypatch.setattr(remote_write_proxy, "MAX_PENDING_SAMPLES", 100)
+    monkeypatch.setattr(remote_write_proxy, "MAX_RETRY_DELAY", 0.01)
+
+
+def _series(count: int, start: int = 0):
+    return [
+        remote_write.TimeSeries(
+            (("__name__", "up"), ("instance", str(i))), [(1.0, start)]
+        )
+        for i in range(count)
+    ]
+
+
+async def _run(down: set, batches: int):
+    received = {HEALTHY: 0, DOWN: 0}
+
+    def upstream(request):
+        url = str(request.url)
+        if url in down:
+            return httpx.Response(503)
+        received[url] += 1
+        return httpx.Response(204)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+        proxy = remote_write_proxy.RemoteWriteProxy(
+            SeriesProcessor(ProxyConfig()), client
+        )
+        forwarders = [
+            asyncio.create_task(proxy.forwarder(upstream))
+            for upstream in proxy.upstreams
+        ]
+        for batch in range(batches):
+            proxy.add(_series(10, start=batch))
+            await proxy.flush()
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        for forwarder in forwarders:
+            forwarder.cancel()
+        await asyncio.gather(*forwarders, return_exceptions=True)
+    return proxy, received
+
+
+def test_down_replica_does_not_push_back_clients():
+    proxy, received = asyncio.run(_run({DOWN}, batches=30))
+    healthy, down = proxy.upstreams
+
+    assert received[HEALTHY] == 30 and healthy.queued_samples == 0
+    # The down replica keeps only its newest samples
+    assert down.queued_samples <= remote_write_proxy.MAX_PENDING_SAMPLES
+    assert not down.healthy
+    assert proxy.buffered_samples < remote_write_proxy.MAX_PENDING_SAMPLES
+
+
+def test_all_replicas_down_pushes_back_clients():
+    proxy, _ = asyncio.run(_run({HEALTHY, DOWN}, batches=30))
+    assert proxy.buffered_samples >= remote_write_proxy.MAX_PENDING_SAMPLES
+
+
+def test_rejected_batch_only_drops_the_bad_series(monkeypatch):
+    monkeypatch.setattr(remote_write_proxy, "UPSTREAM_URLS", [HEALTHY])
+    accepted = []
+
+    def upstream(request):
+        timeseries = remote_write.decode_write_request(
+            remote_write.snappy_decompress(request.content)
+        )
+        if any(dict(series.labels)["instance"] == "bad" for series in timeseries):
+            return httpx.Response(400, text="out of order sample")
+        accepted.extend(dict(series.labels)["instance"] for series in timeseries)
+        return httpx.Response(204)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+            proxy = remote_write_proxy.RemoteWriteProxy(
+                SeriesProcessor(ProxyConfig()), client
+            )
+            proxy.add(_series(20))
+            proxy.add(
+                [
+                    remote_write.TimeSeries(
+                        (("__name__", "up"), ("instance", "bad")), [(1.0, 0)]
+                    )
+                ]
+            )
+            await proxy.flush()
+            (upstream_queue,) = proxy.upstreams
+            batch, body, size = upstream_queue.batches.popleft()
+            await proxy._deliver(upstream_queue, batch, body, size)
+
+    asyncio.run(run())
+    assert sorted(accepted) == sorted(str(i) for i in range(20))
+
+
+@pytest.mark.parametrize("body", [b"\x05\x01", remote_write.snappy_compress(b"\x0b")])
+def test_malformed_body_is_a_bad_request(body):
+    async def run():
+        async with httpx.AsyncClient() as client:
+            remote_write_proxy.app.state.proxy = remote_write_proxy.RemoteWriteProxy(
+                SeriesProcessor(ProxyConfig()), client
+            )
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=remote_write_proxy.app),
+                base_url="http://remote-write-proxy",
+            ) as proxy:
+                return await proxy.post(
+                    "/api/v1/write", content=body, headers=remote_write.HEADERS
+                )
+
+    assert asyncio.run(run()).status_code == 400
@@ -0,0 +1,140 @@
+import shutil
+import subprocess
+
+import pytest
+import yaml
+
+from monitoring.helpers import PROMTOOL_PATH
+from monitoring.inventory import Bot, Inventory, load_inventory
+from monitoring.rules import THRESHOLD_LABELS, bot_thresholds, generate_bot_rules
+from monitoring.service.prometheus import Prometheus
+
+BOT_LABELS = {
+    "username": "ClueBot NG",
+    "domain": "en.wikipedia.org",
+    "job": "checker",
+    "instance": "bot-activity:8905",
+}
+
+
+def _promtool() -> str:
+    if PROMTOOL_PATH.exists():
+        return PROMTOOL_PATH.as_posix()
+    if found := shutil.which("promtool"):
+        return found
+    pytest.skip("promtool is not installed")
+
+
+def _series(name: str, labels: dict) -> str:
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def test_rule_count_does_not_grow_with_bots():
+    bots = {
+        f"Bot {index}": Bot(
+            domain="en.wikipedia.org",
+            run_page=f"User:Bot_{index}/Run",
+            max_edit_age=3600,
+            min_recent_edits=10,
+        )
+        for index in range(50)
+    }
+
+    assert len(bot_thresholds(Inventory(bots=bots))) == 150
+    # The committed rules are what the generator writes
+    assert (
+        generate_bot_rules()
+        == (Prometheus.files_path / "rules" / "bots.yml").read_text()
+    )
+    assert len(yaml.safe_load(generate_bot_rules())["groups"][0]["rules"]) == 3
+
+
+def test_thresholds_carry_routing_labels():
+    thresholds = {
+        labels[THRESHOLD_LABELS.index("kind")]: dict(zip(THRESHOLD_LABELS, labels))
+        for labels in bot_thresholds(load_inventory())
+        if labels[0] == "ClueBot NG"
+    }
+
+    assert thresholds["max_edit_age"] == {
+        "username": "ClueBot NG",
+        "domain": "en.wikipedia.org",
+        "kind": "max_edit_age",
+        "summary": "ClueBot NG has not edited for > 1 hour",
+        "update_wiki_host": "en.wikipedia.org",
+        "update_wiki_page": "User:ClueBot_NG/running",
+        "tool": "cluebotng",
+    }
+    assert thresholds["min_recent_edits"]["update_wiki_page"] == ""
+
+
+def test_alert_takes_summary_from_threshold(tmp_path):
+    rules_path = tmp_path / "bots.yml"
+    rules_path.write_text(generate_bot_rules())
+
+    input_series = [
+        {
+            "series": _series(
+                "cbng_monitoring_last_user_contribution_time", BOT_LABELS
+            ),
+            "values": "0+0x80",
+        }
+    ]
+    for labels, value in bot_thresholds(load_inventory()).items():
+        # Prometheus drops empty labels on ingestion
+        threshold_labels = {
+            **{name: v for name, v in zip(THRESHOLD_LABELS, labels) if v},
+            "job": "checker",
+            "instance": "bot-activity:8905",
+        }
+        input_series.append(
+            {
+                "series": _series("cbng_monitoring_threshold", threshold_labels),
+                "values": f"{value}+0x80",
+            }
+        )
+
+    test_path = tmp_path / "test.yml"
+    test_path.write_text(
+        yaml.dump(
+            {
+                "rule_files": [rules_path.as_posix()],
+                "evaluation_interval": "1m",
+                "tests": [
+                    {
+                        "interval": "1m",
+                        "input_series": input_series,
+                        "alert_rule_test": [
+                            # Over the hour at 61m, firing 5 minutes later
+                            {"eval_time": "65m", "alertname": "BotNotEditedRecently"},
+                            {
+                                "eval_time": "66m",
+                                "alertname": "BotNotEditedRecently",
+                                "exp_alerts": [
+                                    {
+                                        "exp_labels": {
+                                            **BOT_LABELS,
+                                            "update_wiki_host": "en.wikipedia.org",
+                                            "update_wiki_page": "User:ClueBot_NG/running",
+                                            "tool": "cluebotng",
+                                            "summary": "ClueBot NG has not edited for > 1 hour",
+                                        },
+                                        "exp_annotations": {
+                                            "summary": "ClueBot NG has not edited for > 1 hour"
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    }
+                ],
+            }
+        )
+    )
+
+    result = subprocess.run(
+        [_promtool(), "test", "rules", test_path.as_posix()],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,87 @@
+import pytest
+
+from monitoring.remote_write import TimeSeries
+from monitoring.receivers.series_processor import (
+    AggregateRule,
+    ProxyConfig,
+    RelabelRule,
+    SeriesProcessor,
+)
+
+
+def _relabel(replacement: str) -> dict:
+    processor = SeriesProcessor(
+        ProxyConfig(
+            relabel=[
+                RelabelRule(
+                    source_labels=["namespace"],
+                    regex="tool-(?P<name>.*)",
+                    target_label="tool",
+                    replacement=replacement,
+                )
+            ]
+        )
+    )
+    forwarded, _, _ = processor.process(
+        [TimeSeries((("__name__", "up"), ("namespace", "tool-bot")), [(1.0, 0)])]
+    )
+    return dict(forwarded[0].labels)
+
+
+@pytest.mark.parametrize(
+    "replacement, expected",
+    [
+        ("$1", "bot"),
+        ("${1}foo", "botfoo"),
+        ("$name", "bot"),
+        ("$$1", "$1"),
+        # As in Prometheus, `$1foo` refers to a (missing) group named `1foo`
+        ("x$1foo", "x"),
+        ("$2", None),
+    ],
+)
+def test_relabel_replacement_expansion(replacement, expected):
+    assert _relabel(replacement).get("tool") == expected
+
+
+def _counter_sums(samples) -> list:
+    processor = SeriesProcessor(
+        ProxyConfig(
+            aggregate=[
+                AggregateRule(
+                    match={"__name__": "requests_total"}, without=["pod"], counter=True
+                )
+            ]
+        ),
+        staleness=60,
+    )
+    sums = []
+    for timestamp, values in samples:
+        processor.process(
+            [
+                TimeSeries(
+                    (("__name__", "requests_total"), ("pod", pod)),
+                    [(value, timestamp)],
+                )
+                for pod, value in values.items()
+            ]
+        )
+        for series in processor.aggregated(timestamp):
+            sums.append(series.samples[0][0])
+    return sums
+
+
+def test_counter_aggregate_survives_resets_and_stale_members():
+    sums = _counter_sums(
+        [
+            (0, {"a": 100, "b": 50}),
+            (30_000, {"a": 110, "b": 60}),
+            # b restarted
+            (60_000, {"a": 120, "b": 5}),
+            # b went away and is dropped as stale later on
+            (90_000, {"a": 130}),
+            (200_000, {"a": 140}),
+        ]
+    )
+    assert sums == [0, 20, 35, 45, 55]
+    assert sums == sorted(sums)
@@ -0,0 +1,104 @@
+import asyncio
+
+import httpx
+
+from monitoring import status_page
+
+
+def _status(last_edit_at: str, ok: bool = True) -> dict:
+    return {
+        "tools": [{"tool": "cluebotng", "instance": "cluebotng", "ok": True}],
+        "bots": [
+            {
+                "username": "ClueBot NG",
+                "domain": "en.wikipedia.org",
+                "last_edit_at": last_edit_at,
+                "ok": ok,
+            }
+        ],
+        "alerts": [],
+    }
+
+
+def test_collect_status_holds_only_absolute_times(monkeypatch):
+    monkeypatch.setattr(status_page, "PROMETHEUS_URL", "http://prometheus:9090")
+    monkeypatch.setattr(status_page, "ALERTMANAGER_URL", "http://alertmanager:9093")
+
+    def refresh(now: float):
+        def upstream(request):
+            if request.url.host == "alertmanager":
+                return httpx.Response(200, json=[])
+            labels = {"username": "ClueBot NG", "domain": "en.wikipedia.org"}
+            if request.url.params["query"] == "probe_success":
+                labels, value = {"tool": "cluebotng", "instance": "cluebotng"}, "1"
+            else:
+                value = "1792353600"
+            return httpx.Response(
+                200,
+                json={"data": {"result": [{"metric": labels, "value": [now, value]}]}},
+            )
+
+        async def run():
+            async with httpx.AsyncClient(
+                transport=httpx.MockTransport(upstream)
+            ) as client:
+                return await status_page.collect_status(client)
+
+        status = asyncio.run(run())
+        return status, status_page.render_html(status).encode("utf-8")
+
+    first, first_html = refresh(1792353600 + 60)
+    second, second_html = refresh(1792353600 + 120)
+    # ClueBot NG may go an hour without editing
+    late, _ = refresh(1792353600 + 3601)
+
+    assert first == second == _status("2026-10-18T20:00:00+00:00")
+    assert first_html == second_html
+    assert late == _status("2026-10-18T20:00:00+00:00", ok=False)
+
+
+def test_etag_changes_with_the_body():
+    body = status_page.render_html(_status("2026-10-18T20:00:00+00:00")).encode()
+
+    assert status_page.body_etag(body) == status_page.body_etag(bytes(body))
+    assert status_page.body_etag(body) != status_page.body_etag(
+        status_page.render_html(_status("2026-10-18T20:00:00+00:00", ok=False)).encode()
+    )
+
+
+def test_if_none_match_is_compared_per_etag():
+    assert status_page.etag_matches('"a", "b"', '"b"')
+    assert status_page.etag_matches('W/"b"', '"b"')
+    assert status_page.etag_matches("*", '"b"')
+    assert not status_page.etag_matches('"ab"', '"b"')
+    assert not status_page.etag_matches('"a", W/"bc"', '"b"')
+    assert not status_page.etag_matches("", '"b"')
+
+
+def test_revalidation_after_refresh_is_not_modified():
+    def publish(status: dict) -> None:
+        body = status_page.render_html(status).encode("utf-8")
+        status_page.app.state.documents = {
+            "html": status_page.Document(
+                body, "text/html; charset=utf-8", status_page.body_etag(body)
+            )
+        }
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=status_page.app),
+            base_url="http://status-page",
+        ) as client:
+            publish(_status("2026-10-18T20:00:00+00:00"))
+            etag = (await client.get("/")).headers["etag"]
+
+            publish(_status("2026-10-18T20:00:00+00:00"))
+            r = await client.get("/", headers={"If-None-Match": f'"stale", {etag}'})
+            assert r.status_code == 304
+
+            publish(_status("2026-10-18T20:00:00+00:00", ok=False))
+            r = await client.get("/", headers={"If-None-Match": etag})
+            assert r.status_code == 200
+            assert r.headers["etag"] != etag
+
+    asyncio.run(run())
@@ -0,0 +1,20 @@
+from monitoring.supervisor import Supervisor
+
+
+class _Service:
+    def __init__(self, paths):
+        self.paths = paths
+
+    def watched_paths(self):
+        return self.paths
+
+
+def test_file_deleted_after_listing_counts_as_removed(tmp_path):
+    kept, deleted = tmp_path / "kept.yml", tmp_path / "deleted.yml"
+    kept.write_text("groups: []")
+
+    # deleted.yml was globbed, then removed before it was read
+    assert (
+        Supervisor(_Service([kept, deleted]))._hash_watched_paths()
+        == Supervisor(_Service([kept]))._hash_watched_paths()
+    )
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import pytest
+
+from monitoring.receivers.leases import LeaseManager
+from monitoring.receivers.update_queue import PageUpdate, QueueFull, UpdateQueue
+
+
+def _update(page: str, running: bool = True, **kwargs) -> PageUpdate:
+    return PageUpdate(host="en.wikipedia.org", page=page, running=running, **kwargs)
+
+
+def _claim(queue: UpdateQueue):
+    return asyncio.run(asyncio.wait_for(queue.claim(), 1))
+
+
+def test_entries_and_attempts_survive_a_restart(tmp_path):
+    queue = UpdateQueue(tmp_path)
+    queue.put(_update("User:ClueBot_NG/running", enqueued_at=100))
+    queue.put(_update("User:ClueBot_III/running"))
+    claimed, *_ = sorted(_claim(queue), key=lambda item: item.enqueued_at)
+    queue.retry(claimed, min_delay=60)
+
+    reopened = UpdateQueue(tmp_path)
+    items = {item.page: item for item in reopened.items()}
+    assert set(items) == {"User:ClueBot_NG/running", "User:ClueBot_III/running"}
+    assert items["User:ClueBot_NG/running"].attempts == 1
+    assert items["User:ClueBot_NG/running"].next_attempt_at >= time.time() + 59
+    assert items["User:ClueBot_III/running"].attempts == 0
+    assert reopened.stats()["oldest_age_seconds"] > time.time() - 101
+
+
+def test_newer_update_supersedes_keeping_the_enqueue_time(tmp_path):
+    queue = UpdateQueue(tmp_path, max_size=1)
+    first = _update("User:ClueBot_NG/running", enqueued_at=100)
+    queue.put(first)
+    queue.put(_update("User:ClueBot_NG/running", running=False))
+
+    (pending,) = UpdateQueue(tmp_path).items()
+    assert not pending.running and pending.enqueued_at == 100
+    with pytest.raises(QueueFull):
+        queue.put(_update("User:ClueBot_III/running"))
+
+    # Completing the superseded update keeps the newer one queued
+    queue.ack(first)
+    assert queue.pending(first).version == pending.version
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    queue = UpdateQueue(tmp_path, max_attempts=2, base_backoff=0)
+    queue.put(_update("User:ClueBot_NG/running"))
+    for _ in range(2):
+        (item,) = _claim(queue)
+        queue.retry(item)
+    assert queue.items() == []
+
+
+def test_claim_of_a_crashed_process_is_reclaimed(tmp_path):
+    crashed = UpdateQueue(tmp_path, leases=LeaseManager(tmp_path / "leases", ttl=0.01))
+    crashed.put(_update("User:ClueBot_NG/running"))
+    (item,) = _claim(crashed)
+
+    # Another process sees the lease until it expires
+    reopened = UpdateQueue(tmp_path)
+    assert not reopened.leases.acquire(item.key)
+    time.sleep(0.02)
+    (reclaimed,) = _claim(reopened)
+    assert reclaimed.version == item.version
+    assert reopened.leases.holds(item.key)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from monitoring.receivers import wiki_updater, wikipedia
+from monitoring.receivers.leases import LeaseManager
+from monitoring.receivers.state_store import AppliedStateStore
+from monitoring.receivers.update_queue import PageUpdate, UpdateQueue
+
+HOST, PAGE = "en.wikipedia.org", "User:ClueBot_NG/running"
+# Slowest acceptable /health response while the wiki is not answering
+HEALTH_LATENCY_BUDGET = 0.1
+
+
+@pytest.fixture
+def state(tmp_path):
+    wiki_updater.app.state.state_store = AppliedStateStore(tmp_path / "state.json")
+    wiki_updater.app.state.queue = UpdateQueue(
+        tmp_path / "queue", leases=LeaseManager(tmp_path / "leases")
+    )
+    return wiki_updater.app.state
+
+
+def _payload(status: str) -> wiki_updater.WebhookPayload:
+    return wiki_updater.WebhookPayload(
+        status=status,
+        alerts=[
+            wiki_updater.Alert(
+                status=status,
+                labels={"update_wiki_host": HOST, "update_wiki_page": PAGE},
+                annotations={"summary": "ClueBot NG has not edited for > 1 hour"},
+                fingerprint="f00",
+            )
+        ],
+    )
+
+
+def test_firing_again_replaces_pending_resolved_update(state):
+    # Firing was applied, the resolved update is backing off when it fires again
+    state.state_store.record(HOST, PAGE, "f00", False)
+    state.queue.put(
+        PageUpdate(
+            host=HOST,
+            page=PAGE,
+            running=True,
+            fingerprint="f00",
+            attempts=3,
+            next_attempt_at=time.time() + 900,
+        )
+    )
+
+    wiki_updater._queue_updates(_payload("firing"))
+
+    pending = state.queue.pending(PageUpdate(host=HOST, page=PAGE, running=False))
+    assert pending is not None
+    assert pending.running is False
+    assert pending.next_attempt_at == 0
+
+
+def test_repeated_notification_keeps_pending_update(state):
+    wiki_updater._queue_updates(_payload("firing"))
+    queued = state.queue.items()
+    wiki_updater._queue_updates(_payload("firing"))
+    assert state.queue.items() == queued
+
+
+def test_applied_state_is_deduplicated(state):
+    state.state_store.record(HOST, PAGE, "f00", False)
+    wiki_updater._queue_updates(_payload("firing"))
+    assert state.queue.items() == []
+
+
+def test_health_answers_while_wiki_is_blocked(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOOL_DATA_DIR", tmp_path.as_posix())
+
+    async def run():
+        requested, unblock = asyncio.Event(), asyncio.Event()
+
+        async def blocked_wiki(request: httpx.Request) -> httpx.Response:
+            requested.set()
+            await unblock.wait()
+            return httpx.Response(503)
+
+        wikipedia.set_transport(httpx.MockTransport(blocked_wiki))
+        try:
+            async with wiki_updater._lifespan(wiki_updater.app):
+                async with httpx.AsyncClient(
+                    transport=httpx.ASGITransport(app=wiki_updater.app),
+                    base_url="http://wiki-updater",
+                ) as client:
+                    r = await client.post(
+                        "/alertmanager", json=_payload("firing").model_dump()
+                    )
+                    assert r.status_code == 202
+                    await asyncio.wait_for(requested.wait(), 5)
+
+                    latencies = []
+                    for _ in range(20):
+                        started = time.monotonic()
+                        r = await client.get("/health")
+                        latencies.append(time.monotonic() - started)
+                        assert r.status_code == 200
+                    # The edit is still in flight
+                    assert not unblock.is_set()
+                    return max(latencies)
+        finally:
+            wikipedia.set_transport(None)
+
+    assert asyncio.run(run()) < HEALTH_LATENCY_BUDGET
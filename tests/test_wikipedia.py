@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+
+from monitoring.receivers import wikipedia
+
+HOST = "en.wikipedia.org"
+
+
+def test_refreshed_session_cookie_survives_a_restart(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOOL_DATA_DIR", tmp_path.as_posix())
+    sent = []
+
+    def wiki(request):
+        sent.append(request.headers.get("cookie"))
+        # MediaWiki renews the session on ordinary API requests, not only on login
+        return httpx.Response(
+            200,
+            json={"query": {}},
+            headers={
+                "Set-Cookie": "enwikiSession=renewed; Domain=en.wikipedia.org; "
+                "Path=/; Max-Age=86400; HttpOnly"
+            },
+        )
+
+    async def run():
+        session = wikipedia.WikiSession(HOST, None, None)
+        await session.get(f"https://{HOST}/w/api.php", params={"action": "query"})
+        # Saved straight away, a crash before shutdown keeps it too
+        saved = (
+            tmp_path / "persistent-data/wiki-updater" / f"{HOST}.cookies"
+        ).read_text()
+        await session.close()
+
+        restarted = wikipedia.WikiSession(HOST, None, None)
+        await restarted.get(f"https://{HOST}/w/api.php", params={"action": "query"})
+        await restarted.close()
+        return saved
+
+    wikipedia.set_transport(httpx.MockTransport(wiki))
+    try:
+        saved = asyncio.run(run())
+    finally:
+        wikipedia.set_transport(None)
+
+    assert "enwikiSession" in saved
+    assert sent == [None, "enwikiSession=renewed"]